@@ -1,20 +1,32 @@
 """
 Offers API routes.
-Handles CSV uploads and offer retrieval.
+Handles CSV, Parquet and Arrow uploads and offer retrieval.
 """
 
-import csv
-import io
-import json
+import asyncio
+import uuid
 from fastapi import APIRouter, File, UploadFile, HTTPException, Query
 from fastapi.responses import JSONResponse
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from bson.objectid import ObjectId
 
-from app.models.offer import Offer, OfferCreate
-from app.services.db import get_db
+from app.models.offer import Offer
+from app.services.db import (
+    get_db, new_import_batch_id, OFFER_SET_BUILD_LEASE_SECONDS, INGEST_CLAIM_LEASE_SECONDS
+)
 from app.services.storage import get_storage_service
+from app.services.ingest import (
+    ingest_csv_stream, ingest_csv_columnar, ingest_parquet, ingest_arrow_ipc,
+    columnar_available
+)
+from app.services.executor import get_executor_service
+from app.services.search import get_search_service
+from app.services.hashing import (
+    file_sha256, offer_content_hash, template_hash, branding_hash, label_hash,
+    encode_sync_token, decode_sync_token
+)
+from app.config.branding import get_brand_config
 
 
 def serialize_for_json(obj):
@@ -31,186 +43,452 @@ def serialize_for_json(obj):
 
 router = APIRouter(prefix="/offers", tags=["offers"])
 
+# Background offer-set builds, referenced until they finish
+_offer_set_builds: set = set()
+
+# Entries of long lists (errors, duplicates) kept on stored ingest results
+STORED_RESULT_LIST_LIMIT = 100
+
+# How long a repeated upload waits for an identical in-flight upload
+INGEST_REPLAY_WAIT_SECONDS = 120
+INGEST_REPLAY_POLL_SECONDS = 0.5
+
+
+async def _store_db(store_id: Optional[str]):
+    """Database service scoped to a store_id query parameter (400 if invalid)"""
+    db = await get_db()
+    try:
+        return db.for_store(store_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _ingest_upload(file: UploadFile, ingest, mode: str, label: str,
+                         store_id: Optional[str] = None, **extra):
+    """
+    Run an ingest function over an upload, keep a copy of the file and build
+    the upload response.
+
+    The upload is fingerprinted first; a file identical to one already
+    ingested into the active collection with the same mode returns the
+    earlier response without being parsed or stored again. While an
+    identical upload is still running this waits for it, and takes over its
+    claim if it stopped heartbeating.
+
+    Args:
+        file: Uploaded file
+        ingest: Ingest coroutine function (fileobj, db, mode=...) -> IngestResult
+        mode: "insert" or "upsert"
+        label: File kind used in messages (e.g. "CSV")
+        store_id: Store the offers belong to (None = default store)
+        **extra: Additional response fields
+    """
+    db = await _store_db(store_id)
+    try:
+        # One collection for the whole upload, even if a set is activated meanwhile
+        db = await db.pin_offer_set()
+        # Hash the spooled upload off the event loop
+        file.file.seek(0)
+        file_hash = await get_executor_service().run_in_thread(file_sha256, file.file)
+        key = await db.ingest_key(file_hash, mode)
+        owner = uuid.uuid4().hex
+        existing = await _claim_ingest(
+            db, key, {"file_hash": file_hash, "filename": file.filename, "mode": mode}, owner
+        )
+        if existing is not None:
+            return _replay_ingest(existing)
+
+        import_batch = new_import_batch_id()
+        heartbeat = asyncio.create_task(_heartbeat_ingest_claim(db, key, owner))
+        try:
+            response_data = await _run_ingest(
+                db.for_import_batch(import_batch), file, ingest, mode, label,
+                import_batch=import_batch, store_id=db.store_id, **extra
+            )
+        except BaseException:
+            await db.release_ingest(key, owner)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        response_data["file_hash"] = file_hash
+        await db.complete_ingest(key, {
+            **response_data,
+            "duplicates": response_data["duplicates"][:STORED_RESULT_LIST_LIMIT]
+        })
+        return JSONResponse(content=response_data)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        print(f"✗ {label} upload error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error processing {label}: {str(e)}")
+
+
+async def _run_ingest(db, file: UploadFile, ingest, mode: str, label: str, **extra) -> dict:
+    """Parse the upload, write offers in batches and save a copy of the file"""
+    # Parse the upload incrementally and write offers in batches
+    file.file.seek(0)
+    try:
+        result = await ingest(file.file, db, mode=mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result.total_rows == 0:
+        detail = f"No valid offers in {label}"
+        if result.errors:
+            first = result.errors[0]
+            detail += f" ({result.skipped_rows} invalid rows; row {first['row']}: {first['message']})"
+        raise HTTPException(status_code=400, detail=detail)
+
+    # Save file to storage
+    storage = get_storage_service()
+    file.file.seek(0)
+    await storage.save_csv_stream(file.file, file.filename or f"offers.{label.lower()}")
+
+    # Return preview (first 5 offers) - convert all non-JSON types
+    preview = [serialize_for_json(offer) for offer in result.preview]
+
+    return serialize_for_json({
+        "status": "success",
+        "mode": mode,
+        **extra,
+        "inserted_count": result.inserted_count,
+        "updated_count": result.updated_count,
+        "unchanged_count": result.unchanged_count,
+        "total_rows": result.total_rows,
+        "skipped_rows": result.skipped_rows,
+        "failed_count": result.failed_count,
+        "preview": preview,
+        "duplicates": result.duplicates,
+        "errors": result.errors,
+        "write_errors": result.write_errors
+    })
+
+
+async def _claim_ingest(db, key: str, info: dict, owner: str) -> Optional[dict]:
+    """
+    Claim an upload, waiting while an identical upload is being ingested.
+
+    Returns:
+        None once this request holds the claim (new, released by a failed
+        attempt, or taken over from a stale one), else the finished record
+    """
+    waited = 0.0
+    while True:
+        record = await db.claim_ingest(key, info, owner)
+        if record is None or record.get("status") == "done":
+            return record
+        if waited >= INGEST_REPLAY_WAIT_SECONDS:
+            raise HTTPException(status_code=409, detail="An identical upload is still being processed")
+        await asyncio.sleep(INGEST_REPLAY_POLL_SECONDS)
+        waited += INGEST_REPLAY_POLL_SECONDS
+
+
+async def _heartbeat_ingest_claim(db, key: str, owner: str):
+    """Keep an upload's claim fresh while it is ingested"""
+    interval = max(1.0, INGEST_CLAIM_LEASE_SECONDS / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await db.renew_ingest_claim(key, owner):
+                print(f"⚠ Lost ingest claim {key}")
+                return
+        except Exception as e:
+            print(f"⚠ Ingest claim heartbeat warning: {e}")
+
+
+def _replay_ingest(record: dict) -> JSONResponse:
+    """Return the stored response of an identical upload"""
+    print(f"✓ Identical upload already ingested ({record.get('filename')}); returning earlier result")
+    return JSONResponse(content={**record["result"], "replayed": True})
+
+
+def _require_pyarrow(label: str):
+    """Reject Arrow/Parquet uploads when pyarrow is not installed"""
+    if not columnar_available():
+        raise HTTPException(status_code=501, detail=f"{label} import requires pyarrow")
+
 
 @router.post("/upload-csv")
-async def upload_csv(file: UploadFile = File(...)):
+async def upload_csv(
+    file: UploadFile = File(...),
+    mode: str = Query("insert", pattern="^(insert|upsert)$"),
+    engine: str = Query("stream", pattern="^(stream|columnar)$"),
+    store_id: str = Query(None)
+):
     """
     Upload and parse CSV file containing offers.
 
     Expected CSV columns:
     product_id, product_name, brand, offer_type, offer_details, price, mrp, valid_till
 
-    Returns: { inserted_count: int, preview: list[Offer] }
+    The file is parsed as a stream and offers are written to MongoDB in
+    fixed-size batches while parsing continues.
+
+    Query Parameters:
+    - mode: "insert" (default) rejects existing product_ids as duplicates;
+      "upsert" updates offers whose content changed and skips unchanged ones
+    - engine: "stream" (default) parses row by row; "columnar" parses with
+      pyarrow into typed columns (falls back to "stream" if pyarrow is missing)
+    - store_id: Store the offers belong to (default: the default store);
+      product_ids are unique per store, so stores can price a SKU differently
+
+    Rows that fail validation are skipped and reported in `errors` as
+    { row, field, message }, where row is the CSV row number (header is row 1).
+
+    Returns: { import_batch: str, store_id: str | null, inserted_count: int, updated_count: int, unchanged_count: int, preview: list[Offer], errors: list }
+    """
+    if engine == "columnar" and not columnar_available():
+        print("⚠ pyarrow not installed, using the streaming CSV engine")
+        engine = "stream"
+    ingest = ingest_csv_columnar if engine == "columnar" else ingest_csv_stream
+    return await _ingest_upload(file, ingest, mode, "CSV", store_id=store_id, engine=engine)
+
+
+@router.post("/upload-parquet")
+async def upload_parquet(
+    file: UploadFile = File(...),
+    mode: str = Query("insert", pattern="^(insert|upsert)$"),
+    store_id: str = Query(None)
+):
+    """
+    Upload a Parquet file containing offers.
+
+    Columns are matched with the same header names as upload-csv. Typed
+    columns are used directly, so numeric price/mrp columns are not parsed
+    from text.
+
+    Query Parameters:
+    - mode: "insert" (default) or "upsert" (see upload-csv)
+    - store_id: Store the offers belong to (see upload-csv)
+
+    Returns: same shape as upload-csv; error rows are numbered from 1
     """
+    _require_pyarrow("Parquet")
+    return await _ingest_upload(file, ingest_parquet, mode, "Parquet", store_id=store_id)
+
+
+@router.post("/upload-arrow")
+async def upload_arrow(
+    file: UploadFile = File(...),
+    mode: str = Query("insert", pattern="^(insert|upsert)$"),
+    store_id: str = Query(None)
+):
+    """
+    Upload an Arrow IPC file (.arrow / .feather v2) or IPC stream containing offers.
+
+    Columns are matched with the same header names as upload-csv.
+
+    Query Parameters:
+    - mode: "insert" (default) or "upsert" (see upload-csv)
+    - store_id: Store the offers belong to (see upload-csv)
+
+    Returns: same shape as upload-csv; error rows are numbered from 1
+    """
+    _require_pyarrow("Arrow")
+    return await _ingest_upload(file, ingest_arrow_ipc, mode, "Arrow", store_id=store_id)
+
+
+async def _heartbeat_offer_set_build(db, set_id: str, build: asyncio.Task):
+    """Keep a build's lease alive; cancel the build if the set was marked stale meanwhile"""
+    interval = max(1.0, OFFER_SET_BUILD_LEASE_SECONDS / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            alive = await db.renew_offer_set_build(set_id)
+        except Exception as e:
+            print(f"⚠ Offer set {set_id} heartbeat warning: {e}")
+            continue
+        if not alive:
+            print(f"⚠ Offer set {set_id} is no longer building; stopping its build")
+            build.cancel()
+            return
+
+
+async def _build_offer_set(set_id: str, path: str, ingest, mode: str, activate: bool):
+    """Ingest a saved upload into an offer set, then activate it (or mark it failed)"""
+    db = await get_db()
+    heartbeat = asyncio.create_task(_heartbeat_offer_set_build(db, set_id, asyncio.current_task()))
     try:
-        # Read and parse CSV
-        content = await file.read()
-        csv_text = content.decode("utf-8")
-        csv_reader = csv.DictReader(io.StringIO(csv_text))
-
-        if not csv_reader.fieldnames:
-            raise HTTPException(status_code=400, detail="Invalid CSV format")
-
-        # Helper: normalize header names to a canonical key
-        def normalize_key(k: str):
-            return (k or '').strip().lower().replace('-', ' ').replace('_', ' ')
-
-        # Mapping of possible header names to our internal field names
-        header_map = {
-            'product id': 'product_id',
-            'id': 'product_id',
-            'sku': 'product_id',
-            'product_id': 'product_id',
-
-            'product name': 'product_name',
-            'productname': 'product_name',
-            'item name': 'product_name',
-            'itemname': 'product_name',
-            'name': 'product_name',
-
-            'brand': 'brand',
-
-            'offer type': 'offer_type',
-            'offertype': 'offer_type',
-            'offer': 'offer_type',
-
-            'offer details': 'offer_details',
-            'offer_details': 'offer_details',
-            'details': 'offer_details',
-            'savings': 'offer_details',
-
-            'price': 'price',
-            'rapsap price': 'price',
-            'sale price': 'price',
-
-            'mrp': 'mrp',
-
-            'valid till': 'valid_till',
-            'valid_till': 'valid_till',
-            'expiry': 'valid_till',
-            'expiry date': 'valid_till'
-        }
+        with open(path, "rb") as f:
+            result = await ingest(f, db.for_offer_set(set_id).for_import_batch(set_id), mode=mode)
+        if result.total_rows == 0:
+            raise ValueError("No valid offers in file")
+        stats = result.to_dict()
+        stats.pop("preview", None)
+        stats["duplicates"] = stats["duplicates"][:STORED_RESULT_LIST_LIMIT]
+        await db.complete_offer_set(set_id, serialize_for_json(stats), activate=activate)
+        print(f"✓ Offer set {set_id} built: {result.total_rows} rows")
+    except Exception as e:
+        print(f"✗ Offer set {set_id} build failed: {e}")
+        await db.fail_offer_set(set_id, str(e))
+    finally:
+        heartbeat.cancel()
+
+
+@router.post("/sets", status_code=202)
+async def upload_offer_set(
+    file: UploadFile = File(...),
+    file_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
+    mode: str = Query("insert", pattern="^(insert|upsert)$"),
+    engine: str = Query("stream", pattern="^(stream|columnar)$"),
+    activate: bool = Query(True)
+):
+    """
+    Upload a complete catalog as a new offer set version.
 
-        # Build normalized header lookup for each CSV column
-        normalized_headers = {}
-        for h in csv_reader.fieldnames:
-            nk = normalize_key(h)
-            normalized_headers[h] = header_map.get(nk)
-
-        # Simple slug generator for missing product_id
-        def slugify(text: str):
-            if not text:
-                return ''
-            s = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in text)
-            s = '-'.join(s.lower().split())
-            return s[:60]
-
-        # Parse offers
-        offers = []
-        auto_idx = 1
-        for row in csv_reader:
-            try:
-                mapped = {}
-                custom = {}
-                # Map known headers
-                for raw_h, value in row.items():
-                    val = (value or '').strip()
-                    target = normalized_headers.get(raw_h)
-                    if target:
-                        mapped[target] = val
-                    else:
-                        # Keep leftover columns in custom_fields using their raw header
-                        if val != '':
-                            custom[raw_h.strip()] = val
-
-                # Ensure required fields exist; generate product_id if missing
-                product_name = mapped.get('product_name') or custom.get('Item Name') or ''
-                product_id = mapped.get('product_id') or custom.get('product_id') or slugify(product_name) or f'auto-{auto_idx}'
-                if product_id.startswith('auto-'):
-                    auto_idx += 1
-
-                # Parse numeric fields safely
-                def to_float(x):
-                    try:
-                        return float(str(x).replace(',', '').strip()) if str(x).strip() != '' else 0.0
-                    except:
-                        return 0.0
-
-                price = to_float(mapped.get('price') or custom.get('Rapsap Price') or mapped.get('rapsap price'))
-                mrp = to_float(mapped.get('mrp') or custom.get('MRP') or mapped.get('MRP'))
-
-                offer = {
-                    'product_id': product_id,
-                    'product_name': mapped.get('product_name') or product_name or product_id,
-                    'brand': mapped.get('brand') or custom.get('Brand') or '',
-                    'offer_type': mapped.get('offer_type') or '',
-                    'offer_details': mapped.get('offer_details') or custom.get('Savings') or '',
-                    'price': price,
-                    'mrp': mrp,
-                    'valid_till': mapped.get('valid_till') or '',
-                    'custom_fields': custom,
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-
-                # Validate with Pydantic model
-                OfferCreate(**offer)
-                offers.append(offer)
-            except Exception as e:
-                print(f"⚠ Skipping invalid row: {e}")
-                continue
-        
-        if not offers:
-            raise HTTPException(status_code=400, detail="No valid offers in CSV")
+    The set is built in the background in its own collection while the
+    current set keeps serving reads. When the build completes the active set
+    is switched in one atomic update (unless activate=false) and retired
+    sets beyond the retention limit are dropped whole. A set holds the
+    catalog of every store, so it is not scoped by store_id.
 
-        # Save to database
-        db = await get_db()
-        inserted_result = await db.save_offers_bulk(offers)
-        # inserted_result is a dict: { inserted_count: int, duplicates: list }
-        inserted_count = int(inserted_result.get("inserted_count", 0))
-        duplicates = inserted_result.get("duplicates", [])
+    Query Parameters:
+    - format: "csv" (default), "parquet" or "arrow"
+    - mode: "insert" (default) or "upsert" (duplicate rows: last one wins)
+    - engine: CSV engine, "stream" (default) or "columnar"
+    - activate: Switch to the set once built (default: true)
+
+    Returns: { set_id, status: "building" }; poll GET /offers/sets/{set_id}
+    """
+    if file_format in ("parquet", "arrow"):
+        _require_pyarrow(file_format.capitalize())
+    if file_format == "csv" and engine == "columnar" and not columnar_available():
+        engine = "stream"
+    ingest = {
+        "parquet": ingest_parquet,
+        "arrow": ingest_arrow_ipc,
+        "csv": ingest_csv_columnar if engine == "columnar" else ingest_csv_stream,
+    }[file_format]
 
-        # Save file to storage
+    try:
+        # Keep the upload on disk; the request's temp file is gone once we respond
         storage = get_storage_service()
-        await storage.save_csv_file(content, file.filename or "offers.csv")
+        file.file.seek(0)
+        path = await storage.save_csv_stream(file.file, file.filename or f"offers.{file_format}")
 
-        # Return preview (first 5 offers) - convert all non-JSON types
-        preview = [serialize_for_json(offer) for offer in offers[:5]]
+        db = await get_db()
+        set_id = await db.create_offer_set(source=file.filename, mode=mode)
+        task = asyncio.create_task(_build_offer_set(set_id, path, ingest, mode, activate))
+        _offer_set_builds.add(task)
+        task.add_done_callback(_offer_set_builds.discard)
+
+        return JSONResponse(status_code=202, content={
+            "status": "accepted",
+            "set_id": set_id,
+            "set_status": "building"
+        })
+    except Exception as e:
+        print(f"✗ Offer set upload error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error creating offer set: {str(e)}")
 
-        response_data = {
-            "status": "success",
-            "inserted_count": inserted_count,
-            "total_rows": len(offers),
-            "preview": preview,
-            "duplicates": duplicates
-        }
 
-        return JSONResponse(content=serialize_for_json(response_data))
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        print(f"✗ CSV upload error: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+@router.get("/sets")
+async def list_offer_sets():
+    """
+    List offer set versions, newest first.
+
+    Returns: { active_set_id: str, sets: list }
+    """
+    db = await get_db()
+    await db.fail_stale_offer_sets()
+    return JSONResponse(content=serialize_for_json({
+        "status": "success",
+        "active_set_id": await db.get_active_offer_set_id(),
+        "sets": await db.list_offer_sets()
+    }))
+
+
+@router.get("/sets/{set_id}")
+async def get_offer_set(set_id: str):
+    """Get an offer set's build status and stats"""
+    db = await get_db()
+    await db.fail_stale_offer_sets()
+    offer_set = await db.get_offer_set(set_id)
+    if not offer_set:
+        raise HTTPException(status_code=404, detail="Offer set not found")
+    return JSONResponse(content=serialize_for_json({"status": "success", "set": offer_set}))
+
+
+@router.post("/sets/{set_id}/activate")
+async def activate_offer_set(set_id: str):
+    """Make a ready or retired offer set active (e.g. to roll back)"""
+    db = await get_db()
+    try:
+        await db.activate_offer_set(set_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "active_set_id": set_id}
+
+
+@router.delete("/sets/{set_id}")
+async def delete_offer_set(set_id: str):
+    """Drop an inactive offer set in one operation"""
+    db = await get_db()
+    if not await db.get_offer_set(set_id):
+        raise HTTPException(status_code=404, detail="Offer set not found")
+    try:
+        await db.drop_offer_set(set_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "dropped": set_id}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated fields= parameter (400 on unusable names)"""
+    if not fields:
+        return None
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    for field in field_list:
+        if field.startswith(("$", ".")) or ".." in field or field.endswith("."):
+            raise HTTPException(status_code=400, detail=f"Invalid field: {field}")
+    return field_list or None
 
 
 @router.get("/")
-async def get_offers(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100)):
+async def get_offers(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: str = Query(None),
+    fields: str = Query(None),
+    store_id: str = Query(None)
+):
     """
-    Retrieve paginated list of offers.
+    Retrieve paginated list of offers, ordered by id.
     
     Query Parameters:
-    - skip: Number of offers to skip (default: 0)
+    - skip: Number of offers to skip (default: 0, ignored with cursor)
     - limit: Number of offers to return (default: 50, max: 100)
+    - cursor: next_cursor from the previous page (keyset pagination;
+      stays fast on deep pages where skip has to walk every earlier offer)
+    - fields: Comma-separated fields to return, e.g. product_name,price or
+      custom_fields.size (default: all; id is always included)
+    - store_id: List this store's offers (default: the default store)
     
-    Returns: { offers: list[Offer], total: int }
+    total is the store's cached offer count and may briefly lag
+    concurrent writes.
+    
+    Returns: { offers: list[Offer], total: int, next_cursor: str | null, has_more: bool }
     """
+    after_id = None
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after_id = ObjectId(cursor)
+    field_list = parse_fields(fields)
+    db = await _store_db(store_id)
+
     try:
-        db = await get_db()
-        offers = await db.get_offers(skip=skip, limit=limit)
-        total = await db.count_offers()
+        # Fetch one extra offer to learn whether another page exists
+        offers = await db.get_offers(
+            skip=skip, limit=limit + 1, after_id=after_id, fields=field_list
+        )
+        has_more = len(offers) > limit
+        offers = offers[:limit]
+        total = await db.count_offers_cached()
         
         # Convert ObjectId to string and remove _id field
         for offer in offers:
@@ -222,8 +500,10 @@ async def get_offers(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le
             "status": "success",
             "offers": offers,
             "total": total,
-            "skip": skip,
-            "limit": limit
+            "skip": 0 if cursor else skip,
+            "limit": limit,
+            "next_cursor": offers[-1].get("id") if has_more and offers else None,
+            "has_more": has_more
         }
         
         return JSONResponse(content=serialize_for_json(response_data))
@@ -233,18 +513,174 @@ async def get_offers(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le
         raise HTTPException(status_code=500, detail="Error fetching offers")
 
 
+@router.get("/changes")
+async def get_changed_offers(
+    template_id: str = Query(...),
+    since: str = Query(None),
+    branding: str = Query(None),
+    limit: int = Query(500, ge=1, le=5000),
+    store_id: str = Query(None)
+):
+    """
+    Retrieve labels whose rendered output changed since a sync token.
+    
+    Query Parameters:
+    - template_id: Template the labels are rendered with
+    - since: Token from a previous response (omit for a full sync)
+    - branding: Brand id from /branding (optional)
+    - limit: Maximum labels to return (default: 500, max: 5000)
+    - store_id: Sync this store's labels (default: the default store)
+    
+    Offers removed since the token (archiving) are listed in `removed`;
+    apply both lists in sync_seq order. If the template or branding changed
+    since the token was issued, the catalog was cleared or a different one
+    activated (clear-all, offer set switch), or the token predates the
+    tombstones still kept, every label is reported again (full_resync = true)
+    and the client should drop labels it is not sent.
+    Tokens only advance up to the committed watermark, so offers still being
+    written by a slower import are reported on a later call.
+    
+    Returns: { offers: list[Offer + label_hash], removed: list[{ product_id, sync_seq }],
+               next_token: str, has_more: bool }
+    """
+    db = await _store_db(store_id)
+    try:
+        template = await db.find_template(template_id)
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+
+        tmpl_hash = template_hash(template)
+        brand_hash = branding_hash(get_brand_config(branding) if branding else None)
+        collection_name = (await db.offers_collection()).name
+        # Epoch before watermark: a clear racing this call forces a resync next time
+        epoch = await db.offers_removed_epoch()
+        watermark = await db.sync_watermark()
+
+        seq = 0
+        full_resync = True
+        if since:
+            try:
+                token = decode_sync_token(since)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if (token["template_hash"] == tmpl_hash and token["branding_hash"] == brand_hash
+                    and token["collection"] == collection_name and token["epoch"] == epoch):
+                seq = token["seq"]
+                full_resync = False
+
+        offers = await db.get_offers_changed_since(seq, limit=limit, until=watermark)
+        removed = [] if full_resync else await db.get_offers_removed_since(seq, limit=limit, until=watermark)
+        # Read after the tombstones: pruning records its range before deleting
+        if not full_resync and seq < await db.tombstones_pruned_seq():
+            seq, full_resync, removed = 0, True, []
+            offers = await db.get_offers_changed_since(seq, limit=limit, until=watermark)
+
+        # A full list ends the page at its last entry; entries of the other
+        # list beyond that point belong to the next page
+        bounds = [page[-1]["sync_seq"] for page in (offers, removed) if len(page) == limit]
+        has_more = bool(bounds)
+        # A short page covered everything committed up to the watermark
+        last_seq = min(bounds) if has_more else max(seq, watermark)
+        offers = [offer for offer in offers if offer.get("sync_seq", 0) <= last_seq]
+        # An offer written again after its removal is sent as a change only
+        current = {offer.get("product_id") for offer in offers}
+        removed = [entry for entry in removed
+                   if entry["sync_seq"] <= last_seq and entry["product_id"] not in current]
+
+        for offer in offers:
+            if "_id" in offer:
+                offer["id"] = str(offer["_id"])
+                del offer["_id"]
+            content = offer.get("content_hash") or offer_content_hash(offer)
+            offer["label_hash"] = label_hash(content, tmpl_hash, brand_hash)
+
+        response_data = {
+            "status": "success",
+            "offers": offers,
+            "removed": removed,
+            "count": len(offers),
+            "full_resync": full_resync,
+            "has_more": has_more,
+            "next_token": encode_sync_token(last_seq, tmpl_hash, brand_hash, collection_name, epoch)
+        }
+
+        return JSONResponse(content=serialize_for_json(response_data))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error fetching changed offers: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching changed offers")
+
+
+@router.get("/search")
+async def search_offers(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    fields: str = Query(None),
+    store_id: str = Query(None)
+):
+    """
+    Find offers by product_id, product_name or brand.
+    
+    Backed by an in-process trigram index that is built on first use and
+    picks up newly ingested offers within AOPS_SEARCH_REFRESH_SECONDS.
+    
+    Query Parameters:
+    - q: Search words; each must match the start (or, from 3 letters on,
+      the inside) of a word. Close misspellings are suggested when nothing
+      matches exactly
+    - limit: Number of offers to return (default: 20, max: 100)
+    - fields: Load these offer fields for the results, as in GET /offers/
+      (default: only id, product_id, product_name, brand)
+    - store_id: Search this store's offers (default: the default store)
+    
+    Returns: { offers: list[{ id, product_id, product_name, brand, score }], count: int, elapsed_ms: float }
+    """
+    field_list = parse_fields(fields)
+    db = await _store_db(store_id)
+    try:
+        result = await get_search_service().search(db, q, limit)
+        offers = result["offers"]
+
+        if field_list and offers:
+            # Fetch the requested fields and keep the ranking order
+            docs = await db.get_offers_by_ids([o["id"] for o in offers], fields=field_list)
+            by_id = {str(doc.pop("_id")): doc for doc in docs}
+            offers = [{**by_id[o["id"]], "id": o["id"], "score": o["score"]}
+                      for o in offers if o["id"] in by_id]
+
+        return JSONResponse(content=serialize_for_json({
+            "status": "success",
+            "query": q,
+            "offers": offers,
+            "count": len(offers),
+            "indexed": result["indexed"],
+            "elapsed_ms": result["elapsed_ms"]
+        }))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error searching offers: {e}")
+        raise HTTPException(status_code=500, detail="Error searching offers")
+
+
 @router.get("/{offer_id}")
-async def get_offer(offer_id: str):
+async def get_offer(offer_id: str, store_id: str = Query(None)):
     """
     Retrieve a single offer by ID.
     
     Path Parameters:
     - offer_id: MongoDB ObjectId as string
     
+    Query Parameters:
+    - store_id: Store the offer belongs to (default: the default store)
+    
     Returns: Offer
     """
+    db = await _store_db(store_id)
     try:
-        db = await get_db()
         offer = await db.get_offer_by_id(offer_id)
         
         if not offer:
@@ -268,36 +704,66 @@ async def get_offer(offer_id: str):
         raise HTTPException(status_code=500, detail="Error fetching offer")
 
 
+@router.post("/archive-expired")
+async def archive_expired_offers(before: str = Query(None), store_id: str = Query(None)):
+    """
+    Move expired offers to the offers_archive collection now.
+    
+    The API also does this on a schedule (AOPS_OFFER_ARCHIVE_INTERVAL_SECONDS).
+    
+    Query Parameters:
+    - before: Archive offers whose valid_till date is before this YYYY-MM-DD
+      (default: today, minus AOPS_OFFER_ARCHIVE_GRACE_DAYS)
+    - store_id: Only archive this store's offers (default: every store)
+    
+    Returns: { archived_count: int, cutoff: str, elapsed_seconds: float }
+    """
+    cutoff = None
+    if before:
+        try:
+            cutoff = datetime.strptime(before, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="before must be a date in YYYY-MM-DD format")
+    db = await _store_db(store_id) if store_id else await get_db()
+    try:
+        result = await db.archive_expired_offers(cutoff)
+        return JSONResponse(content=serialize_for_json({"status": "success", **result}))
+    except Exception as e:
+        print(f"✗ Error archiving offers: {e}")
+        raise HTTPException(status_code=500, detail="Error archiving offers")
+
+
 @router.post("/clear-all")
-async def clear_all_offers():
+async def clear_all_offers(store_id: str = Query(None)):
     """
     Delete all offers from the database.
     WARNING: This action cannot be undone.
+
+    The offers collection is dropped and recreated with its indexes rather
+    than deleted document by document.
+    
+    Query Parameters:
+    - store_id: Only delete this store's offers (default: every store)
     
-    Returns: { deleted_count: int }
+    Returns: { deleted_count: int, elapsed_seconds: float }
     """
+    db = await _store_db(store_id) if store_id else await get_db()
     try:
-        db = await get_db()
+        result = await db.reset_offers()
         
-        # Count before deletion
-        count_before = await db.count_offers()
-        
-        if count_before == 0:
+        if result["deleted_count"] == 0:
             return JSONResponse(content={
                 "status": "success",
                 "message": "Database is already empty",
-                "deleted_count": 0
+                **result
             })
         
-        # Delete all offers
-        result = await db.delete_all_offers()
-        
-        print(f"✓ Cleared {result} offers from database")
+        print(f"✓ Cleared {result['deleted_count']} offers from database")
         
         return JSONResponse(content={
             "status": "success",
             "message": f"Successfully deleted all offers",
-            "deleted_count": result
+            **result
         })
         
     except Exception as e:
@@ -3,24 +3,47 @@ PDF Generation API routes.
 Handles PDF generation and rendering.
 """
 
+import asyncio
 from fastapi import APIRouter, HTTPException, Body, Request
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from datetime import datetime
 
 from app.services.db import get_db
 from app.services.pdfgen import get_pdf_service
-from app.services.storage import get_storage_service
+from app.services.analysis import template_offer_fields
+from app.services.selection import resolve_offers, build_offer_filter, load_template_offers
 
 router = APIRouter(prefix="/pdf", tags=["pdf"])
 
 
+async def _store_db(store_id: Optional[str]):
+    """Database service scoped to a store_id body field (400 if invalid)"""
+    db = await get_db()
+    try:
+        return db.for_store(store_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _iter_grid_file(stream):
+    """Yield a GridFS file chunk by chunk"""
+    while True:
+        chunk = await stream.readchunk()
+        if not chunk:
+            break
+        yield chunk
+
+
 @router.post("/generate")
 async def generate_pdf(
     request: Request,
-    offer_ids: List[str] = Body(..., embed=False),
+    offer_ids: List[str] = Body(default=None),
+    selection: dict = Body(default=None),
     template_id: str = Body(...),
     layout_options: dict = Body(default=None),
-    branding: dict = Body(default=None)
+    branding: dict = Body(default=None),
+    store_id: str = Body(default=None)
 ):
     """
     Generate PDF with selected offers using specified template.
@@ -36,34 +59,32 @@ async def generate_pdf(
         }
     }
     
+    Instead of offer_ids, a selection can pick offers on the server:
+        "selection": {
+            "brand": ["Amul", "Britannia"],     // value or list
+            "offer_type": "Discount",
+            "min_discount_pct": 10,             // or min_discount (mrp - price)
+            "valid_on": "today",                // or YYYY-MM-DD; also expires_before
+            "import_batch": "20251118160014-3fa2c1",
+            "custom_fields": { "aisle": "A4" }
+        }
+    
+    "store_id" picks the store whose offers are printed (default: the
+    default store); offer_ids and selections only match that store's offers.
+    
     Returns: { pdf_url: str, file_path: str, file_size: int }
     """
     try:
         # Validate input
-        if not offer_ids:
+        if not offer_ids and not selection:
             raise HTTPException(status_code=400, detail="No offers selected")
         
         if not template_id:
             raise HTTPException(status_code=400, detail="Template ID required")
         
-        # Fetch offers from database
-        db = await get_db()
-        offers = await db.get_offers_by_ids(offer_ids)
-        
-        if not offers:
-            raise HTTPException(status_code=404, detail="No offers found")
-        
-        # Fetch template (try ObjectId lookup, then fallback to string `id` field)
-        template = await db.get_template_by_id(template_id)
-        if not template:
-            try:
-                # Fallback lookup in case templates were stored with a string 'id' field
-                tmpl = await db.db.templates.find_one({"id": template_id})
-                if tmpl:
-                    template = tmpl
-            except Exception as _:
-                template = None
-
+        # Fetch template (by ObjectId or string `id` field, in one query)
+        db = await _store_db(store_id)
+        template = await db.find_template(template_id)
         if not template:
             raise HTTPException(status_code=404, detail="Template not found")
         
@@ -80,21 +101,19 @@ async def generate_pdf(
             possible = layout_options.get("branding")
             if possible and isinstance(possible, dict):
                 branding = possible
-        # Get template HTML content
-        template_html = template.get("html_content")
-        if not template_html and template.get("file_path"):
-            # Try to read from file path
-            storage = get_storage_service()
-            try:
-                template_html = await storage.read_template_file(
-                    f"{template['file_path']}/index.html"
-                )
-            except:
-                template_html = None
+        # Get template HTML content and the offers, loading only the fields
+        # the template reads (the file read and offer query overlap)
+        try:
+            template_html, offers = await load_template_offers(db, template, offer_ids, selection)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         if not template_html:
             raise HTTPException(status_code=400, detail="Template has no HTML content")
         
+        if not offers:
+            raise HTTPException(status_code=404, detail="No offers found")
+        
         # Generate PDF
         pdf_service = get_pdf_service()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -140,38 +159,211 @@ async def generate_pdf(
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 
+@router.post("/generate-raster")
+async def generate_raster(
+    request: Request,
+    offer_ids: List[str] = Body(default=None),
+    selection: dict = Body(default=None),
+    template_id: str = Body(...),
+    raster: dict = Body(default=None),
+    layout_options: dict = Body(default=None),
+    branding: dict = Body(default=None),
+    store_id: str = Body(default=None)
+):
+    """
+    Render offers to packed bitmaps for electronic shelf labels.
+    
+    Request Body (offer_ids or selection, as for /pdf/generate):
+    {
+        "offer_ids": ["id1", "id2", ...],
+        "template_id": "template_mongodb_id",
+        "raster": {
+            "profile": "epd-2.9-bwr",          // or width / height / palette ('bw' | 'bwr')
+            "dither": "ordered"                 // or 'threshold'
+        }
+    }
+    
+    Returns: { frames_url: str, manifest_url: str, frame_size: int, frame_count: int }
+    """
+    try:
+        from app.services.raster import get_raster_service
+
+        if not offer_ids and not selection:
+            raise HTTPException(status_code=400, detail="No offers selected")
+
+        db = await _store_db(store_id)
+        template = await db.find_template(template_id)
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+
+        layout_options = layout_options or template.get("layout_options") or {}
+        if not branding and isinstance(layout_options, dict):
+            possible = layout_options.get("branding")
+            if possible and isinstance(possible, dict):
+                branding = possible
+        if branding and isinstance(branding, dict):
+            logo = branding.get("logo_url")
+            if logo and isinstance(logo, str) and logo.startswith("/"):
+                from urllib.parse import quote
+                base = str(request.base_url).rstrip('/')
+                branding["logo_url"] = quote(f"{base}{logo}", safe=":/?#[]@!$&'()*+,;=%")
+
+        # Same template loading as /pdf/generate, so uploaded (file_path) templates work too
+        try:
+            template_html, offers = await load_template_offers(db, template, offer_ids, selection)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not template_html:
+            raise HTTPException(status_code=400, detail="Template has no HTML content")
+        if not offers:
+            raise HTTPException(status_code=404, detail="No offers found")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        basename = f"labels_{timestamp}"
+        try:
+            manifest = await get_raster_service().generate_frames(
+                offers=offers,
+                template_html=template_html,
+                raster_options=raster,
+                layout_options=layout_options,
+                branding=branding,
+                output_basename=basename
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return {
+            "status": "success",
+            "frames_url": f"/downloads/esl/{manifest['frames_file']}",
+            "manifest_url": f"/downloads/esl/{basename}.json",
+            "width": manifest["width"],
+            "height": manifest["height"],
+            "palette": manifest["palette"],
+            "frame_size": manifest["frame_size"],
+            "frame_count": manifest["frame_count"],
+            "timestamp": timestamp
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error generating raster labels: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating raster labels: {str(e)}")
+
+
+@router.post("/generate-print")
+async def generate_print(
+    offer_ids: List[str] = Body(default=None),
+    selection: dict = Body(default=None),
+    template_id: str = Body(...),
+    printer: dict = Body(default=None),
+    branding: dict = Body(default=None),
+    store_id: str = Body(default=None)
+):
+    """
+    Compile offers to a thermal printer job (ZPL or ESC/POS) instead of a PDF.
+    
+    Request Body (offer_ids or selection, as for /pdf/generate):
+    {
+        "offer_ids": ["id1", "id2", ...],
+        "template_id": "template_mongodb_id",
+        "printer": {
+            "language": "zpl",          // or 'escpos'
+            "dpi": 203,                 // or 300
+            "target": "file",           // or 'tcp' with printer_id, or host / port (default 9100)
+            "printer_id": "aisle-3"     // tcp printers must be listed in AOPS_PRINTERS
+        },
+        "branding": { "logo_url": "/logos/Frame_27.png", ... }
+    }
+    
+    Returns: { download_url | host, size: int, label_count: int }
+    """
+    try:
+        from app.services.printer import get_printer_service
+
+        if not offer_ids and not selection:
+            raise HTTPException(status_code=400, detail="No offers selected")
+
+        db = await _store_db(store_id)
+        # The offers and the template are independent lookups
+        try:
+            offers, template = await asyncio.gather(
+                resolve_offers(db, offer_ids, selection),
+                db.find_template(template_id)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not offers:
+            raise HTTPException(status_code=404, detail="No offers found")
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            result = await get_printer_service().print_offers(
+                offers=offers,
+                printer=printer,
+                template=template,
+                branding=branding,
+                output_basename=f"labels_{timestamp}"
+            )
+        except (ValueError, OSError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if result.get("filename"):
+            result["download_url"] = f"/downloads/print/{result['filename']}"
+
+        return {"status": "success", "timestamp": timestamp, **result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error generating print job: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating print job: {str(e)}")
+
+
 @router.post("/preview")
 async def preview_pdf(
     request: Request,
-    offer_ids: List[str] = Body(..., embed=False),
+    offer_ids: List[str] = Body(default=None),
+    selection: dict = Body(default=None),
     template_id: str = Body(...),
-    layout_options: dict = Body(default=None)
+    layout_options: dict = Body(default=None),
+    store_id: str = Body(default=None)
 ):
     """
     Generate a preview of the PDF without saving.
     
+    Renders the first offer of offer_ids or of the selection.
+    
     Returns: { html_preview: str }
     """
     try:
-        # Fetch offers
-        db = await get_db()
-        offers = await db.get_offers_by_ids(offer_ids[:1])  # Preview with first offer only
-        
-        if not offers:
-            raise HTTPException(status_code=404, detail="Offers not found")
-        
         # Fetch template
-        template = await db.get_template_by_id(template_id)
-        if not template:
-            try:
-                tmpl = await db.db.templates.find_one({"id": template_id})
-                if tmpl:
-                    template = tmpl
-            except Exception:
-                template = None
+        db = await _store_db(store_id)
+        template = await db.find_template(template_id)
         if not template:
             raise HTTPException(status_code=404, detail="Template not found")
 
+        # Preview with first offer only, loading just the fields the template reads
+        fields = template_offer_fields(template)
+        if offer_ids:
+            try:
+                offers = await db.load_offers_by_ids(offer_ids[:1], fields=fields)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        elif selection:
+            try:
+                query = build_offer_filter(selection)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            offers = await db.get_offers(limit=1, filter_dict=query, fields=fields)
+        else:
+            raise HTTPException(status_code=400, detail="No offers selected")
+        
+        if not offers:
+            raise HTTPException(status_code=404, detail="Offers not found")
+
         # Determine layout options (use template defaults when not provided)
         layout_options = layout_options or template.get("layout_options") or {
             "pageSize": "A4",
@@ -207,7 +399,7 @@ async def preview_pdf(
             "label_height": page_size_info["label_height"],
             "branding": branding
         }
-        html_preview = pdf_service.render_template(template_html, context)
+        html_preview = await pdf_service.render_template_async(template_html, context)
         
         return {
             "status": "success",
@@ -222,6 +414,106 @@ async def preview_pdf(
         raise HTTPException(status_code=500, detail="Error generating preview")
 
 
+@router.post("/jobs")
+async def enqueue_pdf_job(
+    request: Request,
+    offer_ids: List[str] = Body(default=None),
+    selection: dict = Body(default=None),
+    template_id: str = Body(...),
+    layout_options: dict = Body(default=None),
+    branding: dict = Body(default=None),
+    store_id: str = Body(default=None)
+):
+    """
+    Queue a PDF render job for the render worker tier.
+
+    Takes the same body as /pdf/generate (offer_ids or selection, store_id); a
+    selection is resolved by the worker when the job runs. Poll
+    /pdf/jobs/{job_id} for the result.
+
+    Returns: { job_id: str, status: "queued" }
+    """
+    try:
+        if not offer_ids and not selection:
+            raise HTTPException(status_code=400, detail="No offers selected")
+        if offer_ids and selection:
+            raise HTTPException(status_code=400, detail="Send either offer_ids or selection, not both")
+        if selection:
+            try:
+                build_offer_filter(selection)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        if not template_id:
+            raise HTTPException(status_code=400, detail="Template ID required")
+
+        if not branding and isinstance(layout_options, dict):
+            possible = layout_options.get("branding")
+            if possible and isinstance(possible, dict):
+                branding = possible
+
+        # Workers have no request context, so resolve the logo URL here
+        if branding and isinstance(branding, dict):
+            logo = branding.get("logo_url")
+            if logo and isinstance(logo, str) and logo.startswith("/"):
+                from urllib.parse import quote
+                base = str(request.base_url).rstrip('/')
+                branding["logo_url"] = quote(f"{base}{logo}", safe=":/?#[]@!$&'()*+,;=%")
+
+        db = await _store_db(store_id)
+        job_id = await db.enqueue_job("pdf", {
+            "offer_ids": offer_ids,
+            "selection": selection,
+            "template_id": template_id,
+            "layout_options": layout_options,
+            "branding": branding,
+            "store_id": db.store_id
+        })
+
+        return {
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/pdf/jobs/{job_id}"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error queuing PDF job: {e}")
+        raise HTTPException(status_code=500, detail=f"Error queuing PDF job: {str(e)}")
+
+
+@router.get("/jobs/{job_id}")
+async def get_pdf_job(job_id: str):
+    """
+    Get the status of a queued PDF render job.
+
+    Returns: { job_id, status, attempts, result, error }
+    """
+    try:
+        db = await get_db()
+        job = await db.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        return {
+            "status": "success",
+            "job_id": str(job["_id"]),
+            "job_status": job.get("status"),
+            "attempts": job.get("attempts", 0),
+            "result": job.get("result"),
+            "error": job.get("error"),
+            "created_at": job["created_at"].isoformat() if job.get("created_at") else None,
+            "updated_at": job["updated_at"].isoformat() if job.get("updated_at") else None
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ Error fetching PDF job: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching PDF job")
+
+
 @router.get("/download/{filename}")
 async def download_pdf(filename: str):
     """
@@ -250,7 +542,19 @@ async def download_pdf(filename: str):
             raise HTTPException(status_code=403, detail="Access denied")
         
         if not os.path.isfile(pdf_path):
-            raise HTTPException(status_code=404, detail=f"PDF not found: {filename}")
+            # PDFs rendered by the worker tier are kept in GridFS
+            db = await get_db()
+            stream = await db.open_job_result_file(filename)
+            if stream is None:
+                raise HTTPException(status_code=404, detail=f"PDF not found: {filename}")
+            return StreamingResponse(
+                _iter_grid_file(stream),
+                media_type="application/pdf",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"',
+                    "Content-Length": str(stream.length),
+                }
+            )
         
         print(f"→ Downloading PDF: {pdf_path}")
         return FileResponse(
@@ -12,6 +12,7 @@ from bson.objectid import ObjectId
 from app.models.template import Template, TemplateCreate
 from app.services.db import get_db
 from app.services.storage import get_storage_service
+from app.services.analysis import analyze_offer_fields
 
 
 def serialize_for_json(obj):
@@ -64,6 +65,7 @@ async def upload_template(file: UploadFile = File(...), name: str = "Custom Temp
             "file_path": extract_dir,
             "html_content": html_content,
             "css_content": None,
+            "offer_fields": analyze_offer_fields(html_content),
             "layout_options": {
                 "pageSize": "A4",
                 "perPage": 24,
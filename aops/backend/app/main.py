@@ -5,19 +5,32 @@ Initializes routes, middleware, and startup/shutdown events.
 
 import os
 from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 
 from app.api import offers, templates, pdf
 from app.services.db import init_db, get_db
-from app.services.pdfgen import init_pdf_service
+from app.services.pdfgen import init_pdf_service, get_pdf_service
 from app.services.storage import init_storage_service
-from app.models.template import Template as TemplateModel
+from app.services.raster import init_raster_service
+from app.services.printer import init_printer_service
+from app.services.executor import init_executor_service, get_executor_service
+from app.services.search import init_search_service
+from app.services.analysis import analyze_offer_fields
 from app.config.branding import get_available_brands, get_brand_config, BRAND_CONFIGS
 
 
+# Readiness state reported by /health; flipped once warm-up completes
+readiness = {"ready": False, "warmup": "pending", "warmup_error": None}
+
+# Seconds between runs of the expired-offer archiver (0 disables it)
+OFFER_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("AOPS_OFFER_ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+
 # Lifecycle management
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -50,9 +63,28 @@ async def lifespan(app: FastAPI):
         
         init_pdf_service(output_dir=os.path.join(uploads_base, "pdfs"))
         init_storage_service(base_dir=uploads_base)
+        init_raster_service(output_dir=os.path.join(uploads_base, "esl"))
+        init_printer_service(output_dir=os.path.join(uploads_base, "print"))
+
+        # Process/thread pools for CPU-bound work; lag is reported by /health
+        executor = init_executor_service()
+        executor.start_lag_monitor()
         
         # Initialize preset templates
         await initialize_preset_templates(db)
+
+        # Offers ingested before typed fields existed get them in the background
+        backfill_task = asyncio.create_task(db.backfill_offer_fields())
+
+        # Move lapsed offers out of the working set on a schedule
+        archive_task = asyncio.create_task(archive_expired_offers_periodically())
+
+        # Build the default store's offer search index before the first search
+        search_task = asyncio.create_task(init_search_service().prepare(db))
+
+        # Warm up browsers and templates in the background; /health reports
+        # not-ready until this finishes so traffic only reaches warm instances
+        warmup_task = asyncio.create_task(warm_up_services())
         
         print("✓ All services initialized successfully")
         print("="*50 + "\n")
@@ -67,7 +99,14 @@ async def lifespan(app: FastAPI):
     print("\n" + "="*50)
     print("🛑 Shutting down AOPS Backend Server...")
     print("="*50)
+    readiness["ready"] = False
     try:
+        warmup_task.cancel()
+        backfill_task.cancel()
+        archive_task.cancel()
+        search_task.cancel()
+        await get_pdf_service().close_browser_pool()
+        await get_executor_service().shutdown()
         db = await get_db()
         await db.disconnect()
         print("✓ Services cleaned up")
@@ -77,40 +116,79 @@ async def lifespan(app: FastAPI):
 
 
 async def initialize_preset_templates(db):
-    """Initialize preset templates in database if they don't exist"""
+    """Create or refresh the preset templates, keeping their ids stable across restarts"""
     try:
         from app.templates.preset_shelf_talker_minimal import PRESET_SHELF_TALKER_MINIMAL
         from app.templates.preset_shelf_talker_branded import PRESET_SHELF_TALKER_BRANDED
         from app.templates.preset_shelf_talker_loyal import PRESET_SHELF_TALKER_LOYAL
         
-        # Delete all existing preset templates to ensure fresh initialization
-        existing = await db.get_preset_templates()
-        if len(existing) > 0:
-            print(f"🔄 Clearing {len(existing)} existing preset templates for fresh initialization...")
-            for template in existing:
-                template_id = str(template.get("_id"))
-                await db.db.templates.delete_one({"_id": template["_id"]})
-            print("✓ Cleared old presets")
-        
         templates_to_create = [
             PRESET_SHELF_TALKER_MINIMAL,
             PRESET_SHELF_TALKER_BRANDED,
             PRESET_SHELF_TALKER_LOYAL
         ]
         
+        # Upserted by name: queued render jobs and clients hold preset ids
+        kept = []
         for template in templates_to_create:
-            # Add created_at/updated_at if not present (for dict templates)
-            if "created_at" not in template:
-                template["created_at"] = datetime.utcnow()
-                template["updated_at"] = datetime.utcnow()
-            
-            template_id = await db.save_template(template)
-            print(f"✓ Created preset template: {template['name']} ({template_id})")
+            template["offer_fields"] = analyze_offer_fields(template.get("html_content"))
+            template_id = await db.upsert_preset_template(template)
+            kept.append(template_id)
+            print(f"✓ Preset template ready: {template['name']} ({template_id})")
+
+        removed = await db.delete_preset_templates(kept)
+        if removed:
+            print(f"✓ Removed {removed} outdated preset templates")
         
     except Exception as e:
         print(f"⚠ Template initialization warning: {e}")
 
 
+async def warm_up_services():
+    """Launch the browser pool and pre-render each preset template once"""
+    if os.getenv("AOPS_WARMUP", "true").lower() != "true":
+        readiness.update(ready=True, warmup="skipped")
+        return
+
+    readiness["warmup"] = "running"
+    try:
+        from app.templates.preset_shelf_talker_minimal import PRESET_SHELF_TALKER_MINIMAL
+        from app.templates.preset_shelf_talker_branded import PRESET_SHELF_TALKER_BRANDED
+        from app.templates.preset_shelf_talker_loyal import PRESET_SHELF_TALKER_LOYAL
+
+        await get_pdf_service().warm_up([
+            PRESET_SHELF_TALKER_MINIMAL,
+            PRESET_SHELF_TALKER_BRANDED,
+            PRESET_SHELF_TALKER_LOYAL
+        ])
+        readiness["warmup"] = "done"
+        print("✓ Warm-up complete")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # A failed warm-up must not keep the instance out of rotation forever;
+        # requests will fall back to cold launches
+        readiness.update(warmup="failed", warmup_error=str(e))
+        print(f"⚠ Warm-up warning: {e}")
+    readiness["ready"] = True
+
+
+async def archive_expired_offers_periodically():
+    """Archive expired offers (and prune old tombstones) every OFFER_ARCHIVE_INTERVAL_SECONDS"""
+    if OFFER_ARCHIVE_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        try:
+            db = await get_db()
+            await db.archive_expired_offers()
+            await db.prune_offer_tombstones()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠ Offer archiving warning: {e}")
+        await asyncio.sleep(OFFER_ARCHIVE_INTERVAL_SECONDS)
+
+
 # Create FastAPI application
 app = FastAPI(
     title="AOPS - Automated Offer Print System",
@@ -139,12 +217,18 @@ app.include_router(pdf.router)
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
+    """Health check endpoint. Returns 503 until warm-up has completed."""
+    body = {
+        "status": "healthy" if readiness["ready"] else "warming_up",
         "service": "AOPS Backend",
+        "ready": readiness["ready"],
+        "warmup": readiness["warmup"],
+        "loop_lag_ms": get_executor_service().lag["avg_ms"],
         "timestamp": datetime.utcnow().isoformat()
     }
+    if readiness["warmup_error"]:
+        body["warmup_error"] = readiness["warmup_error"]
+    return JSONResponse(content=body, status_code=200 if readiness["ready"] else 503)
 
 
 @app.get("/")
@@ -211,7 +295,7 @@ async def debug_uploads():
             "subdirs": {}
         }
         if os.path.isdir(uploads_base):
-            for subdir in ["pdfs", "csv", "templates"]:
+            for subdir in ["pdfs", "csv", "templates", "esl", "print"]:
                 subpath = os.path.join(uploads_base, subdir)
                 if os.path.isdir(subpath):
                     files = []
@@ -18,6 +18,14 @@ class OfferBase(BaseModel):
     price: float  # Sale price from CSV
     mrp: float  # MRP column from CSV
     valid_till: Optional[str] = None  # Expiry date from CSV
+    valid_till_date: Optional[datetime] = None  # valid_till parsed at ingest (None if blank/unknown)
+    discount_amount: Optional[float] = None  # mrp - price, set at ingest
+    discount_pct: Optional[float] = None  # Discount as % of mrp, set at ingest
+    # Label strings set at ingest (what templates printed with |int)
+    price_display: Optional[str] = None
+    mrp_display: Optional[str] = None
+    savings_display: Optional[str] = None
+    discount_pct_display: Optional[str] = None  # '' unless both price and mrp are set
     custom_fields: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
 
@@ -29,6 +37,7 @@ class OfferCreate(OfferBase):
 class Offer(OfferBase):
     """Complete offer model with ID and timestamps"""
     id: Optional[str] = Field(None, alias="_id")
+    store_id: Optional[str] = None  # Store the offer belongs to (None = default store)
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -4,7 +4,7 @@ Defines the structure for preset and custom templates.
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 
@@ -34,6 +34,8 @@ class Template(TemplateBase):
     html_content: Optional[str] = None
     css_content: Optional[str] = None
     file_path: Optional[str] = None  # Path to uploaded ZIP or template files
+    print_layout: Optional[str] = None  # Thermal printer layout (presets only)
+    offer_fields: Optional[List[str]] = None  # Offer attributes the HTML reads (None = all)
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
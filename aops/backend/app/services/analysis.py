@@ -0,0 +1,137 @@
+"""
+Template analysis service module.
+Parses Jinja2 templates to find which offer attributes they read, so label
+renders can fetch only those fields from MongoDB.
+"""
+
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+from jinja2 import Environment, nodes
+from jinja2.exceptions import TemplateSyntaxError
+
+
+# Offer fields every render needs besides what the template reads
+# (_id is always returned; product_id names frames and print jobs)
+BASE_OFFER_FIELDS = ("product_id",)
+
+# Filters that can be applied to the offer list without exposing whole offers
+LIST_FILTERS = {"length", "count", "batch", "slice", "reverse", "list"}
+
+# Filters that turn the offer list into a list of rows (lists of offers)
+ROW_FILTERS = {"batch", "slice"}
+
+_env = Environment()
+
+
+class _UnknownUsage(Exception):
+    """An offer is used in a way the analysis cannot reduce to field names"""
+
+
+def _references(node: nodes.Node, names: Set[str]) -> bool:
+    return any(n.name in names for n in node.find_all(nodes.Name))
+
+
+def _loop_source(node: nodes.Node) -> Tuple[nodes.Node, bool]:
+    """Unwrap filters on a loop iterable; returns (base node, yields rows of offers)"""
+    rows = False
+    while isinstance(node, nodes.Filter):
+        rows = rows or node.name in ROW_FILTERS
+        node = node.node
+    return node, rows
+
+
+def _collect(node: nodes.Node, parent: Optional[nodes.Node], offers: Set[str],
+             lists: Set[str], fields: Set[str]):
+    """
+    Walk the AST, recording field reads on offer names.
+
+    offers holds names bound to single offers, lists names bound to lists of
+    offers; any other use of those names raises _UnknownUsage.
+    """
+    if isinstance(node, (nodes.Include, nodes.Import, nodes.FromImport, nodes.Extends)):
+        # Other templates see the same context and may read anything
+        raise _UnknownUsage()
+
+    if isinstance(node, nodes.Name) and node.ctx == "load":
+        if node.name in offers:
+            if isinstance(parent, nodes.Getattr) and parent.node is node:
+                fields.add(parent.attr)
+            elif (isinstance(parent, nodes.Getitem) and parent.node is node
+                    and isinstance(parent.arg, nodes.Const) and isinstance(parent.arg.value, str)):
+                fields.add(parent.arg.value)
+            else:
+                raise _UnknownUsage()
+        elif node.name in lists:
+            if isinstance(parent, nodes.For) and parent.iter is node:
+                pass
+            elif isinstance(parent, nodes.Filter) and parent.node is node and parent.name in LIST_FILTERS:
+                pass
+            else:
+                raise _UnknownUsage()
+        return
+
+    if isinstance(node, nodes.For):
+        _collect(node.iter, node, offers, lists, fields)
+        if not isinstance(node.target, nodes.Name):
+            if _references(node.iter, offers | lists):
+                raise _UnknownUsage()
+            inner_offers, inner_lists = offers, lists
+        else:
+            # The loop variable shadows outer names inside the loop body
+            name = node.target.name
+            inner_offers, inner_lists = offers - {name}, lists - {name}
+            source, rows = _loop_source(node.iter)
+            if isinstance(source, nodes.Name) and source.name in lists:
+                (inner_lists if rows else inner_offers).add(name)
+        for child in node.body:
+            _collect(child, node, inner_offers, inner_lists, fields)
+        if node.test is not None:
+            _collect(node.test, node, inner_offers, inner_lists, fields)
+        for child in node.else_:
+            _collect(child, node, offers, lists, fields)
+        return
+
+    if isinstance(node, nodes.Assign) and _references(node.node, offers | lists):
+        # {% set x = offer %} and similar aliases are not tracked
+        raise _UnknownUsage()
+
+    for child in node.iter_child_nodes():
+        _collect(child, node, offers, lists, fields)
+
+
+def analyze_offer_fields(template_html: Optional[str]) -> Optional[List[str]]:
+    """
+    Find the offer attributes a label template reads.
+
+    Follows loops over `offers` (including `offers|batch(n)` rows) and
+    records `offer.attr` and `offer['attr']` reads on the loop variables.
+
+    Args:
+        template_html: HTML template with Jinja2 syntax
+
+    Returns:
+        Sorted field names (including BASE_OFFER_FIELDS), or None when the
+        template uses offers in a way that needs the whole document, such
+        as passing an offer to a macro, dumping it, or a dynamic key
+    """
+    if not template_html:
+        return None
+    try:
+        ast = _env.parse(template_html)
+        fields: Set[str] = set(BASE_OFFER_FIELDS)
+        _collect(ast, None, set(), {"offers"}, fields)
+    except (TemplateSyntaxError, _UnknownUsage):
+        return None
+    return sorted(fields)
+
+
+def template_offer_fields(template: Dict[str, Any], template_html: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Offer fields to fetch for rendering a template document.
+
+    Uses the offer_fields recorded when the template was saved and analyzes
+    the HTML for templates saved before that (None means fetch everything).
+    """
+    if "offer_fields" in template:
+        return template["offer_fields"]
+    return analyze_offer_fields(template_html or template.get("html_content"))
@@ -0,0 +1,111 @@
+"""
+Offer batching service module.
+Merges offer-by-id lookups made by concurrent requests into shared `$in`
+queries, in the style of a DataLoader: callers that ask within the same
+short window share one round trip to MongoDB.
+"""
+
+import os
+import asyncio
+from typing import Optional, List, Dict, Any, Tuple
+
+from bson.objectid import ObjectId
+
+
+# How long a batch waits for more lookups before it is sent (0 = next loop turn)
+OFFER_BATCH_WINDOW_SECONDS = float(os.getenv("AOPS_OFFER_BATCH_WINDOW_MS", "2")) / 1000
+# Most offer ids sent in one merged query; a full batch is sent at once
+OFFER_BATCH_MAX_IDS = int(os.getenv("AOPS_OFFER_BATCH_MAX_IDS", "5000"))
+
+
+class _Batch:
+    """Offer ids and fields wanted by the callers waiting on one query"""
+
+    def __init__(self):
+        self.ids: Dict[str, None] = {}
+        self.fields: Optional[set] = set()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.handle: Optional[asyncio.Handle] = None
+
+    def add(self, offer_ids: List[str], fields: Optional[List[str]]):
+        self.ids.update(dict.fromkeys(offer_ids))
+        # One caller wanting whole documents means the query loads them for everyone
+        if fields is None or self.fields is None:
+            self.fields = None
+        else:
+            self.fields.update(fields)
+
+
+class OfferBatcher:
+    """Coalesces get_offers_by_ids calls per offers collection and store"""
+
+    def __init__(self, window: float = OFFER_BATCH_WINDOW_SECONDS, max_ids: int = OFFER_BATCH_MAX_IDS):
+        """
+        Initialize offer batcher.
+
+        Args:
+            window: Seconds a batch stays open for more lookups
+            max_ids: Offer ids at which a batch is sent without waiting
+        """
+        self.window = max(0.0, window)
+        self.max_ids = max(1, max_ids)
+        self._pending: Dict[Tuple[str, Optional[str]], _Batch] = {}
+        # Queries in flight, referenced until they finish
+        self._running: set = set()
+        self.stats = {"lookups": 0, "queries": 0}
+
+    async def load(self, db, offer_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Load offers by id through a shared query.
+
+        Args:
+            db: DatabaseService view whose collection and store to read
+            offer_ids: Offer ObjectIds as strings
+            fields: Only these fields are needed (see offer_projection);
+                    documents may carry fields other callers asked for
+
+        Returns:
+            Offer documents in the order of offer_ids (missing and repeated ids skipped)
+
+        Raises:
+            ValueError: If an id is not a valid ObjectId (checked before
+                        joining a batch, so it cannot fail other callers)
+        """
+        if not offer_ids:
+            return []
+        if not all(ObjectId.is_valid(oid) for oid in offer_ids):
+            raise ValueError("Invalid offer id")
+        collection = await db.offers_collection()
+        key = (collection.name, db.store_id)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+            loop = asyncio.get_running_loop()
+            batch.handle = loop.call_later(self.window, self._dispatch, db, key, batch)
+        batch.add(offer_ids, fields or None)
+        self.stats["lookups"] += 1
+        if len(batch.ids) >= self.max_ids:
+            batch.handle.cancel()
+            self._dispatch(db, key, batch)
+
+        # Shield the shared query from one caller being cancelled
+        docs_by_id = await asyncio.shield(batch.future)
+        # Copies, so a caller that edits its offers does not affect the others
+        return [dict(docs_by_id[oid]) for oid in dict.fromkeys(offer_ids) if oid in docs_by_id]
+
+    def _dispatch(self, db, key: Tuple[str, Optional[str]], batch: _Batch):
+        """Close a batch and run its query"""
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        self.stats["queries"] += 1
+        task = asyncio.ensure_future(self._run(db, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, db, batch: _Batch):
+        try:
+            fields = sorted(batch.fields) if batch.fields else None
+            docs = await db.get_offers_by_ids(list(batch.ids), fields=fields)
+            batch.future.set_result({str(doc["_id"]): doc for doc in docs})
+        except Exception as e:
+            batch.future.set_exception(e)
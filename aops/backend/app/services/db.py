@@ -4,11 +4,163 @@ Handles all MongoDB operations using Motor async client.
 """
 
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
+import re
+import copy
+import time
+import uuid
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ASCENDING, ReturnDocument, UpdateOne, ReplaceOne
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
-from pymongo.errors import BulkWriteError
+from gridfs.errors import NoFile
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from app.services.hashing import offer_content_hash
+from app.services.batching import OfferBatcher
+
+
+# Render job leases: a worker must heartbeat before the lease expires or the job
+# becomes claimable by another worker.
+JOB_LEASE_SECONDS = int(os.getenv("AOPS_JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("AOPS_JOB_MAX_ATTEMPTS", "3"))
+# GridFS bucket holding files rendered by workers, which share no disk with the API
+JOB_RESULTS_BUCKET = "job_results"
+
+# Offer sets: a versioned upload builds its own collection; the active one is
+# named by a single pointer document in the meta collection, so switching
+# catalogs is one atomic update and old versions are dropped whole.
+DEFAULT_OFFERS_COLLECTION = "offers"
+ACTIVE_OFFER_SET_ID = "active_offer_set"
+OFFER_SET_PREFIX = "offers_v"
+# meta document listing the collections whose typed-field backfill finished
+OFFER_FIELDS_BACKFILL_ID = "offer_fields_backfill"
+# Inactive (retired) offer sets kept for rollback before being dropped
+OFFER_SETS_KEPT = int(os.getenv("AOPS_OFFER_SETS_KEPT", "1"))
+# A set still "building" without a heartbeat for this long is marked failed
+# (its build task died with the process that ran it)
+OFFER_SET_BUILD_LEASE_SECONDS = int(os.getenv("AOPS_OFFER_SET_BUILD_LEASE_SECONDS", "300"))
+# An upload claim whose heartbeat is older than this is taken over by the next
+# identical upload (the process ingesting it crashed or was redeployed)
+INGEST_CLAIM_LEASE_SECONDS = int(os.getenv("AOPS_INGEST_CLAIM_LEASE_SECONDS", "60"))
+# How long a process trusts its cached active-set pointer
+OFFER_SET_REFRESH_SECONDS = float(os.getenv("AOPS_OFFER_SET_REFRESH_SECONDS", "5"))
+
+# Cached offer totals are re-read after writes or once this old
+OFFER_COUNT_TTL_SECONDS = float(os.getenv("AOPS_OFFER_COUNT_TTL_SECONDS", "60"))
+
+# Collection lapsed offers are moved to by archive_expired_offers()
+OFFER_ARCHIVE_COLLECTION = "offers_archive"
+# Days an offer stays in the working set after its valid_till date
+OFFER_ARCHIVE_GRACE_DAYS = int(os.getenv("AOPS_OFFER_ARCHIVE_GRACE_DAYS", "0"))
+# Delete archived offers this many days after archiving (0 = keep forever)
+OFFER_ARCHIVE_TTL_DAYS = int(os.getenv("AOPS_OFFER_ARCHIVE_TTL_DAYS", "0"))
+
+# Changes feed: writers reserve sync_seq values from a counter and hold a lease
+# while writing, so readers only hand out tokens up to the committed watermark
+# (below the lowest range still being written). A lease left by a crashed
+# writer stops holding the watermark back after this long.
+SYNC_SEQ_COUNTER = "offer_sync_seq"
+SYNC_LEASE_SECONDS = int(os.getenv("AOPS_SYNC_LEASE_SECONDS", "600"))
+# Counter bumped when a collection is cleared or dropped (prefix + name), which
+# the changes feed can only report as a full resync
+OFFERS_REMOVED_COUNTER_PREFIX = "offers_removed:"
+# Offers removed one by one (archiving) leave a tombstone with a sync_seq of its
+# own, so the changes feed reports them as removals instead of a full resync
+OFFER_TOMBSTONES_COLLECTION = "offer_tombstones"
+# Days tombstones are kept (0 = keep forever); tokens older than the pruned
+# range get a full resync
+SYNC_TOMBSTONE_TTL_DAYS = int(os.getenv("AOPS_SYNC_TOMBSTONE_TTL_DAYS", "30"))
+# meta document holding the highest sync_seq of a pruned tombstone
+OFFER_TOMBSTONES_PRUNED_ID = "offer_tombstones_pruned"
+
+# Times an upsert that lost an insert race to another writer (E11000) is retried
+UPSERT_DUPLICATE_RETRIES = 3
+DUPLICATE_KEY_ERROR = 11000
+
+# Offers fetched per round trip when streaming a selection
+OFFER_STREAM_BATCH_SIZE = int(os.getenv("AOPS_OFFER_STREAM_BATCH_SIZE", "1000"))
+
+# Stores: every offer carries a store_id (None = the default store, which is
+# also what offers ingested before stores existed match). Offer indexes lead
+# with store_id so a store's queries only touch its own part of the catalog.
+STORE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Stores whose offers live in a collection of their own ("<offer set>__store_<id>")
+# instead of the shared one: comma-separated store ids, or "*" for every store
+STORE_COLLECTIONS = {s.strip() for s in os.getenv("AOPS_STORE_COLLECTIONS", "").split(",") if s.strip()}
+STORE_COLLECTION_SEPARATOR = "__store_"
+
+# Offer indexes replaced by their store-led versions
+LEGACY_OFFER_INDEXES = (
+    "product_id_1",
+    "sync_seq_1",
+    "import_batch_1",
+    "brand_1_offer_type_1_valid_till_date_1",
+    "brand_1_discount_pct_1",
+    "offer_type_1_discount_pct_1",
+    "valid_till_date_1_discount_pct_1",
+)
+
+
+def new_import_batch_id() -> str:
+    """Sortable id stamped on every offer written by one import"""
+    return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def _write_error_summary(write_error: Dict[str, Any], product_id: Optional[str]) -> Dict[str, Any]:
+    """The parts of a bulk writeErrors entry worth reporting to the uploader"""
+    return {
+        "product_id": product_id,
+        "code": write_error.get("code"),
+        "message": str(write_error.get("errmsg", ""))[:300],
+    }
+
+
+def validate_store_id(store_id: Optional[str]) -> Optional[str]:
+    """
+    Check a store id from a request (None or "" means the default store).
+    
+    Raises:
+        ValueError: If it is not 1-64 letters, digits, '_' or '-'
+    """
+    if not store_id:
+        return None
+    if not STORE_ID_PATTERN.match(store_id):
+        raise ValueError("store_id must be 1-64 letters, digits, '_' or '-'")
+    return store_id
+
+
+def has_store_collection(store_id: Optional[str]) -> bool:
+    """True when a store's offers are kept in a dedicated collection"""
+    return bool(store_id) and ("*" in STORE_COLLECTIONS or store_id in STORE_COLLECTIONS)
+
+
+def offer_projection(fields: Optional[List[str]]) -> Optional[Dict[str, int]]:
+    """
+    Build a Mongo projection for a list of offer field names.
+    
+    Dotted paths (custom_fields.size) select a single nested value; _id is
+    always returned. None or an empty list means the whole document. A path
+    under a field that is already selected is dropped, since Mongo rejects
+    projections with colliding paths.
+    """
+    if not fields:
+        return None
+    paths = set(fields) - {"_id", "id"}
+    projection = {
+        field: 1 for field in sorted(paths)
+        if not any(field[:i] in paths for i, char in enumerate(field) if char == ".")
+    }
+    return projection or {"_id": 1}
+
+
+class _ActiveSetPointer:
+    """Cached meta pointer to the active offer set, shared by a service and all its views"""
+
+    def __init__(self):
+        self.collection = DEFAULT_OFFERS_COLLECTION
+        # monotonic time of the last read (0 = read on next use)
+        self.checked_at = 0.0
 
 
 class DatabaseService:
@@ -25,16 +177,35 @@ class DatabaseService:
         print(f"DatabaseService initialized with URI: {self.mongo_uri}")
         self.client: Optional[AsyncIOMotorClient] = None
         self.db: Optional[Any] = None
+        # A holder rather than plain attributes, so the copies made by
+        # for_store() and friends refresh one cache instead of their own
+        self._active_set = _ActiveSetPointer()
+        self._pinned_offer_set: Optional[str] = None
+        self._import_batch: Optional[str] = None
+        self._store_id: Optional[str] = None
+        # (collection name, store id) -> (count, monotonic time read)
+        self._offer_counts: Dict[tuple, tuple] = {}
+        # Dedicated store collections indexed by this process
+        self._indexed_collections: set = set()
+        # Merges offer-by-id lookups of concurrent requests (shared by all views)
+        self._offer_batcher = OfferBatcher()
 
-    async def connect(self):
-        """Establish connection to MongoDB"""
+    async def connect(self, create_indexes: bool = True):
+        """
+        Establish connection to MongoDB.
+        
+        Args:
+            create_indexes: Ensure collection indexes (skip in short-lived
+                            worker processes once the parent has done it)
+        """
         try:
             self.client = AsyncIOMotorClient(self.mongo_uri)
             self.db = self.client.aops_db
             print("✓ MongoDB client created",{self.mongo_uri})
             
             # Create indexes for better query performance
-            await self._create_indexes()
+            if create_indexes:
+                await self._create_indexes()
             print("✓ Connected to MongoDB")
         except Exception as e:
             print(f"✗ MongoDB connection failed: {e}")
@@ -49,21 +220,437 @@ class DatabaseService:
     async def _create_indexes(self):
         """Create database indexes for collections"""
         try:
-            offers_collection = self.db.offers
             templates_collection = self.db.templates
             
             # Offers indexes
-            await offers_collection.create_index([("product_id", ASCENDING)], unique=True)
-            await offers_collection.create_index([("created_at", ASCENDING)])
+            await self._create_offer_indexes(await self.offers_collection())
+            await self.db.offer_sets.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+            await self.db.sync_leases.create_index([("floor", ASCENDING)])
+            await self.db.sync_leases.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+            await self.db[OFFER_TOMBSTONES_COLLECTION].create_index(
+                [("collection", ASCENDING), ("store_id", ASCENDING), ("sync_seq", ASCENDING)]
+            )
+            await self.db[OFFER_TOMBSTONES_COLLECTION].create_index([("removed_at", ASCENDING)])
+            await self.db.ingests.create_index([("collection", ASCENDING)])
+            await self._create_archive_indexes()
             
             # Templates indexes
             await templates_collection.create_index([("name", ASCENDING)])
             await templates_collection.create_index([("is_preset", ASCENDING)])
+            # find_template() matches the legacy string id alongside _id
+            await templates_collection.create_index([("id", ASCENDING)], sparse=True)
+
+            # Render jobs indexes (claim scans queued/expired jobs oldest first)
+            await self.db.jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+            await self.db.jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
             
             print("✓ Database indexes created")
         except Exception as e:
             print(f"⚠ Index creation warning: {e}")
 
+    async def _create_archive_indexes(self):
+        """Index the archive by product and, when OFFER_ARCHIVE_TTL_DAYS is set, expire it"""
+        archive = self.db[OFFER_ARCHIVE_COLLECTION]
+        await archive.create_index([("product_id", ASCENDING)])
+        if OFFER_ARCHIVE_TTL_DAYS > 0:
+            ttl_seconds = OFFER_ARCHIVE_TTL_DAYS * 86400
+            try:
+                await archive.create_index(
+                    [("archived_at", ASCENDING)], name="archived_at_ttl", expireAfterSeconds=ttl_seconds
+                )
+            except OperationFailure:
+                # The TTL changed since the index was created
+                await self.db.command({
+                    "collMod": OFFER_ARCHIVE_COLLECTION,
+                    "index": {"name": "archived_at_ttl", "expireAfterSeconds": ttl_seconds}
+                })
+
+    async def _create_offer_indexes(self, collection):
+        """Create the indexes every offers collection (or offer set) needs"""
+        # Pre-store indexes (a global unique product_id) would block per-store SKUs
+        existing = await collection.index_information()
+        for name in LEGACY_OFFER_INDEXES:
+            if name in existing:
+                await collection.drop_index(name)
+                print(f"✓ Dropped legacy offer index {collection.name}.{name}")
+
+        await collection.create_index([("store_id", ASCENDING), ("product_id", ASCENDING)], unique=True)
+        await collection.create_index([("store_id", ASCENDING), ("_id", ASCENDING)])
+        await collection.create_index([("created_at", ASCENDING)])
+        await collection.create_index([("store_id", ASCENDING), ("sync_seq", ASCENDING)])
+        await collection.create_index([("store_id", ASCENDING), ("import_batch", ASCENDING)])
+        # Selection filters: equality on store / brand / offer_type, ranges on validity and discount
+        await collection.create_index([("store_id", ASCENDING), ("brand", ASCENDING),
+                                       ("offer_type", ASCENDING), ("valid_till_date", ASCENDING)])
+        await collection.create_index([("store_id", ASCENDING), ("brand", ASCENDING), ("discount_pct", ASCENDING)])
+        await collection.create_index([("store_id", ASCENDING), ("offer_type", ASCENDING), ("discount_pct", ASCENDING)])
+        await collection.create_index([("store_id", ASCENDING), ("valid_till_date", ASCENDING), ("discount_pct", ASCENDING)])
+        # The archiver looks for lapsed offers across every store
+        await collection.create_index([("valid_till_date", ASCENDING)])
+
+    # ==================== OFFER SETS OPERATIONS ====================
+
+    async def offers_collection(self):
+        """
+        Resolve the collection offer operations should use.
+        
+        This is the active offer set named by the meta pointer (re-read at
+        most every OFFER_SET_REFRESH_SECONDS), or the offer set this service
+        view is pinned to by for_offer_set(). A view for a store listed in
+        AOPS_STORE_COLLECTIONS gets that store's own collection of the set.
+        """
+        collection = await self._offer_set_collection()
+        if not has_store_collection(self._store_id):
+            return collection
+        collection = self.db[f"{collection.name}{STORE_COLLECTION_SEPARATOR}{self._store_id}"]
+        if collection.name not in self._indexed_collections:
+            await self._create_offer_indexes(collection)
+            self._indexed_collections.add(collection.name)
+        return collection
+
+    async def _offer_set_collection(self):
+        """The active (or pinned) offer set collection shared by all stores"""
+        if self._pinned_offer_set:
+            return self.db[self._pinned_offer_set]
+        return self.db[await self._active_set_name()]
+
+    async def _active_set_name(self, refresh: bool = False) -> str:
+        """Active offer set from the meta pointer, re-read at most every OFFER_SET_REFRESH_SECONDS"""
+        active = self._active_set
+        now = time.monotonic()
+        if refresh or now - active.checked_at > OFFER_SET_REFRESH_SECONDS:
+            pointer = await self.db.meta.find_one({"_id": ACTIVE_OFFER_SET_ID})
+            active.collection = (pointer or {}).get("collection", DEFAULT_OFFERS_COLLECTION)
+            active.checked_at = now
+        return active.collection
+
+    async def _store_collection_names(self, set_name: str) -> List[str]:
+        """Dedicated store collections belonging to an offer set"""
+        prefix = f"{set_name}{STORE_COLLECTION_SEPARATOR}"
+        names = await self.db.list_collection_names()
+        return sorted(name for name in names if name.startswith(prefix))
+
+    async def _maintained_offer_collections(self) -> List[Any]:
+        """
+        Collections a maintenance job (archiving, backfills) should cover:
+        this store's collection for a store view, otherwise the shared
+        collection plus every dedicated store collection of the offer set.
+        """
+        if self._store_id:
+            return [await self.offers_collection()]
+        collection = await self._offer_set_collection()
+        return [collection] + [self.db[name] for name in await self._store_collection_names(collection.name)]
+
+    @property
+    def store_id(self) -> Optional[str]:
+        """Store this view reads and writes (None = the default store)"""
+        return self._store_id
+
+    def for_store(self, store_id: Optional[str]) -> "DatabaseService":
+        """
+        Return a view of this service whose offer operations are scoped to
+        one store: reads filter on store_id and writes stamp it. None is the
+        default store. Shares the client.
+        
+        Raises:
+            ValueError: If store_id is not a valid store id
+        """
+        view = copy.copy(self)
+        view._store_id = validate_store_id(store_id)
+        return view
+
+    def _store_query(self, filter_dict: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """A filter restricted to this view's store"""
+        return {**(filter_dict or {}), "store_id": self._store_id}
+
+    def for_offer_set(self, set_id: str) -> "DatabaseService":
+        """
+        Return a view of this service whose offer operations target one
+        offer set (e.g. while it is being built). Shares the client.
+        """
+        view = copy.copy(self)
+        view._pinned_offer_set = set_id
+        return view
+
+    async def pin_offer_set(self) -> "DatabaseService":
+        """
+        Return a view pinned to the offer set active right now, so a long
+        write keeps targeting one collection even if another set is
+        activated meanwhile. A view that is already pinned is returned as is.
+        """
+        if self._pinned_offer_set:
+            return self
+        return self.for_offer_set(await self.get_active_offer_set_id())
+
+    def for_import_batch(self, batch_id: str) -> "DatabaseService":
+        """
+        Return a view of this service that stamps import_batch on every
+        offer it inserts or updates. Shares the client.
+        """
+        view = copy.copy(self)
+        view._import_batch = batch_id
+        return view
+
+    async def create_offer_set(self, source: Optional[str] = None, mode: str = "insert") -> str:
+        """
+        Create an empty offer set collection in "building" state.
+        
+        Args:
+            source: Name of the uploaded file the set is built from
+            mode: Ingest mode used to build it
+            
+        Returns:
+            Offer set ID (also its collection name)
+        """
+        set_id = f"{OFFER_SET_PREFIX}{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        await self._create_offer_indexes(self.db[set_id])
+        now = datetime.utcnow()
+        await self.db.offer_sets.insert_one({
+            "_id": set_id,
+            "status": "building",
+            "source": source,
+            "mode": mode,
+            "created_at": now,
+            "heartbeat_at": now,
+        })
+        return set_id
+
+    async def renew_offer_set_build(self, set_id: str) -> bool:
+        """
+        Heartbeat a set's build.
+        
+        Returns:
+            False if the set is no longer building (e.g. it was marked stale)
+        """
+        result = await self.db.offer_sets.update_one(
+            {"_id": set_id, "status": "building"},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    async def fail_stale_offer_sets(self) -> List[str]:
+        """
+        Mark builds that stopped heartbeating (the process running them
+        restarted) as failed and drop their collections.
+        
+        Returns:
+            IDs of the sets marked failed
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=OFFER_SET_BUILD_LEASE_SECONDS)
+        cursor = self.db.offer_sets.find({"status": "building", "heartbeat_at": {"$lt": cutoff}}, {"_id": 1})
+        failed = []
+        async for offer_set in cursor:
+            result = await self.db.offer_sets.update_one(
+                {"_id": offer_set["_id"], "status": "building", "heartbeat_at": {"$lt": cutoff}},
+                {"$set": {"status": "failed", "error": "Build stopped responding (server restarted?)",
+                          "completed_at": datetime.utcnow()}}
+            )
+            if result.modified_count:
+                await self.db[offer_set["_id"]].drop()
+                failed.append(offer_set["_id"])
+                print(f"⚠ Offer set {offer_set['_id']} build went stale; marked failed")
+        return failed
+
+    async def get_offer_set(self, set_id: str) -> Optional[Dict[str, Any]]:
+        """Get an offer set's metadata"""
+        return await self.db.offer_sets.find_one({"_id": set_id})
+
+    async def list_offer_sets(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """List offer sets, newest first"""
+        cursor = self.db.offer_sets.find({"status": {"$ne": "dropped"}}).sort("created_at", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_active_offer_set_id(self) -> str:
+        """Collection name of the active offer set (fresh read of the pointer)"""
+        return await self._active_set_name(refresh=True)
+
+    async def complete_offer_set(self, set_id: str, stats: Dict[str, Any], activate: bool = True):
+        """
+        Mark a built offer set ready and (by default) make it the active set.
+        
+        Args:
+            set_id: Offer set ID
+            stats: Ingest counters to record on the set
+            activate: Switch the active pointer to this set
+        """
+        result = await self.db.offer_sets.update_one(
+            {"_id": set_id, "status": "building"},
+            {"$set": {"status": "ready", "completed_at": datetime.utcnow(), "stats": stats}}
+        )
+        if activate and result.modified_count:
+            await self.activate_offer_set(set_id)
+
+    async def fail_offer_set(self, set_id: str, error: str):
+        """Drop a set whose build failed and record the error"""
+        await self.db[set_id].drop()
+        await self.db.offer_sets.update_one(
+            {"_id": set_id},
+            {"$set": {"status": "failed", "error": error, "completed_at": datetime.utcnow()}}
+        )
+
+    async def activate_offer_set(self, set_id: str):
+        """
+        Atomically point offer reads and writes at a ready or retired set,
+        retire the previously active one and prune old retired sets.
+        
+        Raises:
+            ValueError: If the set does not exist or is not ready
+        """
+        offer_set = await self.get_offer_set(set_id)
+        if not offer_set or offer_set.get("status") not in ("ready", "retired", "active"):
+            raise ValueError(f"Offer set {set_id} is not ready")
+
+        previous = await self.get_active_offer_set_id()
+        if previous == set_id:
+            return
+
+        # The single pointer update is the switch; readers see old or new, never a mix
+        await self.db.meta.update_one(
+            {"_id": ACTIVE_OFFER_SET_ID},
+            {"$set": {"collection": set_id, "activated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        self._active_set.collection = set_id
+        self._active_set.checked_at = time.monotonic()
+
+        await self.db.offer_sets.update_one(
+            {"_id": set_id},
+            {"$set": {"status": "active", "activated_at": datetime.utcnow()}}
+        )
+        # The legacy collection becomes an ordinary retired set the first time
+        await self.db.offer_sets.update_one(
+            {"_id": previous},
+            {"$set": {"status": "retired", "retired_at": datetime.utcnow()},
+             "$setOnInsert": {"created_at": datetime.utcnow(), "source": None}},
+            upsert=True
+        )
+        print(f"✓ Active offer set: {previous} → {set_id}")
+        await self.prune_offer_sets()
+
+    async def prune_offer_sets(self, keep: int = OFFER_SETS_KEPT) -> List[str]:
+        """
+        Drop retired offer sets beyond the `keep` most recently retired.
+        
+        Returns:
+            IDs of dropped sets
+        """
+        cursor = self.db.offer_sets.find({"status": "retired"}).sort("retired_at", -1).skip(keep)
+        dropped = []
+        async for offer_set in cursor:
+            await self.drop_offer_set(offer_set["_id"])
+            dropped.append(offer_set["_id"])
+        return dropped
+
+    async def drop_offer_set(self, set_id: str):
+        """
+        Drop an inactive offer set's collection in one operation.
+        
+        Raises:
+            ValueError: If the set is the active one or still building
+        """
+        if set_id == await self.get_active_offer_set_id():
+            raise ValueError("Cannot drop the active offer set")
+        await self.fail_stale_offer_sets()
+        offer_set = await self.get_offer_set(set_id)
+        if offer_set and offer_set.get("status") == "building":
+            raise ValueError("Offer set is still building")
+        await self.db[set_id].drop()
+        await self._offers_removed(set_id)
+        for name in await self._store_collection_names(set_id):
+            await self.db[name].drop()
+            self._indexed_collections.discard(name)
+            await self._offers_removed(name)
+        await self.db.ingests.delete_many({"collection": set_id})
+        await self.db.offer_sets.update_one(
+            {"_id": set_id},
+            {"$set": {"status": "dropped", "dropped_at": datetime.utcnow()}}
+        )
+        print(f"✓ Dropped offer set: {set_id}")
+
+    # ==================== INGEST RECORDS OPERATIONS ====================
+
+    async def ingest_key(self, file_hash: str, mode: str) -> str:
+        """Key of an upload: same file, same mode, same target collection and store"""
+        collection = await self.offers_collection()
+        if self._store_id:
+            return f"{collection.name}:{self._store_id}:{mode}:{file_hash}"
+        return f"{collection.name}:{mode}:{file_hash}"
+
+    async def claim_ingest(self, key: str, info: Dict[str, Any], owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Record that an upload is being ingested.
+        
+        A "processing" claim whose heartbeat (see renew_ingest_claim) is
+        older than INGEST_CLAIM_LEASE_SECONDS is taken over, so an upload
+        interrupted by a crash or redeploy can be sent again.
+        
+        Args:
+            key: Key from ingest_key()
+            info: Extra fields to store (file hash, filename, mode)
+            owner: Unique id of this claim attempt
+            
+        Returns:
+            None if this caller claimed the upload, otherwise the existing
+            record (status "processing" or "done")
+        """
+        collection = await self.offers_collection()
+        now = datetime.utcnow()
+        try:
+            await self.db.ingests.insert_one({
+                "_id": key,
+                "collection": collection.name,
+                "store_id": self._store_id,
+                "status": "processing",
+                "owner": owner,
+                "created_at": now,
+                "claimed_at": now,
+                "heartbeat_at": now,
+                **info
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        cutoff = now - timedelta(seconds=INGEST_CLAIM_LEASE_SECONDS)
+        taken = await self.db.ingests.find_one_and_update(
+            {"_id": key, "status": "processing", "$or": [
+                {"heartbeat_at": {"$lt": cutoff}},
+                {"heartbeat_at": {"$exists": False}},
+            ]},
+            {"$set": {"owner": owner, "claimed_at": now, "heartbeat_at": now, **info}}
+        )
+        if taken is not None:
+            print(f"⚠ Took over stale ingest claim {key} ({taken.get('filename')})")
+            return None
+        return await self.db.ingests.find_one({"_id": key})
+
+    async def renew_ingest_claim(self, key: str, owner: str) -> bool:
+        """
+        Heartbeat an ingest claim.
+        
+        Returns:
+            False if the claim was taken over or released
+        """
+        result = await self.db.ingests.update_one(
+            {"_id": key, "status": "processing", "owner": owner},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    async def get_ingest(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get an ingest record"""
+        return await self.db.ingests.find_one({"_id": key})
+
+    async def complete_ingest(self, key: str, result: Dict[str, Any]):
+        """Store the response of a finished ingest for replay"""
+        await self.db.ingests.update_one(
+            {"_id": key},
+            {"$set": {"status": "done", "result": result, "completed_at": datetime.utcnow()}}
+        )
+
+    async def release_ingest(self, key: str, owner: str):
+        """Forget a claimed ingest that failed so the file can be retried"""
+        await self.db.ingests.delete_one({"_id": key, "status": "processing", "owner": owner})
+
     # ==================== OFFERS OPERATIONS ====================
 
     async def save_offers_bulk(self, offers: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -74,58 +661,447 @@ class DatabaseService:
             offers: List of offer dictionaries
             
         Returns:
-            Number of inserted documents
+            { inserted_count, duplicates, failed_count, write_errors }
         """
         if not offers:
-            return {"inserted_count": 0, "duplicates": []}
+            return {"inserted_count": 0, "duplicates": [], "failed_count": 0, "write_errors": []}
 
         try:
-            # Use unordered inserts so one duplicate doesn't abort the whole batch.
-            result = await self.db.offers.insert_many(offers, ordered=False)
+            collection = await self.offers_collection()
+            self.invalidate_offer_count(collection.name)
+            async with self._sync_write(len(offers)) as first_seq:
+                self._stamp_sync_fields(offers, first_seq)
+                # Use unordered inserts so one duplicate doesn't abort the whole batch.
+                result = await collection.insert_many(offers, ordered=False)
             inserted = len(result.inserted_ids)
-            return {"inserted_count": inserted, "duplicates": []}
+            return {"inserted_count": inserted, "duplicates": [], "failed_count": 0, "write_errors": []}
         except BulkWriteError as bwe:
             # BulkWriteError.details contains useful counters and writeErrors
             details = getattr(bwe, "details", {}) or {}
             inserted = details.get("nInserted", 0)
             write_errors = details.get("writeErrors", []) or []
 
-            # Collect duplicate product_ids when possible
+            # Collect duplicate product_ids when possible; other errors are reported as failures
             dup_ids = []
+            failed = []
             for we in write_errors:
                 # Prefer op.product_id, fallback to keyValue
                 op = we.get("op") or {}
                 key_value = we.get("keyValue") or {}
                 pid = op.get("product_id") or key_value.get("product_id")
-                if pid:
+                if we.get("code") == DUPLICATE_KEY_ERROR and pid:
                     dup_ids.append(pid)
+                else:
+                    failed.append(_write_error_summary(we, pid))
 
-            print(f"⚠ BulkWriteError while inserting offers: inserted={inserted}, duplicates={dup_ids}")
-            return {"inserted_count": inserted, "duplicates": dup_ids}
+            print(f"⚠ BulkWriteError while inserting offers: inserted={inserted}, "
+                  f"duplicates={len(dup_ids)}, failed={len(failed)}")
+            return {"inserted_count": inserted, "duplicates": dup_ids,
+                    "failed_count": len(failed), "write_errors": failed}
         except Exception as e:
             print(f"✗ Error inserting offers: {e}")
             raise
 
+    async def upsert_offers_bulk(self, offers: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Insert or update offers keyed by product_id, skipping unchanged rows.
+        
+        Each offer's content hash is compared with the stored hash; only new
+        or changed offers are written, in one unordered bulk_write of
+        UpdateOne(upsert=True) operations. A view from for_import_batch()
+        also stamps its batch on unchanged rows (without a new sync_seq),
+        so import_batch selects every offer of an upload.
+        
+        Args:
+            offers: List of offer dictionaries
+            
+        Upserts racing another writer for the same new product_id (parallel
+        import workers) can fail with E11000; those are retried, when the
+        offer now exists and is updated. Errors left over are reported in
+        write_errors, not dropped.
+        
+        Returns:
+            { inserted_count, updated_count, unchanged_count, duplicates, failed_count, write_errors }
+        """
+        result = {"inserted_count": 0, "updated_count": 0, "unchanged_count": 0, "duplicates": [],
+                  "failed_count": 0, "write_errors": []}
+        if not offers:
+            return result
+
+        try:
+            # Repeated product_ids within a batch: the last row wins
+            by_pid: Dict[str, Dict[str, Any]] = {}
+            for offer in offers:
+                if offer["product_id"] in by_pid:
+                    result["duplicates"].append(offer["product_id"])
+                by_pid[offer["product_id"]] = offer
+
+            for offer in by_pid.values():
+                offer["content_hash"] = offer_content_hash(offer)
+
+            cursor = (await self.offers_collection()).find(
+                self._store_query({"product_id": {"$in": list(by_pid.keys())}}),
+                {"product_id": 1, "content_hash": 1}
+            )
+            existing = {doc["product_id"]: doc.get("content_hash") async for doc in cursor}
+
+            changed = [o for pid, o in by_pid.items() if existing.get(pid) != o["content_hash"]]
+            result["unchanged_count"] = len(by_pid) - len(changed)
+            collection = await self.offers_collection()
+            if self._import_batch and result["unchanged_count"]:
+                unchanged = [pid for pid, o in by_pid.items() if existing.get(pid) == o["content_hash"]]
+                await collection.update_many(
+                    self._store_query({"product_id": {"$in": unchanged}}),
+                    {"$set": {"import_batch": self._import_batch}}
+                )
+            if not changed:
+                return result
+
+            self.invalidate_offer_count(collection.name)
+            async with self._sync_write(len(changed)) as first_seq:
+                operations = []
+                for i, offer in enumerate(changed):
+                    fields = {k: v for k, v in offer.items() if k not in ("_id", "created_at")}
+                    fields["sync_seq"] = first_seq + i
+                    fields["store_id"] = self._store_id
+                    if self._import_batch:
+                        fields["import_batch"] = self._import_batch
+                    operations.append(UpdateOne(
+                        {"store_id": self._store_id, "product_id": offer["product_id"]},
+                        {"$set": fields, "$setOnInsert": {"created_at": offer.get("created_at") or datetime.utcnow()}},
+                        upsert=True
+                    ))
+                await self._bulk_upsert(collection, operations, [o["product_id"] for o in changed], result)
+            if result["write_errors"]:
+                print(f"⚠ BulkWriteError while upserting offers: {result['failed_count']} rows failed")
+            return result
+        except Exception as e:
+            print(f"✗ Error upserting offers: {e}")
+            raise
+
+    @staticmethod
+    async def _bulk_upsert(collection, operations: List[UpdateOne], product_ids: List[str], result: Dict[str, Any]):
+        """Run upserts unordered, retrying the ones that lost an insert race, and count into result"""
+        for attempt in range(UPSERT_DUPLICATE_RETRIES + 1):
+            try:
+                write = await collection.bulk_write(operations, ordered=False)
+                result["inserted_count"] += write.upserted_count
+                result["updated_count"] += write.modified_count
+                return
+            except BulkWriteError as bwe:
+                details = getattr(bwe, "details", {}) or {}
+                result["inserted_count"] += details.get("nUpserted", 0)
+                result["updated_count"] += details.get("nModified", 0)
+                retry = []
+                for we in details.get("writeErrors", []) or []:
+                    index = we.get("index", -1)
+                    pid = product_ids[index] if 0 <= index < len(product_ids) else None
+                    if we.get("code") == DUPLICATE_KEY_ERROR and attempt < UPSERT_DUPLICATE_RETRIES:
+                        retry.append(index)
+                    else:
+                        result["write_errors"].append(_write_error_summary(we, pid))
+                        result["failed_count"] += 1
+                if not retry:
+                    return
+                operations = [operations[i] for i in retry]
+                product_ids = [product_ids[i] for i in retry]
+
+    async def backfill_offer_fields(self, batch_size: int = 1000) -> int:
+        """
+        Add valid_till_date and the pricing fields to offers ingested before
+        they were computed at ingest time. Content hashes and sync_seq are
+        left alone since the label content does not change.
+        
+        The missing-field query cannot use an index, so each collection is
+        scanned once: finished collections are recorded in meta and skipped
+        on later starts until the list of derived fields changes.
+        
+        Returns:
+            Number of offers updated
+        """
+        from app.services.ingest import derive_offer_fields, PRICING_FIELDS
+
+        derived_fields = ("valid_till_date",) + PRICING_FIELDS
+        missing = {"$or": [{field: {"$exists": False}} for field in derived_fields]}
+        updated = 0
+        try:
+            marker = await self.db.meta.find_one({"_id": OFFER_FIELDS_BACKFILL_ID}) or {}
+            if marker.get("fields") != list(derived_fields):
+                await self.db.meta.update_one(
+                    {"_id": OFFER_FIELDS_BACKFILL_ID},
+                    {"$set": {"fields": list(derived_fields), "collections": []}},
+                    upsert=True
+                )
+                marker = {}
+            done = set(marker.get("collections") or [])
+            for collection in await self._maintained_offer_collections():
+                if collection.name in done:
+                    continue
+                while True:
+                    cursor = collection.find(missing, {"price": 1, "mrp": 1, "valid_till": 1}).limit(batch_size)
+                    docs = await cursor.to_list(length=batch_size)
+                    if not docs:
+                        break
+                    operations = []
+                    for doc in docs:
+                        derived = derive_offer_fields(dict(doc))
+                        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                            field: derived[field] for field in derived_fields
+                        }}))
+                    await collection.bulk_write(operations, ordered=False)
+                    updated += len(operations)
+                await self.db.meta.update_one(
+                    {"_id": OFFER_FIELDS_BACKFILL_ID},
+                    {"$addToSet": {"collections": collection.name}, "$set": {"updated_at": datetime.utcnow()}}
+                )
+            if updated:
+                print(f"✓ Backfilled typed fields on {updated} offers")
+            return updated
+        except Exception as e:
+            print(f"✗ Error backfilling offer fields: {e}")
+            return updated
+
+    async def next_sequence(self, name: str, count: int = 1) -> int:
+        """
+        Reserve `count` consecutive values from a named counter.
+        
+        Args:
+            name: Counter name
+            count: Number of values to reserve
+            
+        Returns:
+            First reserved value
+        """
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"value": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["value"] - count + 1
+
+    def invalidate_offer_count(self, collection_name: Optional[str] = None):
+        """Drop the cached totals for a collection, every store (all collections if None)"""
+        if collection_name is None:
+            self._offer_counts.clear()
+        else:
+            for key in [key for key in self._offer_counts if key[0] == collection_name]:
+                self._offer_counts.pop(key, None)
+
+    async def _offers_removed(self, collection_name: str):
+        """
+        Record that a collection was cleared or dropped: bumps its removal
+        counter (so changes-feed tokens and other processes' search indexes
+        see it) and drops this process's cached totals and search indexes.
+        Offers removed one by one are recorded with _record_removed_offers().
+        """
+        from app.services.search import invalidate_offer_search
+
+        self.invalidate_offer_count(collection_name)
+        invalidate_offer_search(collection_name)
+        await self.next_sequence(f"{OFFERS_REMOVED_COUNTER_PREFIX}{collection_name}")
+
+    async def offers_removed_epoch(self) -> int:
+        """How many times this view's collection was cleared or dropped"""
+        collection = await self.offers_collection()
+        counter = await self.db.counters.find_one({"_id": f"{OFFERS_REMOVED_COUNTER_PREFIX}{collection.name}"})
+        return (counter or {}).get("value", 0)
+
+    @asynccontextmanager
+    async def _sync_write(self, count: int):
+        """
+        Reserve `count` sync_seq values for a write, yielding the first.
+
+        A lease is held until the write finishes so sync_watermark() stays
+        below the reserved range; the lease floor is read from the counter
+        before reserving, so a reader can never miss a range in flight.
+        """
+        counter = await self.db.counters.find_one({"_id": SYNC_SEQ_COUNTER})
+        lease_id = uuid.uuid4().hex
+        await self.db.sync_leases.insert_one({
+            "_id": lease_id,
+            "floor": (counter or {}).get("value", 0) + 1,
+            "expires_at": datetime.utcnow() + timedelta(seconds=SYNC_LEASE_SECONDS),
+        })
+        try:
+            yield await self.next_sequence(SYNC_SEQ_COUNTER, count)
+        finally:
+            await self.db.sync_leases.delete_one({"_id": lease_id})
+
+    async def _record_removed_offers(self, collection_name: str, docs: List[Dict[str, Any]]):
+        """
+        Leave a tombstone with a fresh sync_seq for each removed offer, so
+        the changes feed and search indexes pick up the removal like a write.
+        
+        Args:
+            collection_name: Collection the offers were deleted from
+            docs: Removed offer documents (product_id and store_id are kept)
+        """
+        if not docs:
+            return
+        self.invalidate_offer_count(collection_name)
+        now = datetime.utcnow()
+        async with self._sync_write(len(docs)) as first_seq:
+            await self.db[OFFER_TOMBSTONES_COLLECTION].insert_many([
+                {
+                    "collection": collection_name,
+                    "store_id": doc.get("store_id"),
+                    "product_id": doc.get("product_id"),
+                    "sync_seq": first_seq + i,
+                    "removed_at": now,
+                }
+                for i, doc in enumerate(docs)
+            ], ordered=False)
+
+    async def get_offers_removed_since(
+        self, seq: int, limit: int = 500, until: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve offers removed after a sync sequence, oldest removal first.
+        
+        Args:
+            seq: Last sync sequence the caller has processed
+            limit: Maximum tombstones to return (0 = no limit)
+            until: Highest sync sequence to return (see sync_watermark())
+            
+        Returns:
+            List of { product_id, sync_seq } ordered by sync_seq
+        """
+        try:
+            seq_range = {"$gt": seq}
+            if until is not None:
+                seq_range["$lte"] = until
+            collection = await self.offers_collection()
+            cursor = self.db[OFFER_TOMBSTONES_COLLECTION].find(
+                self._store_query({"collection": collection.name, "sync_seq": seq_range}),
+                {"_id": 0, "product_id": 1, "sync_seq": 1}
+            ).sort("sync_seq", ASCENDING)
+            if limit:
+                cursor = cursor.limit(limit)
+            return await cursor.to_list(length=limit or None)
+        except Exception as e:
+            print(f"✗ Error fetching removed offers: {e}")
+            raise
+
+    async def tombstones_pruned_seq(self) -> int:
+        """Highest sync_seq whose tombstones may have been pruned (0 = none)"""
+        marker = await self.db.meta.find_one({"_id": OFFER_TOMBSTONES_PRUNED_ID})
+        return (marker or {}).get("seq", 0)
+
+    async def prune_offer_tombstones(self, ttl_days: int = SYNC_TOMBSTONE_TTL_DAYS) -> int:
+        """
+        Delete tombstones older than ttl_days.
+        
+        The pruned sync_seq is recorded before deleting, so a reader that
+        checks tombstones_pruned_seq() after reading tombstones never misses
+        one silently.
+        
+        Returns:
+            Number of deleted tombstones
+        """
+        if ttl_days <= 0:
+            return 0
+        tombstones = self.db[OFFER_TOMBSTONES_COLLECTION]
+        cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+        newest = await tombstones.find_one(
+            {"removed_at": {"$lt": cutoff}}, {"sync_seq": 1}, sort=[("sync_seq", -1)]
+        )
+        if not newest:
+            return 0
+        await self.db.meta.update_one(
+            {"_id": OFFER_TOMBSTONES_PRUNED_ID},
+            {"$max": {"seq": newest["sync_seq"]}},
+            upsert=True
+        )
+        result = await tombstones.delete_many({"sync_seq": {"$lte": newest["sync_seq"]}})
+        if result.deleted_count:
+            print(f"✓ Pruned {result.deleted_count} offer tombstones")
+        return result.deleted_count
+
+    async def sync_watermark(self) -> int:
+        """
+        Highest sync_seq below which every offer write has committed.
+
+        The counter is read before the leases: a writer takes its lease
+        before reserving, so any range at or below the counter value that is
+        still being written has a lease visible to the second read.
+        """
+        counter = await self.db.counters.find_one({"_id": SYNC_SEQ_COUNTER})
+        value = (counter or {}).get("value", 0)
+        lease = await self.db.sync_leases.find_one(
+            {"expires_at": {"$gt": datetime.utcnow()}}, sort=[("floor", ASCENDING)]
+        )
+        return min(value, lease["floor"] - 1) if lease else value
+
+    def _stamp_sync_fields(self, offers: List[Dict[str, Any]], first_seq: int):
+        """Set content_hash and a reserved sync_seq on offers about to be written"""
+        for i, offer in enumerate(offers):
+            offer["content_hash"] = offer_content_hash(offer)
+            offer["sync_seq"] = first_seq + i
+            offer["store_id"] = self._store_id
+            if self._import_batch:
+                offer["import_batch"] = self._import_batch
+
+    async def get_offers_changed_since(
+        self, seq: int, limit: int = 500, until: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve offers written after a sync sequence, oldest change first.
+        
+        Args:
+            seq: Last sync sequence the caller has processed
+            limit: Maximum documents to return
+            until: Highest sync sequence to return (see sync_watermark())
+            
+        Returns:
+            List of offer documents ordered by sync_seq
+        """
+        try:
+            seq_range = {"$gt": seq}
+            if until is not None:
+                seq_range["$lte"] = until
+            cursor = (await self.offers_collection()).find(
+                self._store_query({"sync_seq": seq_range})
+            ).sort("sync_seq", ASCENDING).limit(limit)
+            return await cursor.to_list(length=limit)
+        except Exception as e:
+            print(f"✗ Error fetching changed offers: {e}")
+            raise
+
     async def get_offers(
         self, 
         skip: int = 0, 
         limit: int = 50,
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        after_id: Optional[Any] = None,
+        fields: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """
-        Retrieve offers with pagination.
+        Retrieve offers with pagination, ordered by _id.
+        
+        Pass after_id (the last _id of the previous page) for keyset
+        pagination, which seeks on the _id index instead of skipping; skip
+        is kept for older clients.
         
         Args:
-            skip: Number of documents to skip
+            skip: Number of documents to skip (ignored with after_id)
             limit: Maximum documents to return
             filter_dict: Optional MongoDB filter query
+            after_id: Return offers whose _id sorts after this one
+            fields: Only load these fields (see offer_projection)
             
         Returns:
             List of offer documents
         """
         try:
-            query = filter_dict or {}
-            cursor = self.db.offers.find(query).skip(skip).limit(limit)
+            query = self._store_query(filter_dict)
+            collection = await self.offers_collection()
+            projection = offer_projection(fields)
+            if after_id is not None:
+                query["_id"] = {"$gt": after_id}
+                cursor = collection.find(query, projection).sort("_id", ASCENDING).limit(limit)
+            else:
+                cursor = collection.find(query, projection).sort("_id", ASCENDING).skip(skip).limit(limit)
             return await cursor.to_list(length=limit)
         except Exception as e:
             print(f"✗ Error fetching offers: {e}")
@@ -143,17 +1119,22 @@ class DatabaseService:
         """
         try:
             from bson.objectid import ObjectId
-            return await self.db.offers.find_one({"_id": ObjectId(offer_id)})
+            return await (await self.offers_collection()).find_one(self._store_query({"_id": ObjectId(offer_id)}))
         except Exception as e:
             print(f"✗ Error fetching offer: {e}")
             return None
 
-    async def get_offers_by_ids(self, offer_ids: List[str]) -> List[Dict[str, Any]]:
+    async def get_offers_by_ids(
+        self,
+        offer_ids: List[str],
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve multiple offers by their IDs.
         
         Args:
             offer_ids: List of offer ObjectIds as strings
+            fields: Only load these fields (see offer_projection)
             
         Returns:
             List of offer documents
@@ -161,12 +1142,65 @@ class DatabaseService:
         try:
             from bson.objectid import ObjectId
             object_ids = [ObjectId(oid) for oid in offer_ids]
-            cursor = self.db.offers.find({"_id": {"$in": object_ids}})
+            cursor = (await self.offers_collection()).find(
+                self._store_query({"_id": {"$in": object_ids}}), offer_projection(fields)
+            )
             return await cursor.to_list(length=len(offer_ids))
         except Exception as e:
             print(f"✗ Error fetching offers by ids: {e}")
             raise
 
+    async def load_offers_by_ids(
+        self,
+        offer_ids: List[str],
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve offers by id, sharing one `$in` query with the lookups other
+        requests make at the same moment (see OfferBatcher).
+        
+        Args:
+            offer_ids: List of offer ObjectIds as strings
+            fields: Fields the caller needs (see offer_projection)
+            
+        Returns:
+            Offer documents in the order of offer_ids
+        """
+        return await self._offer_batcher.load(self, offer_ids, fields)
+
+    async def iter_offers(
+        self,
+        filter_dict: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        limit: int = 0,
+        batch_size: int = OFFER_STREAM_BATCH_SIZE
+    ):
+        """
+        Stream offers matching a filter in _id order, one batch at a time.
+        
+        Args:
+            filter_dict: MongoDB filter query
+            fields: Only load these fields (see offer_projection)
+            limit: Maximum offers to return (0 = no limit)
+            batch_size: Offers per yielded list (and per cursor round trip)
+            
+        Yields:
+            Lists of offer documents
+        """
+        cursor = (await self.offers_collection()).find(
+            self._store_query(filter_dict), offer_projection(fields), batch_size=batch_size
+        ).sort("_id", ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        batch: List[Dict[str, Any]] = []
+        async for offer in cursor:
+            batch.append(offer)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     async def count_offers(self, filter_dict: Optional[Dict[str, Any]] = None) -> int:
         """
         Count total offers matching filter.
@@ -178,26 +1212,173 @@ class DatabaseService:
             Total count
         """
         try:
-            query = filter_dict or {}
-            return await self.db.offers.count_documents(query)
+            query = self._store_query(filter_dict)
+            return await (await self.offers_collection()).count_documents(query)
         except Exception as e:
             print(f"✗ Error counting offers: {e}")
             return 0
 
+    async def count_offers_cached(self) -> int:
+        """
+        Total offers of this view's store, cached per collection and store
+        until the next write or OFFER_COUNT_TTL_SECONDS.
+        
+        A dedicated store collection is counted from its metadata
+        (estimated_document_count); a shared one counts the store's entries
+        in the store-led index.
+        """
+        collection = await self.offers_collection()
+        key = (collection.name, self._store_id)
+        cached = self._offer_counts.get(key)
+        now = time.monotonic()
+        if cached and now - cached[1] < OFFER_COUNT_TTL_SECONDS:
+            return cached[0]
+        try:
+            if has_store_collection(self._store_id):
+                count = await collection.estimated_document_count()
+            else:
+                count = await collection.count_documents(self._store_query())
+        except Exception as e:
+            print(f"✗ Error counting offers: {e}")
+            return cached[0] if cached else 0
+        self._offer_counts[key] = (count, now)
+        return count
+
     async def delete_all_offers(self) -> int:
         """
-        Delete all offers from the database.
+        Delete all offers from the database (see reset_offers()).
         
         Returns:
             Number of deleted documents
         """
+        result = await self.reset_offers()
+        return result["deleted_count"]
+
+    async def reset_offers(self) -> Dict[str, Any]:
+        """
+        Empty the active offers collection by dropping and recreating it.
+        
+        Dropping is a single metadata operation instead of one delete (and
+        one oplog entry) per document; the indexes are rebuilt on the empty
+        collection by _create_indexes(). A store view of the shared
+        collection deletes only that store's offers; a store with a
+        dedicated collection has it dropped.
+        
+        Returns:
+            { deleted_count, elapsed_seconds }
+        """
         try:
-            result = await self.db.offers.delete_many({})
-            return result.deleted_count
+            started = time.perf_counter()
+            collection = await self.offers_collection()
+            if self._store_id:
+                return await self._reset_store_offers(collection, started)
+            count = await collection.estimated_document_count()
+            await collection.drop()
+            # Dedicated store collections are part of the catalog being reset
+            dropped = [collection.name]
+            for name in await self._store_collection_names(collection.name):
+                count += await self.db[name].estimated_document_count()
+                await self.db[name].drop()
+                self._indexed_collections.discard(name)
+                dropped.append(name)
+            for name in dropped:
+                await self._offers_removed(name)
+            # Files ingested into the dropped collections may be uploaded again
+            await self.db.ingests.delete_many({"collection": {"$in": dropped}})
+            await self._create_indexes()
+            elapsed = time.perf_counter() - started
+            print(f"✓ Offers collection {collection.name} reset ({count} offers) in {elapsed:.2f}s")
+            return {"deleted_count": count, "elapsed_seconds": round(elapsed, 3)}
         except Exception as e:
             print(f"✗ Error deleting offers: {e}")
             raise
 
+    async def _reset_store_offers(self, collection, started: float) -> Dict[str, Any]:
+        """Remove one store's offers and its ingest records"""
+        if has_store_collection(self._store_id):
+            count = await collection.estimated_document_count()
+            await collection.drop()
+            self._indexed_collections.discard(collection.name)
+        else:
+            result = await collection.delete_many(self._store_query())
+            count = result.deleted_count
+        await self._offers_removed(collection.name)
+        await self.db.ingests.delete_many({"collection": collection.name, "store_id": self._store_id})
+        elapsed = time.perf_counter() - started
+        print(f"✓ Offers of store {self._store_id} reset ({count} offers) in {elapsed:.2f}s")
+        return {"deleted_count": count, "elapsed_seconds": round(elapsed, 3)}
+
+    async def archive_expired_offers(
+        self,
+        cutoff: Optional[datetime] = None,
+        batch_size: int = 1000
+    ) -> Dict[str, Any]:
+        """
+        Move lapsed offers from the active collection (and its dedicated
+        store collections) to the archive; a store view archives only that
+        store's offers.
+        
+        An offer is lapsed when its valid_till_date is before the cutoff;
+        offers without a parsed expiry date are never archived. Each batch is
+        copied with idempotent upserts before it is deleted, so a run that is
+        interrupted (or races another instance) loses nothing. Archived
+        offers leave tombstones for the changes feed (see
+        _record_removed_offers()), so clients are not forced into a resync.
+        
+        Args:
+            cutoff: Archive offers valid only until before this moment
+                    (default: today's midnight UTC minus OFFER_ARCHIVE_GRACE_DAYS)
+            batch_size: Offers moved per round trip
+            
+        Returns:
+            { archived_count, cutoff, elapsed_seconds }
+        """
+        if cutoff is None:
+            today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+            cutoff = today - timedelta(days=OFFER_ARCHIVE_GRACE_DAYS)
+        started = time.perf_counter()
+        archive = self.db[OFFER_ARCHIVE_COLLECTION]
+        lapsed = {"valid_till_date": {"$lt": cutoff}}
+        if self._store_id and not has_store_collection(self._store_id):
+            lapsed = self._store_query(lapsed)
+        archived = 0
+        try:
+            for collection in await self._maintained_offer_collections():
+                moved = 0
+                while True:
+                    docs = await collection.find(lapsed).limit(batch_size).to_list(length=batch_size)
+                    if not docs:
+                        break
+                    now = datetime.utcnow()
+                    await archive.bulk_write([
+                        ReplaceOne(
+                            {"_id": doc["_id"]},
+                            {**doc, "archived_at": now, "archived_from": collection.name},
+                            upsert=True
+                        )
+                        for doc in docs
+                    ], ordered=False)
+                    # Re-check the cutoff so an offer re-ingested with a new date meanwhile stays
+                    ids = [doc["_id"] for doc in docs]
+                    result = await collection.delete_many({"_id": {"$in": ids}, **lapsed})
+                    moved += result.deleted_count
+                    if result.deleted_count == 0:
+                        break
+                    kept = {
+                        doc["_id"] async for doc in collection.find({"_id": {"$in": ids}}, {"_id": 1})
+                    }
+                    await self._record_removed_offers(
+                        collection.name, [doc for doc in docs if doc["_id"] not in kept]
+                    )
+                if moved:
+                    print(f"✓ Archived {moved} expired offers from {collection.name}")
+                archived += moved
+            elapsed = time.perf_counter() - started
+            return {"archived_count": archived, "cutoff": cutoff, "elapsed_seconds": round(elapsed, 3)}
+        except Exception as e:
+            print(f"✗ Error archiving expired offers: {e}")
+            raise
+
     # ==================== TEMPLATES OPERATIONS ====================
 
     async def save_template(self, template: Dict[str, Any]) -> str:
@@ -217,6 +1398,47 @@ class DatabaseService:
             print(f"✗ Error saving template: {e}")
             raise
 
+    async def upsert_preset_template(self, template: Dict[str, Any]) -> str:
+        """
+        Insert or refresh a preset template, keyed by its name, so its _id
+        (held by queued render jobs and clients) survives restarts.
+        
+        Args:
+            template: Preset template document
+            
+        Returns:
+            Template document ID
+        """
+        try:
+            fields = {k: v for k, v in template.items() if k not in ("_id", "created_at")}
+            fields["updated_at"] = datetime.utcnow()
+            doc = await self.db.templates.find_one_and_update(
+                {"is_preset": True, "name": template["name"]},
+                {"$set": fields, "$setOnInsert": {"created_at": template.get("created_at") or datetime.utcnow()}},
+                upsert=True,
+                sort=[("_id", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            return str(doc["_id"])
+        except Exception as e:
+            print(f"✗ Error saving preset template: {e}")
+            raise
+
+    async def delete_preset_templates(self, keep_ids: List[str]) -> int:
+        """
+        Delete preset templates other than the given ones (retired presets
+        and duplicates left by older startups).
+        
+        Returns:
+            Number of deleted templates
+        """
+        from bson.objectid import ObjectId
+
+        result = await self.db.templates.delete_many(
+            {"is_preset": True, "_id": {"$nin": [ObjectId(tid) for tid in keep_ids]}}
+        )
+        return result.deleted_count
+
     async def get_templates(self) -> List[Dict[str, Any]]:
         """
         Retrieve all templates (preset and custom).
@@ -248,6 +1470,27 @@ class DatabaseService:
             print(f"✗ Error fetching template: {e}")
             return None
 
+    async def find_template(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a template by its ObjectId or by the string `id` field some
+        templates were stored with, in a single query.
+        
+        Args:
+            template_id: ObjectId or string id
+            
+        Returns:
+            Template document or None if not found
+        """
+        try:
+            from bson.objectid import ObjectId
+            query: Dict[str, Any] = {"id": template_id}
+            if ObjectId.is_valid(template_id):
+                query = {"$or": [{"_id": ObjectId(template_id)}, query]}
+            return await self.db.templates.find_one(query)
+        except Exception as e:
+            print(f"✗ Error fetching template: {e}")
+            return None
+
     async def get_preset_templates(self) -> List[Dict[str, Any]]:
         """
         Retrieve only preset templates.
@@ -315,6 +1558,271 @@ class DatabaseService:
             print(f"✗ Error updating template layout: {e}")
             raise
 
+    # ==================== RENDER JOBS OPERATIONS ====================
+
+    async def enqueue_job(self, kind: str, payload: Dict[str, Any], max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        """
+        Insert a new render job in the queued state.
+
+        Args:
+            kind: Job type (e.g. "pdf")
+            payload: Job parameters consumed by the worker
+            max_attempts: How many times the job may be claimed before it fails
+
+        Returns:
+            Inserted job ID
+        """
+        try:
+            now = datetime.utcnow()
+            job = {
+                "kind": kind,
+                "payload": payload,
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": max_attempts,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            result = await self.db.jobs.insert_one(job)
+            return str(result.inserted_id)
+        except Exception as e:
+            print(f"✗ Error enqueuing job: {e}")
+            raise
+
+    async def claim_job(self, worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claim the oldest runnable job for a worker.
+
+        A job is runnable when it is queued, or when it is running but its
+        lease has expired (the previous worker stopped heartbeating).
+
+        Args:
+            worker_id: Unique identifier of the claiming worker
+            lease_seconds: Lease duration granted to the worker
+
+        Returns:
+            Claimed job document or None when the queue is empty
+        """
+        try:
+            now = datetime.utcnow()
+            return await self.db.jobs.find_one_and_update(
+                {
+                    "$or": [
+                        {"status": "queued"},
+                        {"status": "running", "lease_expires_at": {"$lt": now}},
+                    ],
+                    "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                },
+                {
+                    "$set": {
+                        "status": "running",
+                        "lease_owner": worker_id,
+                        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                        "started_at": now,
+                        "updated_at": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            print(f"✗ Error claiming job: {e}")
+            raise
+
+    async def fail_expired_jobs(self) -> int:
+        """
+        Fail running jobs whose lease expired on their last attempt.
+
+        claim_job() only re-claims expired jobs with attempts left, so a
+        worker that dies during the final attempt would otherwise leave the
+        job "running" forever.
+
+        Returns:
+            Number of jobs marked failed
+        """
+        try:
+            now = datetime.utcnow()
+            result = await self.db.jobs.update_many(
+                {
+                    "status": "running",
+                    "lease_expires_at": {"$lt": now},
+                    "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+                },
+                {"$set": {
+                    "status": "failed",
+                    "error": "Worker stopped responding during the last attempt",
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "finished_at": now,
+                    "updated_at": now,
+                }},
+            )
+            return result.modified_count
+        except Exception as e:
+            print(f"✗ Error failing expired jobs: {e}")
+            raise
+
+    async def renew_job_lease(self, job_id: Any, worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> bool:
+        """
+        Extend the lease on a running job (heartbeat).
+
+        Args:
+            job_id: Job ObjectId
+            worker_id: Worker that currently owns the lease
+            lease_seconds: New lease duration from now
+
+        Returns:
+            True if the lease is still held by this worker
+        """
+        try:
+            now = datetime.utcnow()
+            result = await self.db.jobs.update_one(
+                {"_id": job_id, "status": "running", "lease_owner": worker_id},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}},
+            )
+            return result.matched_count == 1
+        except Exception as e:
+            print(f"✗ Error renewing job lease: {e}")
+            return False
+
+    async def complete_job(self, job_id: Any, worker_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Mark a job as done and store its result.
+
+        Args:
+            job_id: Job ObjectId
+            worker_id: Worker that currently owns the lease
+            result: Result document (e.g. PDF filename and size)
+
+        Returns:
+            True if the job was still owned by this worker
+        """
+        try:
+            now = datetime.utcnow()
+            res = await self.db.jobs.update_one(
+                {"_id": job_id, "lease_owner": worker_id},
+                {"$set": {
+                    "status": "done",
+                    "result": result,
+                    "error": None,
+                    "lease_expires_at": None,
+                    "finished_at": now,
+                    "updated_at": now,
+                }},
+            )
+            return res.matched_count == 1
+        except Exception as e:
+            print(f"✗ Error completing job: {e}")
+            raise
+
+    async def fail_job(self, job_id: Any, worker_id: str, error: str) -> bool:
+        """
+        Record a job failure. The job is requeued while attempts remain.
+
+        Args:
+            job_id: Job ObjectId
+            worker_id: Worker that currently owns the lease
+            error: Error message
+
+        Returns:
+            True if the job was still owned by this worker
+        """
+        try:
+            now = datetime.utcnow()
+            res = await self.db.jobs.update_one(
+                {"_id": job_id, "lease_owner": worker_id},
+                [{"$set": {
+                    "status": {"$cond": [{"$lt": ["$attempts", "$max_attempts"]}, "queued", "failed"]},
+                    "error": error,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "finished_at": {"$cond": [{"$lt": ["$attempts", "$max_attempts"]}, None, now]},
+                    "updated_at": now,
+                }}],
+            )
+            return res.matched_count == 1
+        except Exception as e:
+            print(f"✗ Error failing job: {e}")
+            raise
+
+    def _job_results_bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(self.db, bucket_name=JOB_RESULTS_BUCKET)
+
+    async def save_job_result_file(self, filename: str, file_path: str) -> Any:
+        """
+        Store a rendered file in GridFS so any API instance can serve it.
+
+        Args:
+            filename: Name the file is downloaded under
+            file_path: Local file written by the worker
+
+        Returns:
+            GridFS file id
+        """
+        try:
+            with open(file_path, "rb") as f:
+                return await self._job_results_bucket().upload_from_stream(filename, f)
+        except Exception as e:
+            print(f"✗ Error storing job result file: {e}")
+            raise
+
+    async def delete_job_result_file(self, file_id: Any) -> bool:
+        """
+        Delete a stored job result file (e.g. one uploaded by a worker that
+        lost its lease before completing the job).
+
+        Args:
+            file_id: GridFS file id returned by save_job_result_file()
+
+        Returns:
+            True if the file was deleted
+        """
+        try:
+            await self._job_results_bucket().delete(file_id)
+            return True
+        except NoFile:
+            return False
+        except Exception as e:
+            print(f"⚠ Could not delete job result file {file_id}: {e}")
+            return False
+
+    async def open_job_result_file(self, filename: str):
+        """
+        Open the newest stored job result file with this name.
+
+        Args:
+            filename: Name given to save_job_result_file()
+
+        Returns:
+            GridFS download stream (read with readchunk()), or None if not found
+        """
+        try:
+            return await self._job_results_bucket().open_download_stream_by_name(filename)
+        except NoFile:
+            return None
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a render job by ID.
+
+        Args:
+            job_id: ObjectId as string
+
+        Returns:
+            Job document or None if not found
+        """
+        try:
+            from bson.objectid import ObjectId
+            return await self.db.jobs.find_one({"_id": ObjectId(job_id)})
+        except Exception as e:
+            print(f"✗ Error fetching job: {e}")
+            return None
+
 
 # Global database instance
 db_service: Optional[DatabaseService] = None
@@ -0,0 +1,150 @@
+"""
+Executor service module.
+Runs CPU-bound work (CSV parsing, big Jinja renders, ZIP extraction) off the
+asyncio event loop in process and thread pools, and measures event-loop lag
+so blocking work shows up in /health.
+"""
+
+import os
+import time
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+
+
+# Worker processes for CPU-bound work (0 = run it on the thread pool instead);
+# the default leaves one core for the event loop
+PROCESS_WORKERS = int(os.getenv("AOPS_PROCESS_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+# Threads for blocking I/O and GIL-releasing work (Arrow, zlib, file copies)
+THREAD_WORKERS = int(os.getenv("AOPS_THREAD_WORKERS", "8"))
+# Seconds between event-loop lag samples
+LAG_SAMPLE_INTERVAL = float(os.getenv("AOPS_LAG_SAMPLE_INTERVAL", "0.5"))
+
+
+class ExecutorService:
+    """Process and thread pools shared by the API and the render worker"""
+
+    def __init__(self, process_workers: int = PROCESS_WORKERS, thread_workers: int = THREAD_WORKERS):
+        """
+        Initialize executor service. Pools are created on first use.
+
+        Args:
+            process_workers: Size of the process pool (0 disables it)
+            thread_workers: Size of the thread pool
+        """
+        self.process_workers = max(0, process_workers)
+        self.thread_workers = max(1, thread_workers)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self.lag = {"current_ms": 0.0, "max_ms": 0.0, "avg_ms": 0.0, "samples": 0}
+        self.tasks = {"process": 0, "thread": 0}
+
+    @property
+    def has_process_pool(self) -> bool:
+        """True when CPU-bound work runs in separate processes"""
+        return self.process_workers > 0
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # spawn avoids forking a process that holds Motor/browser threads
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            print(f"✓ Process pool started ({self.process_workers} workers)")
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.thread_workers,
+                thread_name_prefix="aops-worker"
+            )
+        return self._thread_pool
+
+    async def run_in_process(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a picklable module-level function in the process pool.
+
+        Falls back to the thread pool when the process pool is disabled.
+        """
+        if not self.has_process_pool:
+            return await self.run_in_thread(fn, *args, **kwargs)
+        self.tasks["process"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_process_pool(), functools.partial(fn, *args, **kwargs)
+        )
+
+    async def run_in_thread(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in the thread pool"""
+        self.tasks["thread"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_thread_pool(), functools.partial(fn, *args, **kwargs)
+        )
+
+    def start_lag_monitor(self, interval: float = LAG_SAMPLE_INTERVAL):
+        """Start sampling event-loop lag on the running loop"""
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self._monitor_lag(interval))
+
+    async def _monitor_lag(self, interval: float):
+        """Measure how late each sleep wakes up; the overshoot is time the loop was blocked"""
+        lag = self.lag
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            late_ms = max(0.0, (time.perf_counter() - started - interval) * 1000)
+            lag["samples"] += 1
+            lag["current_ms"] = round(late_ms, 2)
+            lag["max_ms"] = round(max(lag["max_ms"], late_ms), 2)
+            # Exponential moving average over roughly the last 20 samples
+            lag["avg_ms"] = round(lag["avg_ms"] + (late_ms - lag["avg_ms"]) / min(lag["samples"], 20), 2)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool sizes, task counts and event-loop lag"""
+        return {
+            "process_workers": self.process_workers,
+            "thread_workers": self.thread_workers,
+            "process_pool_started": self._process_pool is not None,
+            "tasks": dict(self.tasks),
+            "loop_lag": dict(self.lag),
+        }
+
+    async def shutdown(self):
+        """Stop the lag monitor and both pools"""
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        print("✓ Executor pools shut down")
+
+
+# Global executor service instance
+executor_service: Optional[ExecutorService] = None
+
+
+def init_executor_service(
+    process_workers: int = PROCESS_WORKERS,
+    thread_workers: int = THREAD_WORKERS
+) -> ExecutorService:
+    """Initialize global executor service instance"""
+    global executor_service
+    executor_service = ExecutorService(process_workers, thread_workers)
+    return executor_service
+
+
+def get_executor_service() -> ExecutorService:
+    """Get the global executor service instance"""
+    if executor_service is None:
+        return init_executor_service()
+    return executor_service
@@ -0,0 +1,121 @@
+"""
+Content hashing helpers.
+Computes stable hashes of offers, templates and branding so label changes
+can be detected without rendering.
+"""
+
+import base64
+import hashlib
+import json
+from typing import Any, BinaryIO, Dict, Optional
+
+
+# Bytes hashed per read when fingerprinting uploaded files
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Offer fields that affect a rendered label
+OFFER_CONTENT_FIELDS = (
+    "product_id",
+    "product_name",
+    "brand",
+    "offer_type",
+    "offer_details",
+    "price",
+    "mrp",
+    "valid_till",
+    "custom_fields",
+)
+
+
+def _digest(value: Any) -> str:
+    """SHA-1 of the canonical JSON encoding of a value"""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def offer_content_hash(offer: Dict[str, Any]) -> str:
+    """
+    Hash the label-relevant fields of an offer.
+
+    Args:
+        offer: Offer dictionary
+
+    Returns:
+        Hex digest that changes only when the offer's label content changes
+    """
+    return _digest({field: offer.get(field) for field in OFFER_CONTENT_FIELDS})
+
+
+def file_sha256(fileobj: BinaryIO) -> str:
+    """
+    SHA-256 of a file object's contents, read in chunks from the current
+    position. The caller is responsible for seeking back afterwards.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(FILE_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_hash(template: Optional[Dict[str, Any]]) -> str:
+    """Hash the parts of a template that affect rendering"""
+    template = template or {}
+    return _digest({
+        "html_content": template.get("html_content"),
+        "css_content": template.get("css_content"),
+        "layout_options": template.get("layout_options"),
+    })
+
+
+def branding_hash(branding: Optional[Dict[str, Any]]) -> str:
+    """Hash a branding configuration"""
+    return _digest(branding or {})
+
+
+def label_hash(content_hash: str, tmpl_hash: str, brand_hash: str) -> str:
+    """Combine offer, template and branding hashes into a per-label hash"""
+    return hashlib.sha1(f"{content_hash}:{tmpl_hash}:{brand_hash}".encode("utf-8")).hexdigest()
+
+
+def encode_sync_token(
+    seq: int, tmpl_hash: str, brand_hash: str, collection: Optional[str] = None, epoch: int = 0
+) -> str:
+    """
+    Build an opaque changes-feed token.
+
+    Args:
+        seq: Highest offer sync sequence the client has seen
+        tmpl_hash: Template hash the client rendered with
+        brand_hash: Branding hash the client rendered with
+        collection: Offers collection the sequence belongs to
+        epoch: Removal counter of that collection (bumped when it is cleared)
+
+    Returns:
+        URL-safe token string
+    """
+    raw = json.dumps(
+        {"s": seq, "t": tmpl_hash, "b": brand_hash, "c": collection, "e": epoch}, separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_sync_token(token: str) -> Dict[str, Any]:
+    """
+    Decode a token produced by encode_sync_token().
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return {
+            "seq": int(data["s"]),
+            "template_hash": data["t"],
+            "branding_hash": data["b"],
+            # Tokens issued before offer sets existed never match, forcing a resync
+            "collection": data.get("c"),
+            "epoch": int(data["e"]),
+        }
+    except Exception as e:
+        raise ValueError(f"Invalid sync token: {e}")
@@ -0,0 +1,1070 @@
+"""
+Offer ingest service module.
+Maps CSV rows and Arrow/Parquet columns to offer documents and streams
+them into MongoDB in batches.
+"""
+
+import csv
+import gc
+import io
+import math
+import os
+import re
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional, List, Dict, Any, BinaryIO, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.models.offer import OfferCreate
+from app.services.executor import get_executor_service
+
+
+# Rows buffered before a batch is flushed to MongoDB
+INGEST_BATCH_SIZE = int(os.getenv("AOPS_INGEST_BATCH_SIZE", "1000"))
+
+# "insert" rejects existing product_ids; "upsert" updates changed offers
+INGEST_MODES = ("insert", "upsert")
+
+# CSV engines: "stream" (csv module, row by row) or "columnar" (pyarrow)
+INGEST_ENGINES = ("stream", "columnar")
+
+# Bytes of CSV the columnar reader converts per record batch
+COLUMNAR_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Characters of CSV text handed to one process-pool parse task
+CSV_BLOCK_CHARS = 256 * 1024
+
+# Rows read per record batch from Parquet files
+PARQUET_BATCH_ROWS = 65536
+
+# Number of offers returned in the upload response preview
+PREVIEW_SIZE = 5
+
+# Row errors reported in the upload response (all are still counted)
+MAX_REPORTED_ERRORS = 100
+
+# Date formats accepted in the valid_till column, tried in order (day first)
+VALID_TILL_FORMATS = (
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+    "%d %b %Y",
+    "%d-%b-%Y",
+    "%d %B %Y",
+    "%b %d, %Y",
+)
+
+# ISO timestamps ("2025-12-31T23:59:00", Parquet timestamp columns) keep the date part
+ISO_DATETIME_PATTERN = r"^(\d{4}-\d{1,2}-\d{1,2})[T ].*$"
+_ISO_DATETIME = re.compile(ISO_DATETIME_PATTERN)
+
+# Numeric cells: thousands separators ("," or "_") are dropped, then the text
+# must be a plain ASCII decimal number; both ingest engines apply this rule
+NUMBER_SEPARATORS = (",", "_")
+NUMBER_PATTERN = r"^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$"
+_NUMBER = re.compile(NUMBER_PATTERN)
+
+# Display strings are left blank for values int() cannot sensibly show
+MAX_DISPLAY_VALUE = 1e15
+
+# Fields derived from price / mrp at ingest (see pricing_fields)
+PRICING_FIELDS = (
+    'discount_amount',
+    'discount_pct',
+    'price_display',
+    'mrp_display',
+    'savings_display',
+    'discount_pct_display',
+)
+
+# Validates a whole chunk of offers in one call into pydantic-core
+OFFER_LIST_ADAPTER = TypeAdapter(List[OfferCreate])
+
+# Mapping of possible header names to our internal field names
+HEADER_MAP = {
+    'product id': 'product_id',
+    'id': 'product_id',
+    'sku': 'product_id',
+    'product_id': 'product_id',
+
+    'product name': 'product_name',
+    'productname': 'product_name',
+    'item name': 'product_name',
+    'itemname': 'product_name',
+    'name': 'product_name',
+
+    'brand': 'brand',
+
+    'offer type': 'offer_type',
+    'offertype': 'offer_type',
+    'offer': 'offer_type',
+
+    'offer details': 'offer_details',
+    'offer_details': 'offer_details',
+    'details': 'offer_details',
+    'savings': 'offer_details',
+
+    'price': 'price',
+    'rapsap price': 'price',
+    'sale price': 'price',
+
+    'mrp': 'mrp',
+
+    'valid till': 'valid_till',
+    'valid_till': 'valid_till',
+    'expiry': 'valid_till',
+    'expiry date': 'valid_till'
+}
+
+
+def normalize_key(k: str) -> str:
+    """Normalize header names to a canonical key"""
+    return (k or '').strip().lower().replace('-', ' ').replace('_', ' ')
+
+
+def map_headers(fieldnames: List[str]) -> Dict[str, Optional[str]]:
+    """Build normalized header lookup (raw header -> offer field or None)"""
+    return {h: HEADER_MAP.get(normalize_key(h)) for h in fieldnames}
+
+
+def slugify(text: str) -> str:
+    """Simple slug generator for missing product_id"""
+    if not text:
+        return ''
+    s = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in text)
+    s = '-'.join(s.lower().split())
+    return s[:60]
+
+
+def to_float(x) -> float:
+    """Parse numeric fields safely (see NUMBER_PATTERN; blanks, junk, inf and nan become 0.0)"""
+    if isinstance(x, (int, float)) and not isinstance(x, bool):
+        value = float(x)
+        return value if math.isfinite(value) else 0.0
+    text = str(x if x is not None else '').strip()
+    for separator in NUMBER_SEPARATORS:
+        text = text.replace(separator, '')
+    if not _NUMBER.match(text):
+        return 0.0
+    value = float(text)
+    return value if math.isfinite(value) else 0.0
+
+
+def parse_valid_till(value) -> Optional[datetime]:
+    """Parse a valid_till cell into a date (midnight); blanks and unknown formats give None"""
+    text = str(value or '').strip()
+    if not text:
+        return None
+    text = _ISO_DATETIME.sub(r"\1", text)
+    for fmt in VALID_TILL_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _int_text(value: float) -> str:
+    """str(int(value)) as Jinja's |int renders it; '' for inf, nan and huge values"""
+    return str(int(value)) if abs(value) < MAX_DISPLAY_VALUE else ''
+
+
+def pricing_fields(price: float, mrp: float) -> Dict[str, Any]:
+    """
+    Discount figures and label display strings derived from price and mrp.
+
+    discount_amount (mrp - price, never negative) and discount_pct (of mrp)
+    are rounded to 2 places for filtering. The *_display strings reproduce
+    what the shelf-talker templates printed with |int: savings is mrp - price
+    truncated, and the percentage is blank unless both prices are set.
+    """
+    # Scale, round half to even, unscale (ColumnarOfferMapper does the same per column)
+    amount = round(max(mrp - price, 0.0) * 100) / 100
+    pct = round(amount / mrp * 100 * 100) / 100 if mrp > 0 else 0.0
+    return {
+        'discount_amount': amount,
+        'discount_pct': pct,
+        'price_display': _int_text(price),
+        'mrp_display': _int_text(mrp),
+        'savings_display': _int_text(mrp - price),
+        'discount_pct_display': _int_text((mrp - price) / mrp * 100) if mrp and price else '',
+    }
+
+
+def derive_offer_fields(offer: Dict[str, Any]) -> Dict[str, Any]:
+    """Set the fields derived from an offer's raw values (valid_till_date, PRICING_FIELDS)"""
+    offer['valid_till_date'] = parse_valid_till(offer.get('valid_till'))
+    offer.update(pricing_fields(to_float(offer.get('price')), to_float(offer.get('mrp'))))
+    return offer
+
+
+def validate_offers(
+    offers: List[Dict[str, Any]],
+    row_numbers: List[int]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Validate a chunk of offers against OfferCreate in a single call.
+
+    Args:
+        offers: Mapped offer dictionaries
+        row_numbers: Source row number of each offer, used in error reports
+
+    Returns:
+        (valid offers, errors) where each error is { row, field, message }
+    """
+    try:
+        OFFER_LIST_ADAPTER.validate_python(offers)
+        return offers, []
+    except ValidationError as e:
+        errors = []
+        bad_rows = set()
+        for err in e.errors(include_url=False):
+            index = err["loc"][0]
+            bad_rows.add(index)
+            errors.append({
+                "row": row_numbers[index],
+                "field": ".".join(str(part) for part in err["loc"][1:]),
+                "message": err["msg"]
+            })
+        valid = [offer for i, offer in enumerate(offers) if i not in bad_rows]
+        return valid, errors
+
+
+class OfferRowMapper:
+    """Maps raw CSV rows (dicts keyed by header) to offer documents"""
+
+    def __init__(self, fieldnames: List[str], auto_prefix: str = "auto-"):
+        """
+        Initialize row mapper.
+
+        Args:
+            fieldnames: Raw CSV header row
+            auto_prefix: Prefix of generated product_ids (parallel importers
+                         give each part its own prefix to keep them unique)
+        """
+        self.normalized_headers = map_headers(fieldnames)
+        self.auto_prefix = auto_prefix
+        self.auto_idx = 1
+
+    def map_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map one CSV row to an offer document.
+
+        Args:
+            row: Row dict from csv.DictReader
+
+        Returns:
+            Offer dictionary (not yet validated)
+        """
+        mapped = {}
+        custom = {}
+        # Map known headers
+        for raw_h, value in row.items():
+            if raw_h is None:
+                # Extra cells beyond the header row
+                continue
+            val = (value or '').strip()
+            target = self.normalized_headers.get(raw_h)
+            if target:
+                mapped[target] = val
+            else:
+                # Keep leftover columns in custom_fields using their raw header
+                if val != '':
+                    custom[raw_h.strip()] = val
+
+        # Ensure required fields exist; generate product_id if missing
+        product_name = mapped.get('product_name') or custom.get('Item Name') or ''
+        product_id = mapped.get('product_id') or custom.get('product_id') or slugify(product_name)
+        if not product_id:
+            product_id = f'{self.auto_prefix}{self.auto_idx}'
+            self.auto_idx += 1
+
+        price = to_float(mapped.get('price') or custom.get('Rapsap Price') or mapped.get('rapsap price'))
+        mrp = to_float(mapped.get('mrp') or custom.get('MRP') or mapped.get('MRP'))
+
+        valid_till = mapped.get('valid_till') or ''
+
+        now = datetime.utcnow()
+        return {
+            'product_id': product_id,
+            'product_name': mapped.get('product_name') or product_name or product_id,
+            'brand': mapped.get('brand') or custom.get('Brand') or '',
+            'offer_type': mapped.get('offer_type') or '',
+            'offer_details': mapped.get('offer_details') or custom.get('Savings') or '',
+            'price': price,
+            'mrp': mrp,
+            'valid_till': valid_till,
+            'valid_till_date': parse_valid_till(valid_till),
+            **pricing_fields(price, mrp),
+            'custom_fields': custom,
+            'created_at': now,
+            'updated_at': now
+        }
+
+
+class IngestResult:
+    """Accumulates counters across the batches of one ingest"""
+
+    def __init__(self):
+        self.inserted_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.total_rows = 0
+        self.skipped_rows = 0
+        self.batches = 0
+        self.failed_count = 0
+        self.duplicates: List[str] = []
+        self.errors: List[Dict[str, Any]] = []
+        # Rows the database rejected (other than duplicates), first MAX_REPORTED_ERRORS
+        self.write_errors: List[Dict[str, Any]] = []
+        self.preview: List[Dict[str, Any]] = []
+
+    def add_errors(self, errors: List[Dict[str, Any]]):
+        """Record row errors, keeping the first MAX_REPORTED_ERRORS"""
+        self.skipped_rows += len({err["row"] for err in errors})
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def add_write(self, write_result: Dict[str, Any]):
+        """Merge the result of one save_offers_bulk() call"""
+        self.inserted_count += int(write_result.get("inserted_count", 0))
+        self.updated_count += int(write_result.get("updated_count", 0))
+        self.unchanged_count += int(write_result.get("unchanged_count", 0))
+        self.duplicates.extend(write_result.get("duplicates", []))
+        self.failed_count += int(write_result.get("failed_count", 0))
+        room = MAX_REPORTED_ERRORS - len(self.write_errors)
+        if room > 0:
+            self.write_errors.extend(write_result.get("write_errors", [])[:room])
+        self.batches += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "inserted_count": self.inserted_count,
+            "updated_count": self.updated_count,
+            "unchanged_count": self.unchanged_count,
+            "total_rows": self.total_rows,
+            "skipped_rows": self.skipped_rows,
+            "failed_count": self.failed_count,
+            "batches": self.batches,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "write_errors": self.write_errors,
+            "preview": self.preview,
+        }
+
+
+class BatchWriter:
+    """
+    Buffers offers and writes them in fixed-size batches. Each batch is
+    written in the background while the caller keeps parsing; at most one
+    write is in flight at a time. The target collection is resolved once, at
+    the first write, so an offer set activated mid-upload does not split it.
+    """
+
+    def __init__(self, db, mode: str = "insert", batch_size: int = INGEST_BATCH_SIZE):
+        """
+        Initialize batch writer.
+
+        Args:
+            db: DatabaseService instance
+            mode: "insert" or "upsert" (see INGEST_MODES)
+            batch_size: Offers per bulk write
+
+        Raises:
+            ValueError: If the mode is unknown
+        """
+        if mode not in INGEST_MODES:
+            raise ValueError(f"Unsupported ingest mode: {mode}")
+        self._db = db
+        self._mode = mode
+        self._write_batch = None
+        self.batch_size = batch_size
+        self.result = IngestResult()
+        self._buffer: List[Dict[str, Any]] = []
+        self._pending: Optional[asyncio.Task] = None
+
+    async def add(
+        self,
+        offers: List[Dict[str, Any]],
+        row_numbers: Optional[List[int]] = None,
+        validate: bool = True
+    ):
+        """
+        Validate and queue offers, flushing every full batch.
+
+        Args:
+            offers: Mapped offer dictionaries
+            row_numbers: CSV row number of each offer, used in error reports
+            validate: False when the offers were already validated
+        """
+        result = self.result
+        if offers and validate:
+            offers, errors = await get_executor_service().run_in_thread(
+                validate_offers, offers, row_numbers or list(range(len(offers)))
+            )
+            if errors:
+                result.add_errors(errors)
+        result.total_rows += len(offers)
+        if len(result.preview) < PREVIEW_SIZE:
+            result.preview.extend(dict(o) for o in offers[:PREVIEW_SIZE - len(result.preview)])
+        self._buffer.extend(offers)
+        while len(self._buffer) >= self.batch_size:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        if self._write_batch is None:
+            db = await self._db.pin_offer_set()
+            self._write_batch = db.upsert_offers_bulk if self._mode == "upsert" else db.save_offers_bulk
+        if self._pending is not None:
+            self.result.add_write(await self._pending)
+        self._pending = asyncio.create_task(self._write_batch(batch))
+        # Let the write start before parsing resumes
+        await asyncio.sleep(0)
+
+    async def close(self) -> IngestResult:
+        """Flush the remaining offers and wait for the last write"""
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            await self._flush(batch)
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.result.add_write(await pending)
+        return self.result
+
+    def abort(self):
+        """Cancel an in-flight write after a parse error"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+
+def split_csv_blocks(lines, block_chars: int = CSV_BLOCK_CHARS):
+    """
+    Group CSV lines into blocks that end on record boundaries.
+
+    A line ends a record when the quotes seen so far are balanced, so quoted
+    values containing newlines never straddle two blocks. Blank lines are
+    not counted as records (csv.DictReader skips them).
+
+    Args:
+        lines: Iterable of CSV text lines (newlines preserved)
+        block_chars: Approximate characters per block
+
+    Yields:
+        (block text, number of records in the block)
+    """
+    buf: List[str] = []
+    size = 0
+    records = 0
+    in_quotes = False
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if in_quotes:
+            continue
+        if line.rstrip("\r\n"):
+            records += 1
+        if size >= block_chars:
+            yield "".join(buf), records
+            buf, size, records = [], 0, 0
+    if buf:
+        yield "".join(buf), records
+
+
+def parse_csv_block(fieldnames: List[str], block: str, first_row: int, auto_prefix: str = "auto-") -> Dict[str, Any]:
+    """
+    Parse, map and validate one block of CSV records. Runs in a worker process.
+
+    Auto-generated product_ids are numbered from 1 within the block; the
+    caller renumbers them so they stay sequential across blocks.
+
+    Args:
+        fieldnames: CSV header row
+        block: Complete CSV records without the header
+        first_row: CSV row number of the first record in the block
+        auto_prefix: Prefix of generated product_ids (see OfferRowMapper)
+
+    Returns:
+        Dict with offers, row_numbers, errors, auto_rows (offer index, block
+        auto number) and auto_count
+    """
+    mapper = OfferRowMapper(fieldnames, auto_prefix=auto_prefix)
+    offers: List[Dict[str, Any]] = []
+    row_numbers: List[int] = []
+    errors: List[Dict[str, Any]] = []
+    generated: Dict[int, int] = {}
+    reader = csv.DictReader(io.StringIO(block, newline=""), fieldnames=fieldnames)
+    for row_number, row in enumerate(reader, start=first_row):
+        auto_idx = mapper.auto_idx
+        try:
+            offer = mapper.map_row(row)
+        except Exception as e:
+            errors.append({"row": row_number, "field": "", "message": str(e)})
+            continue
+        if mapper.auto_idx != auto_idx:
+            generated[id(offer)] = auto_idx
+        offers.append(offer)
+        row_numbers.append(row_number)
+
+    valid, validation_errors = validate_offers(offers, row_numbers)
+    if validation_errors:
+        valid_rows = set(row_numbers) - {err["row"] for err in validation_errors}
+        row_numbers = [n for n in row_numbers if n in valid_rows]
+        errors.extend(validation_errors)
+    auto_rows = [(i, generated[id(offer)]) for i, offer in enumerate(valid) if id(offer) in generated]
+    return {
+        "offers": valid,
+        "row_numbers": row_numbers,
+        "errors": errors,
+        "auto_rows": auto_rows,
+        "auto_count": mapper.auto_idx - 1,
+    }
+
+
+def read_csv_chunk(csv_reader, mapper: OfferRowMapper, size: int, first_row: int) -> Dict[str, Any]:
+    """
+    Read and map up to `size` rows from a DictReader. Runs in a worker thread.
+
+    Returns:
+        Dict with offers, row_numbers, errors and next_row
+    """
+    offers: List[Dict[str, Any]] = []
+    row_numbers: List[int] = []
+    errors: List[Dict[str, Any]] = []
+    row_number = first_row
+    for row in csv_reader:
+        try:
+            offers.append(mapper.map_row(row))
+            row_numbers.append(row_number)
+        except Exception as e:
+            errors.append({"row": row_number, "field": "", "message": str(e)})
+        row_number += 1
+        if len(offers) + len(errors) >= size:
+            break
+    return {"offers": offers, "row_numbers": row_numbers, "errors": errors, "next_row": row_number}
+
+
+async def ingest_csv_stream(
+    fileobj: BinaryIO,
+    db,
+    batch_size: int = INGEST_BATCH_SIZE,
+    mode: str = "insert",
+    auto_prefix: str = "auto-"
+) -> IngestResult:
+    """
+    Parse a CSV stream incrementally and write offers in fixed-size batches.
+
+    Rows are decoded and parsed straight from the file object, so memory is
+    bounded by the batch size rather than the file size. With a process pool
+    the file is cut into blocks of whole records that are parsed, mapped and
+    validated in parallel; otherwise rows are parsed in a worker thread.
+    Either way the event loop only coordinates.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the CSV
+        db: DatabaseService instance
+        batch_size: Offers per bulk write
+        mode: "insert" (duplicates are rejected) or "upsert" (changed rows
+              are updated, unchanged rows skipped)
+        auto_prefix: Prefix of generated product_ids (see OfferRowMapper)
+
+    Returns:
+        IngestResult with counters, duplicates and a preview of the first rows
+
+    Raises:
+        ValueError: If the CSV has no header row or the mode is unknown
+    """
+    writer = BatchWriter(db, mode, batch_size)
+    executor = get_executor_service()
+
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        fieldnames = next(csv.reader(text), None)
+        if not fieldnames:
+            raise ValueError("Invalid CSV format")
+
+        try:
+            if executor.has_process_pool:
+                await _ingest_csv_blocks(text, fieldnames, writer, executor, auto_prefix)
+            else:
+                mapper = OfferRowMapper(fieldnames, auto_prefix=auto_prefix)
+                csv_reader = csv.DictReader(text, fieldnames=fieldnames)
+                next_row = 2  # Row 1 is the header
+                while True:
+                    chunk = await executor.run_in_thread(read_csv_chunk, csv_reader, mapper, batch_size, next_row)
+                    if chunk["errors"]:
+                        writer.result.add_errors(chunk["errors"])
+                    if chunk["next_row"] == next_row:
+                        break
+                    next_row = chunk["next_row"]
+                    # Validated as a whole chunk by the writer
+                    await writer.add(chunk["offers"], chunk["row_numbers"])
+
+            result = await writer.close()
+            if result.skipped_rows:
+                print(f"⚠ Skipped {result.skipped_rows} invalid CSV rows")
+            return result
+        except Exception:
+            writer.abort()
+            raise
+    finally:
+        # Do not close the underlying upload file along with the wrapper
+        text.detach()
+
+
+async def _ingest_csv_blocks(text, fieldnames: List[str], writer: BatchWriter, executor, auto_prefix: str = "auto-"):
+    """Parse CSV blocks in the process pool and feed results to the writer in order"""
+    pending: deque = deque()
+    max_pending = executor.process_workers * 2
+    auto_base = 0
+
+    async def consume(future):
+        nonlocal auto_base
+        parsed = await future
+        if parsed["errors"]:
+            writer.result.add_errors(parsed["errors"])
+        offers = parsed["offers"]
+        # Renumber auto ids so they run on from the previous block
+        for i, local in parsed["auto_rows"]:
+            offer = offers[i]
+            auto_id = f"{auto_prefix}{auto_base + local}"
+            if offer["product_name"] == offer["product_id"]:
+                offer["product_name"] = auto_id
+            offer["product_id"] = auto_id
+        auto_base += parsed["auto_count"]
+        await writer.add(offers, parsed["row_numbers"], validate=False)
+
+    next_row = 2  # Row 1 is the header
+    # Reading the upload and scanning it for record boundaries is blocking
+    # work too: pull each block in a thread, not on the event loop
+    blocks = split_csv_blocks(text)
+    try:
+        while True:
+            item = await executor.run_in_thread(next, blocks, None)
+            if item is None:
+                break
+            block, records = item
+            pending.append(asyncio.ensure_future(
+                executor.run_in_process(parse_csv_block, fieldnames, block, next_row, auto_prefix)
+            ))
+            next_row += records
+            if len(pending) >= max_pending:
+                await consume(pending.popleft())
+        while pending:
+            await consume(pending.popleft())
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class ColumnarOfferMapper:
+    """
+    Maps Arrow record batches to offer documents column by column.
+
+    Header normalization runs once per column, numeric columns are parsed
+    with vectorized Arrow compute kernels and missing product_ids are
+    slugified in bulk. Only the final assembly of offer dicts is per row.
+    """
+
+    def __init__(self, column_names: List[str], auto_prefix: str = "auto-"):
+        """
+        Initialize columnar mapper.
+
+        Args:
+            column_names: Column names of the incoming record batches
+            auto_prefix: Prefix of generated product_ids (see OfferRowMapper)
+        """
+        self.column_names = list(column_names)
+        headers = map_headers(self.column_names)
+        # Later columns win when several map to the same field, as in OfferRowMapper
+        self.field_columns: Dict[str, str] = {}
+        for name in self.column_names:
+            if headers[name]:
+                self.field_columns[headers[name]] = name
+        self.custom_columns = [name for name in self.column_names if not headers[name]]
+        self.auto_prefix = auto_prefix
+        self.auto_idx = 1
+
+    @staticmethod
+    def _text(pc, column):
+        """Cast a column to trimmed strings with nulls as ''"""
+        import pyarrow as pa
+        if not pa.types.is_string(column.type) and not pa.types.is_large_string(column.type):
+            column = pc.cast(column, pa.string())
+        return pc.utf8_trim_whitespace(pc.fill_null(column, ""))
+
+    @staticmethod
+    def _number(pc, column):
+        """Parse a column to float64, mapping blanks and junk to 0.0"""
+        import pyarrow as pa
+        if pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_decimal(column.type):
+            column = pc.fill_null(pc.cast(column, pa.float64()), 0.0)
+            return pc.if_else(pc.is_finite(column), column, 0.0)
+        text = ColumnarOfferMapper._text(pc, column)
+        for separator in NUMBER_SEPARATORS:
+            text = pc.replace_substring(text, separator, "")
+        valid = pc.match_substring_regex(text, NUMBER_PATTERN)
+        text = pc.if_else(valid, text, pa.scalar(None, pa.string()))
+        column = pc.fill_null(pc.cast(text, pa.float64()), 0.0)
+        # Exponents can overflow to inf, which to_float() also maps to 0.0
+        return pc.if_else(pc.is_finite(column), column, 0.0)
+
+    @staticmethod
+    def _dates(pc, column):
+        """Vectorized parse_valid_till(): first matching VALID_TILL_FORMATS wins"""
+        import pyarrow as pa
+        column = pc.replace_substring_regex(column, ISO_DATETIME_PATTERN, r"\1")
+        parsed = [pc.strptime(column, format=fmt, unit="s", error_is_null=True) for fmt in VALID_TILL_FORMATS]
+        return pc.cast(pc.coalesce(*parsed), pa.timestamp("s"))
+
+    @staticmethod
+    def _int_text(pc, column):
+        """Vectorized _int_text(): truncate toward zero and format"""
+        import pyarrow as pa
+        shown = pc.less(pc.abs(column), MAX_DISPLAY_VALUE)
+        safe = pc.if_else(shown, pc.trunc(column), 0.0)
+        return pc.if_else(shown, pc.cast(pc.cast(safe, pa.int64()), pa.string()), "")
+
+    @staticmethod
+    def _pricing(pc, price, mrp) -> Dict[str, Any]:
+        """Vectorized pricing_fields() over float64 price and mrp columns"""
+        def round2(column):
+            # pc.round(x, 2) skips values whose x * 100 is already integral
+            return pc.divide(pc.round(pc.multiply(column, 100.0)), 100.0)
+
+        savings = pc.subtract(mrp, price)
+        amount = round2(pc.max_element_wise(savings, 0.0))
+        has_mrp = pc.greater(mrp, 0.0)
+        # Divide by 1 where mrp is 0; those rows are masked below anyway
+        percent = pc.multiply(pc.divide(savings, pc.if_else(pc.equal(mrp, 0.0), 1.0, mrp)), 100.0)
+        both_set = pc.and_(pc.not_equal(mrp, 0.0), pc.not_equal(price, 0.0))
+        return {
+            'discount_amount': amount,
+            'discount_pct': pc.if_else(has_mrp, round2(pc.multiply(pc.divide(amount, mrp), 100.0)), 0.0),
+            'price_display': ColumnarOfferMapper._int_text(pc, price),
+            'mrp_display': ColumnarOfferMapper._int_text(pc, mrp),
+            'savings_display': ColumnarOfferMapper._int_text(pc, savings),
+            'discount_pct_display': pc.if_else(both_set, ColumnarOfferMapper._int_text(pc, percent), ""),
+        }
+
+    @staticmethod
+    def _slugify(pc, column):
+        """Vectorized equivalent of slugify(): runs of non-alphanumerics become '-'"""
+        if pc.all(pc.string_is_ascii(column)).as_py():
+            # ASCII-only names avoid the slower Unicode character classes
+            s = pc.replace_substring_regex(pc.ascii_lower(column), r"[^a-z0-9]+", "-")
+        else:
+            s = pc.replace_substring_regex(pc.utf8_lower(column), r"[^\p{L}\p{N}]+", "-")
+        s = pc.utf8_trim(s, "-")
+        return pc.utf8_slice_codeunits(s, 0, 60)
+
+    def map_batch(self, batch) -> List[Dict[str, Any]]:
+        """
+        Map one Arrow record batch (or table) to offer dictionaries.
+
+        Args:
+            batch: pyarrow.RecordBatch or pyarrow.Table
+
+        Returns:
+            List of offer dictionaries
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        n = batch.num_rows
+        if n == 0:
+            return []
+        empty = pa.array([""] * n, pa.string())
+
+        def text_field(field):
+            name = self.field_columns.get(field)
+            return self._text(pc, batch.column(name)) if name else empty
+
+        product_name = text_field("product_name")
+        product_id = text_field("product_id")
+        missing_id = pc.equal(product_id, "")
+        if pc.any(missing_id).as_py():
+            product_id = pc.if_else(missing_id, self._slugify(pc, product_name), product_id)
+
+        prices = {}
+        for field in ("price", "mrp"):
+            name = self.field_columns.get(field)
+            prices[field] = self._number(pc, batch.column(name)) if name else pa.array([0.0] * n, pa.float64())
+        pricing = {
+            field: column.to_pylist()
+            for field, column in self._pricing(pc, prices["price"], prices["mrp"]).items()
+        }
+        valid_till = text_field("valid_till")
+
+        pids = product_id.to_pylist()
+        # Rows with neither an id nor a sluggable name get sequential auto ids
+        for i in pc.indices_nonzero(pc.equal(product_id, "")).to_pylist():
+            pids[i] = f"{self.auto_prefix}{self.auto_idx}"
+            self.auto_idx += 1
+
+        # custom_fields keeps only non-empty cells, keyed by the raw header
+        customs = [{} for _ in range(n)]
+        for name in self.custom_columns:
+            column = self._text(pc, batch.column(name))
+            filled = pc.indices_nonzero(pc.not_equal(column, "")).to_pylist()
+            if not filled:
+                continue
+            values = column.to_pylist()
+            key = name.strip()
+            for i in filled:
+                customs[i][key] = values[i]
+
+        now = datetime.utcnow()
+        # Building many small dicts trips the cyclic GC repeatedly; none of
+        # them can form cycles, so pause collection for the assembly
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._assemble(
+                now, pids, product_name.to_pylist(),
+                text_field("brand").to_pylist(),
+                text_field("offer_type").to_pylist(),
+                text_field("offer_details").to_pylist(),
+                prices["price"].to_pylist(), prices["mrp"].to_pylist(),
+                valid_till.to_pylist(),
+                self._dates(pc, valid_till).to_pylist(),
+                pricing,
+                customs
+            )
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    @staticmethod
+    def _assemble(now, pids, names, brands, offer_types, details_col, price_col, mrp_col,
+                  valid_tills, valid_dates, pricing, customs):
+        """Zip mapped columns (and the PRICING_FIELDS columns) into offer dictionaries"""
+        return [
+            {
+                'product_id': pid,
+                'product_name': name or pid,
+                'brand': brand,
+                'offer_type': offer_type,
+                'offer_details': details,
+                'price': price,
+                'mrp': mrp,
+                'valid_till': valid_till,
+                'valid_till_date': valid_date,
+                'discount_amount': amount,
+                'discount_pct': pct,
+                'price_display': price_text,
+                'mrp_display': mrp_text,
+                'savings_display': savings_text,
+                'discount_pct_display': pct_text,
+                'custom_fields': custom,
+                'created_at': now,
+                'updated_at': now
+            }
+            for (pid, name, brand, offer_type, details, price, mrp, valid_till, valid_date,
+                 amount, pct, price_text, mrp_text, savings_text, pct_text, custom) in zip(
+                pids, names, brands, offer_types, details_col, price_col, mrp_col, valid_tills, valid_dates,
+                *(pricing[field] for field in PRICING_FIELDS), customs
+            )
+        ]
+
+
+async def ingest_record_batches(
+    batches,
+    column_names: List[str],
+    writer: BatchWriter,
+    first_row: int = 1
+) -> IngestResult:
+    """
+    Map Arrow record batches through ColumnarOfferMapper into a BatchWriter.
+
+    Args:
+        batches: Iterable of pyarrow.RecordBatch
+        column_names: Column names shared by the batches
+        writer: BatchWriter to feed
+        first_row: Row number of the first record (used in error reports)
+
+    Returns:
+        IngestResult of the writer
+    """
+    mapper = ColumnarOfferMapper(column_names)
+    executor = get_executor_service()
+    iterator = iter(batches)
+    next_row = first_row
+    try:
+        while True:
+            # Arrow decoding and compute kernels release the GIL, so a worker
+            # thread keeps the event loop responsive while batches convert
+            offers = await executor.run_in_thread(_map_next_batch, iterator, mapper)
+            if offers is None:
+                break
+            await writer.add(offers, list(range(next_row, next_row + len(offers))))
+            next_row += len(offers)
+        result = await writer.close()
+        if result.skipped_rows:
+            print(f"⚠ Skipped {result.skipped_rows} invalid rows")
+        return result
+    except Exception:
+        writer.abort()
+        raise
+
+
+def _map_next_batch(iterator, mapper: ColumnarOfferMapper) -> Optional[List[Dict[str, Any]]]:
+    """Read the next record batch and map it, or return None when exhausted"""
+    record_batch = next(iterator, None)
+    if record_batch is None:
+        return None
+    return mapper.map_batch(record_batch)
+
+
+def columnar_available() -> bool:
+    """True when pyarrow is installed"""
+    try:
+        import pyarrow.csv  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def ingest_csv_columnar(
+    fileobj: BinaryIO,
+    db,
+    batch_size: int = INGEST_BATCH_SIZE,
+    mode: str = "insert"
+) -> IngestResult:
+    """
+    Parse a CSV with pyarrow's multithreaded reader into typed columns and
+    write offers in fixed-size batches.
+
+    All columns are read as strings (so ids like "001" keep their leading
+    zeros) and converted column-wise by ColumnarOfferMapper, then validated
+    a record batch at a time like the streaming engine.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the CSV
+        db: DatabaseService instance
+        batch_size: Offers per bulk write
+        mode: "insert" or "upsert" (see ingest_csv_stream)
+
+    Returns:
+        IngestResult with counters, duplicates and a preview of the first rows
+
+    Raises:
+        ValueError: If the CSV has no header row or the mode is unknown
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    writer = BatchWriter(db, mode, batch_size)
+
+    # Read the header row first so every column can be forced to string
+    start = fileobj.tell()
+    header_line = fileobj.readline().decode("utf-8-sig")
+    fieldnames = next(csv.reader([header_line]), [])
+    if not any(name.strip() for name in fieldnames):
+        raise ValueError("Invalid CSV format")
+    fileobj.seek(start)
+
+    executor = get_executor_service()
+    reader = await executor.run_in_thread(
+        pacsv.open_csv,
+        fileobj,
+        read_options=pacsv.ReadOptions(block_size=COLUMNAR_BLOCK_SIZE, encoding="utf-8"),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in fieldnames},
+            strings_can_be_null=False
+        )
+    )
+    # Row 1 is the header
+    return await ingest_record_batches(reader, reader.schema.names, writer, first_row=2)
+
+
+async def ingest_parquet(
+    fileobj: BinaryIO,
+    db,
+    batch_size: int = INGEST_BATCH_SIZE,
+    mode: str = "insert"
+) -> IngestResult:
+    """
+    Read a Parquet file row group by row group and write offers in batches.
+
+    Typed columns are mapped directly (numeric price/mrp columns are cast,
+    not parsed from text) through the same header normalization as CSV.
+
+    Args:
+        fileobj: Seekable binary file object
+        db: DatabaseService instance
+        batch_size: Offers per bulk write
+        mode: "insert" or "upsert" (see ingest_csv_stream)
+
+    Returns:
+        IngestResult with counters, duplicates and a preview of the first rows
+
+    Raises:
+        ValueError: If the file is not valid Parquet or the mode is unknown
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = BatchWriter(db, mode, batch_size)
+    try:
+        parquet_file = pq.ParquetFile(fileobj)
+    except (pa.ArrowInvalid, OSError) as e:
+        raise ValueError(f"Invalid Parquet file: {e}")
+
+    return await ingest_record_batches(
+        parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS),
+        parquet_file.schema_arrow.names,
+        writer
+    )
+
+
+async def ingest_arrow_ipc(
+    fileobj: BinaryIO,
+    db,
+    batch_size: int = INGEST_BATCH_SIZE,
+    mode: str = "insert"
+) -> IngestResult:
+    """
+    Read an Arrow IPC file (random access format) or stream and write offers
+    in batches. Record batches are used as-is, without text parsing.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the data
+        db: DatabaseService instance
+        batch_size: Offers per bulk write
+        mode: "insert" or "upsert" (see ingest_csv_stream)
+
+    Returns:
+        IngestResult with counters, duplicates and a preview of the first rows
+
+    Raises:
+        ValueError: If the data is neither an Arrow IPC file nor stream, or
+                    the mode is unknown
+    """
+    import pyarrow as pa
+
+    writer = BatchWriter(db, mode, batch_size)
+    start = fileobj.tell()
+    try:
+        reader = pa.ipc.open_file(fileobj)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the file format (no footer); try the streaming format
+        fileobj.seek(start)
+        try:
+            reader = pa.ipc.open_stream(fileobj)
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Invalid Arrow IPC data: {e}")
+        batches = reader
+
+    return await ingest_record_batches(batches, reader.schema.names, writer)
@@ -5,24 +5,189 @@ Handles rendering HTML to PDF using pyppeteer.
 
 import os
 import asyncio
+import hashlib
 import shutil
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Dict, List, Tuple
 from jinja2 import Template as Jinja2Template
 
+from app.services.executor import get_executor_service
+
+
+# Number of headless browsers kept open and shared by concurrent renders,
+# each of which opens its own page (0 = launch a browser per render)
+BROWSER_POOL_SIZE = int(os.getenv("AOPS_BROWSER_POOL_SIZE", "1"))
+# Maximum number of compiled Jinja templates kept in memory
+TEMPLATE_CACHE_SIZE = 64
+# Batches with at least this many offers are rendered in the process pool
+PROCESS_RENDER_MIN_OFFERS = int(os.getenv("AOPS_PROCESS_RENDER_MIN_OFFERS", "500"))
+
+# Compiled templates of a process-pool worker
+_process_template_cache: Dict[str, Jinja2Template] = {}
+
+
+def compile_template_cached(cache: Dict[str, Jinja2Template], template_html: str) -> Jinja2Template:
+    """Compile a Jinja2 template, reusing the cached version for identical HTML"""
+    key = hashlib.sha1(template_html.encode("utf-8")).hexdigest()
+    compiled = cache.get(key)
+    if compiled is None:
+        if len(cache) >= TEMPLATE_CACHE_SIZE:
+            cache.clear()
+        compiled = Jinja2Template(template_html)
+        cache[key] = compiled
+    return compiled
+
+
+def render_template_in_process(template_html: str, context: dict) -> str:
+    """Render a template inside a process-pool worker"""
+    return compile_template_cached(_process_template_cache, template_html).render(context)
+
+
+def find_chrome_executable() -> Optional[str]:
+    """Find a local Chrome/Edge executable to avoid pyppeteer downloading Chromium"""
+    # Environment variable overrides
+    env_candidates = [
+        os.environ.get("CHROME_PATH"),
+        os.environ.get("CHROME_BIN"),
+        os.environ.get("CHROME_EXECUTABLE"),
+    ]
+    for c in env_candidates:
+        if c:
+            # If it's a path, check existence; if it's a command, which() will resolve
+            if os.path.exists(c):
+                return c
+            found = shutil.which(c)
+            if found:
+                return found
+
+    # Common Windows install locations
+    windows_paths = [
+        r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+        r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+        r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
+        r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
+    ]
+    for p in windows_paths:
+        if os.path.exists(p):
+            return p
+
+    # Fallback to PATH lookup
+    for name in ("chrome", "google-chrome", "chromium", "chromium-browser", "msedge", "edge"):
+        path = shutil.which(name)
+        if path:
+            return path
+
+    return None
+
 
 class PDFGeneratorService:
     """Service for generating PDFs from HTML templates"""
 
-    def __init__(self, output_dir: str = "./pdfs"):
+    def __init__(self, output_dir: str = "./pdfs", pool_size: int = BROWSER_POOL_SIZE):
         """
         Initialize PDF generator service.
         
         Args:
             output_dir: Directory to save generated PDFs
+            pool_size: Number of browsers kept warm by start_browser_pool()
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.pool_size = pool_size
+        # Live pooled browsers (None until start_browser_pool())
+        self._browser_pool: Optional[List] = None
+        self._next_browser = 0
+        self._template_cache: Dict[str, Jinja2Template] = {}
+
+    async def _launch_browser(self):
+        """Launch a headless browser using a local Chrome when available"""
+        from pyppeteer import launch
+
+        chrome_path = find_chrome_executable()
+        if chrome_path:
+            print(f"→ Using existing Chrome executable: {chrome_path}")
+        else:
+            print("→ No system Chrome found — pyppeteer will download a Chromium binary (first run only).")
+
+        launch_kwargs = {"headless": True, "args": ["--no-sandbox"]}
+        if chrome_path:
+            launch_kwargs["executablePath"] = chrome_path
+        return await launch(**launch_kwargs)
+
+    async def start_browser_pool(self):
+        """Launch the pooled browsers so renders skip Chromium startup"""
+        if self._browser_pool is not None or self.pool_size <= 0:
+            return
+        self._browser_pool = [await self._launch_browser() for _ in range(self.pool_size)]
+        print(f"✓ Browser pool started ({self.pool_size} browser(s))")
+
+    async def close_browser_pool(self):
+        """Close all pooled browsers"""
+        pool, self._browser_pool = self._browser_pool, None
+        if pool is None:
+            return
+        for browser in pool:
+            try:
+                await browser.close()
+            except Exception as e:
+                print(f"⚠ Browser close warning: {e}")
+        print("✓ Browser pool closed")
+
+    @asynccontextmanager
+    async def _browser(self):
+        """
+        Share a pooled browser (renders open their own pages, so they run
+        concurrently), or launch a one-off browser when no pooled browser is live.
+        """
+        pool = self._browser_pool
+        if not pool:
+            browser = await self._launch_browser()
+            try:
+                yield browser
+            finally:
+                await browser.close()
+            return
+
+        browser = pool[self._next_browser % len(pool)]
+        self._next_browser += 1
+        try:
+            yield browser
+        except Exception:
+            # The render may have failed because the browser crashed
+            if not await self._browser_alive(browser):
+                await self._replace_browser(browser)
+            raise
+
+    @staticmethod
+    async def _browser_alive(browser) -> bool:
+        """Whether a browser still answers over its DevTools connection"""
+        try:
+            await asyncio.wait_for(browser.version(), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def _replace_browser(self, browser):
+        """Swap a dead pooled browser for a new one; only live browsers stay pooled"""
+        pool = self._browser_pool
+        if pool is None or browser not in pool:
+            # Pool closed, or another render already replaced it
+            return
+        pool.remove(browser)
+        try:
+            await browser.close()
+        except Exception:
+            pass
+        try:
+            replacement = await self._launch_browser()
+        except Exception as e:
+            print(f"⚠ Browser relaunch failed, pool down to {len(pool)}: {e}")
+            return
+        if self._browser_pool is pool:
+            pool.append(replacement)
+        else:
+            await replacement.close()
 
     async def render_html_to_pdf(
         self, 
@@ -44,60 +209,30 @@ class PDFGeneratorService:
             Path to generated PDF file
         """
         try:
-            from pyppeteer import launch
-
             output_path = self.output_dir / output_filename
 
-            # Try to find a local Chrome/Edge executable to avoid pyppeteer downloading Chromium
-            def _find_chrome_executable() -> Optional[str]:
-                # Environment variable overrides
-                env_candidates = [
-                    os.environ.get("CHROME_PATH"),
-                    os.environ.get("CHROME_BIN"),
-                    os.environ.get("CHROME_EXECUTABLE"),
-                ]
-                for c in env_candidates:
-                    if c:
-                        # If it's a path, check existence; if it's a command, which() will resolve
-                        if os.path.exists(c):
-                            return c
-                        found = shutil.which(c)
-                        if found:
-                            return found
-
-                # Common Windows install locations
-                windows_paths = [
-                    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-                    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-                    r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
-                    r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
-                ]
-                for p in windows_paths:
-                    if os.path.exists(p):
-                        return p
-
-                # Fallback to PATH lookup
-                for name in ("chrome", "google-chrome", "chromium", "chromium-browser", "msedge", "edge"):
-                    path = shutil.which(name)
-                    if path:
-                        return path
-
-                return None
-
-            chrome_path = _find_chrome_executable()
-            if chrome_path:
-                print(f"→ Using existing Chrome executable: {chrome_path}")
-            else:
-                print("→ No system Chrome found — pyppeteer will download a Chromium binary (first run only).")
+            async with self._browser() as browser:
+                await self._print_page(browser, html_string, output_path, page_size, margin)
 
-            launch_kwargs = {"headless": True, "args": ["--no-sandbox"]}
-            if chrome_path:
-                launch_kwargs["executablePath"] = chrome_path
-            
-            # Launch browser
-            browser = await launch(**launch_kwargs)
-            page = await browser.newPage()
+            print(f"✓ PDF generated: {output_path}")
+            return str(output_path)
             
+        except Exception as e:
+            # Provide more actionable error message when Chromium download fails
+            msg = str(e)
+            if "chromium" in msg.lower() or "downloadable not found" in msg.lower() or "NoSuchKey" in msg:
+                msg = (
+                    "Chromium/Chrome launch failed. Ensure Chrome or Edge is installed on the host, or set the "
+                    "environment variable CHROME_PATH (or CHROME_BIN / CHROME_EXECUTABLE) to the browser executable path. "
+                    "Example (Windows): C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
+                )
+            print(f"✗ Error generating PDF: {msg}")
+            raise
+
+    async def _print_page(self, browser, html_string: str, output_path: Path, page_size, margin: str):
+        """Open a page on the given browser and print the HTML to output_path"""
+        page = await browser.newPage()
+        try:
             # Set viewport size based on page dimensions
             # For shelf talkers and small formats, use appropriate viewport
             viewport_width = 1200
@@ -170,22 +305,8 @@ class PDFGeneratorService:
             
             # Generate PDF
             await page.pdf(pdf_options)
-            
-            await browser.close()
-            print(f"✓ PDF generated: {output_path}")
-            return str(output_path)
-            
-        except Exception as e:
-            # Provide more actionable error message when Chromium download fails
-            msg = str(e)
-            if "chromium" in msg.lower() or "downloadable not found" in msg.lower() or "NoSuchKey" in msg:
-                msg = (
-                    "Chromium/Chrome launch failed. Ensure Chrome or Edge is installed on the host, or set the "
-                    "environment variable CHROME_PATH (or CHROME_BIN / CHROME_EXECUTABLE) to the browser executable path. "
-                    "Example (Windows): C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
-                )
-            print(f"✗ Error generating PDF: {msg}")
-            raise
+        finally:
+            await page.close()
 
     def render_template(
         self, 
@@ -203,12 +324,87 @@ class PDFGeneratorService:
             Rendered HTML string
         """
         try:
-            jinja_template = Jinja2Template(template_html)
+            jinja_template = self.compile_template(template_html)
             return jinja_template.render(context)
         except Exception as e:
             print(f"✗ Error rendering template: {e}")
             raise
 
+    def compile_template(self, template_html: str) -> Jinja2Template:
+        """
+        Compile a Jinja2 template, reusing the compiled version for identical HTML.
+        
+        Args:
+            template_html: HTML template string with Jinja2 syntax
+            
+        Returns:
+            Compiled Jinja2 template
+        """
+        return compile_template_cached(self._template_cache, template_html)
+
+    async def render_template_async(self, template_html: str, context: dict) -> str:
+        """
+        Render a template without blocking the event loop on big batches.
+
+        Batches of PROCESS_RENDER_MIN_OFFERS offers or more are rendered in the
+        process pool; smaller ones render inline, where the pickling overhead
+        would outweigh the work.
+
+        Args:
+            template_html: HTML template string with Jinja2 syntax
+            context: Dictionary of variables for template rendering
+
+        Returns:
+            Rendered HTML string
+        """
+        executor = get_executor_service()
+        if executor.has_process_pool and len(context.get("offers") or []) >= PROCESS_RENDER_MIN_OFFERS:
+            try:
+                return await executor.run_in_process(render_template_in_process, template_html, context)
+            except Exception as e:
+                print(f"✗ Error rendering template: {e}")
+                raise
+        return self.render_template(template_html, context)
+
+    async def warm_up(self, templates: List[dict]):
+        """
+        Launch the browser pool, compile templates and render one throwaway
+        label per template so the first real request is served warm.
+        
+        Args:
+            templates: Template dicts with html_content and layout_options
+        """
+        await self.start_browser_pool()
+
+        sample_offer = {
+            "product_id": "warmup",
+            "product_name": "Warm-up Label",
+            "brand": "AOPS",
+            "offer_type": "Discount",
+            "offer_details": "Save ₹9",
+            "price": 51.0,
+            "mrp": 60.0,
+            "valid_till": "",
+            "custom_fields": {}
+        }
+        for template in templates:
+            html = template.get("html_content")
+            if not html:
+                continue
+            self.compile_template(html)
+            output_filename = f".warmup_{hashlib.sha1(html.encode('utf-8')).hexdigest()[:12]}.pdf"
+            pdf_path = await self.generate_batch_pdf(
+                offers=[sample_offer],
+                template_html=html,
+                layout_options=template.get("layout_options"),
+                output_filename=output_filename
+            )
+            try:
+                os.remove(pdf_path)
+            except OSError:
+                pass
+            print(f"✓ Warmed template: {template.get('name', 'unnamed')}")
+
     def _resolve_page_size(self, page_size) -> dict:
         """
         Normalize page size information for both PDF options and template styling.
@@ -271,18 +467,10 @@ class PDFGeneratorService:
             
             # Prepare context with offers
             page_size_info = self._resolve_page_size(layout_options.get("pageSize"))
-            context = {
-                "offers": offers,
-                "layout": layout_options,
-                "total_offers": len(offers),
-                "page_size_css": page_size_info["css"],
-                "label_width": page_size_info["label_width"],
-                "label_height": page_size_info["label_height"],
-                "branding": branding or {}
-            }
+            context = self.build_context(offers, layout_options, branding)
             
             # Render template with offers
-            rendered_html = self.render_template(template_html, context)
+            rendered_html = await self.render_template_async(template_html, context)
             
             # Generate PDF
             return await self.render_html_to_pdf(
@@ -295,6 +483,85 @@ class PDFGeneratorService:
             print(f"✗ Error generating batch PDF: {e}")
             raise
 
+    def build_context(self, offers: list, layout_options: dict, branding: dict = None) -> dict:
+        """
+        Build the Jinja2 context shared by PDF, preview and raster rendering.
+        
+        Args:
+            offers: List of offer dictionaries
+            layout_options: Layout configuration (pageSize, perPage, etc.)
+            branding: Brand configuration (logo, colors, fonts)
+            
+        Returns:
+            Template context dict
+        """
+        page_size_info = self._resolve_page_size((layout_options or {}).get("pageSize"))
+        return {
+            "offers": offers,
+            "layout": layout_options,
+            "total_offers": len(offers),
+            "page_size_css": page_size_info["css"],
+            "label_width": page_size_info["label_width"],
+            "label_height": page_size_info["label_height"],
+            "branding": branding or {}
+        }
+
+    async def capture_label_screenshot(
+        self,
+        html_string: str,
+        viewport_width: int,
+        viewport_height: int,
+        scale: float = 1.0,
+        selector: str = ".shelf-wrapper"
+    ) -> Tuple[bytes, List[dict]]:
+        """
+        Render HTML in a pooled browser and capture one full-page PNG plus the
+        bounding box (in CSS px) of every element matching `selector`.
+        
+        Args:
+            html_string: Rendered HTML containing one element per label
+            viewport_width: Viewport width in CSS px
+            viewport_height: Viewport height in CSS px
+            scale: Device scale factor, so CSS px * scale = output px
+            selector: CSS selector matching one element per label
+            
+        Returns:
+            Tuple of (png_bytes, list of {x, y, width, height})
+        """
+        async with self._browser() as browser:
+            page = await browser.newPage()
+            try:
+                await page.setViewport({
+                    "width": viewport_width,
+                    "height": viewport_height,
+                    "deviceScaleFactor": scale
+                })
+                await page.evaluate("""
+                    (html) => {
+                        document.open();
+                        document.write(html);
+                        document.close();
+                    }
+                """, html_string)
+                # Wait for images and fonts instead of a fixed sleep
+                await page.evaluate("""
+                    () => Promise.all(Array.from(document.images)
+                        .filter(img => !img.complete)
+                        .map(img => new Promise(resolve => { img.onload = img.onerror = resolve; })))
+                        .then(() => document.fonts ? document.fonts.ready : null)
+                        .then(() => null)
+                """)
+                boxes = await page.evaluate("""
+                    (sel) => Array.from(document.querySelectorAll(sel)).map(el => {
+                        const r = el.getBoundingClientRect();
+                        return {x: r.left + window.scrollX, y: r.top + window.scrollY, width: r.width, height: r.height};
+                    })
+                """, selector)
+                png = await page.screenshot({"fullPage": True, "type": "png"})
+            finally:
+                await page.close()
+        return png, boxes
+
     def get_pdf_download_url(self, output_filename: str) -> str:
         """
         Get the download URL for a PDF.
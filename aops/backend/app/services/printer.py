@@ -0,0 +1,494 @@
+"""
+Thermal printer output service module.
+Compiles the preset shelf-talker layouts straight to ZPL or ESC/POS command
+streams, skipping the Chromium PDF step for direct thermal label printers.
+"""
+
+import os
+import asyncio
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+from app.services.ingest import pricing_fields, to_float
+
+
+# Label geometry of the preset shelf talkers
+LABEL_WIDTH_MM = 95
+LABEL_HEIGHT_MM = 40
+
+SUPPORTED_LANGUAGES = ("zpl", "escpos")
+SUPPORTED_DPI = (203, 300)
+DEFAULT_PRINTER_PORT = 9100
+# Label amounts stored at ingest (see ingest.pricing_fields)
+DISPLAY_FIELDS = ("price_display", "mrp_display", "savings_display", "discount_pct_display")
+
+
+def _parse_printer_allowlist(value: str) -> Dict[str, Tuple[str, int]]:
+    """Parse "name=host:port,host:port" into {name: (host, port)} (name defaults to host:port)"""
+    printers = {}
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, address = entry.rpartition("=")
+        host, _, port = address.partition(":")
+        host = host.strip()
+        port = int(port) if port.strip() else DEFAULT_PRINTER_PORT
+        printers[name.strip() or f"{host}:{port}"] = (host, port)
+    return printers
+
+
+# Network printers jobs may be sent to (tcp target); anything else is refused
+# so the API cannot be used to open connections into the internal network
+ALLOWED_PRINTERS = _parse_printer_allowlist(os.getenv("AOPS_PRINTERS", ""))
+
+# Name the logo is stored under in printer RAM (ZPL ~DG / ^XG)
+ZPL_LOGO_NAME = "R:AOPSLOGO.GRF"
+
+LOGOS_DIR = Path(__file__).resolve().parent.parent / "logos"
+
+# Print layouts mirroring the preset HTML templates. Coordinates are in mm
+# from the top-left corner of a 95x40 mm label.
+#   text: (field, x, y, font_height, block_width, max_lines, reverse)
+#   box:  (x, y, width, height)  filled black
+#   logo: (x, y, width, height)  drawn reversed (logos sit on the black box)
+#                                only when branding has a logo
+PRINT_LAYOUTS = {
+    "minimal": [
+        ("text", "name_upper", 3, 3, 5, 89, 2, False),
+        ("text", "details_line", 3, 15, 3, 89, 1, False),
+        ("text", "mrp_line", 3, 20, 3.5, 89, 1, False),
+        ("text", "save_line", 3, 26, 9, 89, 1, False),
+    ],
+    "branded": [
+        ("text", "name", 3, 3, 4, 52, 2, False),
+        ("text", "details_line", 3, 13, 3, 52, 1, False),
+        ("text", "savings_off", 3, 19, 10, 52, 1, False),
+        ("text", "mrp_line", 3, 32, 3, 52, 1, False),
+        ("box", 58, 0, 37, 40),
+        ("logo", 61, 3, 31, 14),
+        ("text", "percent", 61, 20, 9, 31, 1, True),
+        ("text", "savings_label", 61, 31, 3, 31, 1, True),
+    ],
+    "loyal": [
+        ("text", "name", 3, 3, 3.5, 52, 3, False),
+        ("text", "rupee", 58, 8, 7, 6, 1, False),
+        ("text", "price", 64, 3, 16, 29, 1, False),
+        ("box", 0, 26, 95, 10),
+        ("logo", 3, 27, 30, 8),
+        ("text", "percent_savings", 58, 28, 5, 35, 1, True),
+    ],
+}
+
+
+def _dots(mm: float, dpi: int) -> int:
+    """Convert millimetres to printer dots"""
+    return int(round(mm * dpi / 25.4))
+
+
+def label_values(offer: Dict[str, Any], branding: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Compute the text shown on a label, matching the preset templates.
+
+    Thermal printer fonts have no rupee glyph, so amounts use "Rs".
+    Amounts come from the *_display strings stored at ingest, so printed
+    labels match the PDF ones; offers ingested before those existed have
+    them derived here.
+
+    Args:
+        offer: Offer dictionary
+        branding: Brand configuration (brand name is hidden when a logo is shown)
+
+    Returns:
+        Dict of field name to display string
+    """
+    branding = branding or {}
+    shown = offer
+    if any(offer.get(field) is None for field in DISPLAY_FIELDS):
+        shown = pricing_fields(to_float(offer.get("price")), to_float(offer.get("mrp")))
+    price = shown["price_display"]
+    savings = shown["savings_display"]
+    percent = shown["discount_pct_display"]
+    brand = offer.get("brand") or ""
+    details = offer.get("offer_details") or ""
+    has_logo = bool(branding.get("logo_url") or branding.get("logo_data"))
+    details_line = details if has_logo or not brand else f"{brand} - {details}"
+
+    return {
+        "name": offer.get("product_name") or "",
+        "name_upper": (offer.get("product_name") or "").upper(),
+        "details_line": details_line.upper(),
+        "mrp_line": f"ON MRP Rs {shown['mrp_display']}",
+        "save_line": f"SAVE Rs {savings}/-",
+        "savings_off": f"Rs {savings} OFF",
+        "rupee": "Rs",
+        "price": price,
+        "percent": f"{percent}%" if percent else "",
+        "savings_label": "savings" if percent else "",
+        "percent_savings": f"{percent}% SAVINGS" if percent else "",
+    }
+
+
+def resolve_print_layout(template: Optional[Dict[str, Any]]) -> str:
+    """Pick the print layout for a template (custom templates use 'minimal')"""
+    layout = (template or {}).get("print_layout")
+    return layout if layout in PRINT_LAYOUTS else "minimal"
+
+
+class LogoGraphic:
+    """A logo converted to a 1-bit bitmap sized for a printer layout box"""
+
+    def __init__(self, rows: bytes, bytes_per_row: int, width: int, height: int):
+        self.rows = rows
+        self.bytes_per_row = bytes_per_row
+        self.width = width
+        self.height = height
+
+
+class PrinterService:
+    """Service for compiling offers to thermal printer command streams"""
+
+    def __init__(self, output_dir: str = "./print"):
+        """
+        Initialize printer service.
+
+        Args:
+            output_dir: Directory to save compiled print jobs
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._logo_cache: Dict[Tuple, Optional[LogoGraphic]] = {}
+
+    # ==================== LOGO GRAPHICS ====================
+
+    def _logo_path(self, branding: Optional[Dict[str, Any]]) -> Optional[Path]:
+        """Resolve a branding logo to a local file (remote and SVG logos are skipped)"""
+        logo_url = (branding or {}).get("logo_url")
+        if not logo_url or not isinstance(logo_url, str):
+            return None
+        filename = os.path.basename(logo_url.split("?", 1)[0])
+        path = LOGOS_DIR / filename
+        if not filename or path.suffix.lower() == ".svg" or not path.is_file():
+            return None
+        return path
+
+    def get_logo_graphic(self, branding: Optional[Dict[str, Any]], box_w: int, box_h: int) -> Optional[LogoGraphic]:
+        """
+        Load the branding logo as a 1-bit bitmap fitted into a box of dots.
+        Results are cached per file, modification time and box size.
+
+        Args:
+            branding: Brand configuration
+            box_w: Box width in dots
+            box_h: Box height in dots
+
+        Returns:
+            LogoGraphic or None when the brand has no printable logo
+        """
+        path = self._logo_path(branding)
+        if path is None:
+            return None
+        key = (str(path), path.stat().st_mtime, box_w, box_h)
+        if key in self._logo_cache:
+            return self._logo_cache[key]
+
+        import numpy as np
+        from PIL import Image
+
+        image = Image.open(path).convert("RGBA")
+        image.thumbnail((box_w, box_h))
+        pixels = np.asarray(image, dtype=np.float32)
+        alpha = pixels[..., 3] / 255.0
+        luminance = (pixels[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)) / 255.0
+
+        # Light logos (made for dark backgrounds) print their opaque pixels;
+        # dark logos print their dark pixels.
+        opaque = alpha > 0.5
+        light_logo = opaque.any() and luminance[opaque].mean() > 0.5
+        ink = opaque if light_logo else (opaque & (luminance < 0.5))
+
+        packed = np.packbits(ink, axis=-1)
+        graphic = LogoGraphic(packed.tobytes(), packed.shape[1], image.width, image.height)
+        self._logo_cache[key] = graphic
+        return graphic
+
+    # ==================== ZPL ====================
+
+    @staticmethod
+    def _zpl_field(text: str) -> str:
+        """Escape field data for use with ^FH (hex escapes for control characters)"""
+        return (text.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E"))
+
+    def compile_zpl(
+        self,
+        offers: List[Dict[str, Any]],
+        layout: str = "minimal",
+        branding: Optional[Dict[str, Any]] = None,
+        dpi: int = 203
+    ) -> bytes:
+        """
+        Compile offers into one ZPL job, one ^XA..^XZ block per label.
+        The logo is downloaded to printer RAM once per job with ~DG and
+        recalled per label with ^XG.
+
+        Args:
+            offers: List of offer dictionaries
+            layout: Key of PRINT_LAYOUTS
+            branding: Brand configuration
+            dpi: Printer resolution (203 or 300)
+
+        Returns:
+            ZPL command stream
+        """
+        elements = PRINT_LAYOUTS[layout]
+        parts: List[str] = []
+
+        logo = None
+        logo_box = next((e for e in elements if e[0] == "logo"), None)
+        if logo_box:
+            logo = self.get_logo_graphic(branding, _dots(logo_box[3], dpi), _dots(logo_box[4], dpi))
+            if logo:
+                parts.append(
+                    f"~DG{ZPL_LOGO_NAME},{len(logo.rows)},{logo.bytes_per_row},{logo.rows.hex().upper()}\n"
+                )
+
+        for offer in offers:
+            values = label_values(offer, branding)
+            label = ["^XA", "^CI28", f"^PW{_dots(LABEL_WIDTH_MM, dpi)}", f"^LL{_dots(LABEL_HEIGHT_MM, dpi)}"]
+            for element in elements:
+                kind = element[0]
+                if kind == "box":
+                    _, x, y, w, h = element
+                    w_d, h_d = _dots(w, dpi), _dots(h, dpi)
+                    label.append(f"^FO{_dots(x, dpi)},{_dots(y, dpi)}^GB{w_d},{h_d},{min(w_d, h_d)}^FS")
+                elif kind == "logo":
+                    if logo:
+                        _, x, y, w, h = element
+                        label.append(f"^FO{_dots(x, dpi)},{_dots(y, dpi)}^FR^XG{ZPL_LOGO_NAME},1,1^FS")
+                elif kind == "text":
+                    _, field, x, y, h, w, lines, reverse = element
+                    text = values.get(field, "")
+                    if not text:
+                        continue
+                    h_d = _dots(h, dpi)
+                    label.append(
+                        f"^FO{_dots(x, dpi)},{_dots(y, dpi)}^A0N,{h_d},{h_d}"
+                        f"^FB{_dots(w, dpi)},{lines},0,L"
+                        f"{'^FR' if reverse else ''}^FH_^FD{self._zpl_field(text)}^FS"
+                    )
+            label.append("^XZ")
+            parts.append("\n".join(label) + "\n")
+
+        return "".join(parts).encode("utf-8")
+
+    # ==================== ESC/POS ====================
+
+    def compile_escpos(
+        self,
+        offers: List[Dict[str, Any]],
+        layout: str = "minimal",
+        branding: Optional[Dict[str, Any]] = None,
+        dpi: int = 203
+    ) -> bytes:
+        """
+        Compile offers into an ESC/POS stream. ESC/POS prints top to bottom,
+        so layout elements are emitted in row order; boxes are dropped and
+        reversed text uses white-on-black mode (GS B).
+
+        Args:
+            offers: List of offer dictionaries
+            layout: Key of PRINT_LAYOUTS
+            branding: Brand configuration
+            dpi: Printer resolution (203 or 300)
+
+        Returns:
+            ESC/POS command stream
+        """
+        elements = sorted(
+            (e for e in PRINT_LAYOUTS[layout] if e[0] != "box"),
+            key=lambda e: (e[2 if e[0] == "logo" else 3], e[1 if e[0] == "logo" else 2])
+        )
+
+        logo_cmd = b""
+        logo_box = next((e for e in elements if e[0] == "logo"), None)
+        if logo_box:
+            logo = self.get_logo_graphic(branding, _dots(logo_box[3], dpi), _dots(logo_box[4], dpi))
+            if logo:
+                # GS v 0: raster bit image, width in bytes and height in dots (little endian)
+                logo_cmd = (
+                    b"\x1dv0\x00"
+                    + logo.bytes_per_row.to_bytes(2, "little")
+                    + logo.height.to_bytes(2, "little")
+                    + logo.rows
+                    + b"\n"
+                )
+
+        out = bytearray(b"\x1b@")  # ESC @: initialize
+        for offer in offers:
+            values = label_values(offer, branding)
+            for element in elements:
+                if element[0] == "logo":
+                    out += logo_cmd
+                    continue
+                _, field, x, y, h, w, lines, reverse = element
+                text = values.get(field, "")
+                if not text:
+                    continue
+                # Font A is 24 dots tall; GS ! takes width/height multipliers 1..8
+                mult = max(1, min(8, round(_dots(h, dpi) / 24)))
+                out += b"\x1d!" + bytes([((mult - 1) << 4) | (mult - 1)])
+                if reverse:
+                    out += b"\x1dB\x01"
+                out += text.encode("ascii", "replace") + b"\n"
+                if reverse:
+                    out += b"\x1dB\x00"
+            out += b"\x1d!\x00"
+            out += b"\x1dV\x42\x00"  # GS V B 0: feed to cut position and cut
+        return bytes(out)
+
+    # ==================== OUTPUT ====================
+
+    def compile(
+        self,
+        offers: List[Dict[str, Any]],
+        language: str = "zpl",
+        layout: str = "minimal",
+        branding: Optional[Dict[str, Any]] = None,
+        dpi: int = 203
+    ) -> bytes:
+        """Compile offers in the requested printer language"""
+        if language not in SUPPORTED_LANGUAGES:
+            raise ValueError(f"Unsupported printer language: {language}")
+        if dpi not in SUPPORTED_DPI:
+            raise ValueError(f"Unsupported printer resolution: {dpi}")
+        if language == "zpl":
+            return self.compile_zpl(offers, layout, branding, dpi)
+        return self.compile_escpos(offers, layout, branding, dpi)
+
+    async def send_tcp(self, data: bytes, host: str, port: int = DEFAULT_PRINTER_PORT, timeout: float = 10.0):
+        """
+        Send a compiled job to a network printer (raw port, usually 9100).
+
+        Args:
+            data: Command stream
+            host: Printer host
+            port: Printer raw TCP port
+            timeout: Connect/write timeout in seconds
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        try:
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), timeout=timeout)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def print_offers(
+        self,
+        offers: List[Dict[str, Any]],
+        printer: Optional[Dict[str, Any]] = None,
+        template: Optional[Dict[str, Any]] = None,
+        branding: Optional[Dict[str, Any]] = None,
+        output_basename: str = "labels"
+    ) -> Dict[str, Any]:
+        """
+        Compile offers and write the job to a file or send it over TCP.
+
+        Args:
+            offers: List of offer dictionaries
+            printer: { language, dpi, target: 'file' | 'tcp', printer_id or host/port }
+            template: Template document (selects the print layout)
+            branding: Brand configuration
+            output_basename: Filename stem for file output
+
+        Returns:
+            Dict describing the job (language, size, filename or host)
+        """
+        try:
+            printer = printer or {}
+            language = printer.get("language", "zpl")
+            dpi = int(printer.get("dpi", 203))
+            layout = printer.get("layout") or resolve_print_layout(template)
+            if layout not in PRINT_LAYOUTS:
+                raise ValueError(f"Unknown print layout: {layout}")
+            target = printer.get("target", "file")
+            if target == "tcp":
+                # Refuse unlisted printers before doing any work
+                host, port = resolve_allowed_printer(printer)
+            data = self.compile(offers, language, layout, branding, dpi)
+
+            result = {
+                "language": language,
+                "layout": layout,
+                "dpi": dpi,
+                "label_count": len(offers),
+                "size": len(data)
+            }
+
+            if target == "tcp":
+                await self.send_tcp(data, host, port)
+                result.update(target="tcp", host=host, port=port)
+                print(f"✓ Print job sent to {host}:{port} ({len(data)} bytes)")
+            elif target == "file":
+                filename = f"{output_basename}.{'zpl' if language == 'zpl' else 'bin'}"
+                with open(self.output_dir / filename, "wb") as f:
+                    f.write(data)
+                result.update(target="file", filename=filename)
+                print(f"✓ Print job written: {self.output_dir / filename} ({len(data)} bytes)")
+            else:
+                raise ValueError(f"Unsupported printer target: {target}")
+
+            return result
+
+        except Exception as e:
+            print(f"✗ Error compiling print job: {e}")
+            raise
+
+
+def resolve_allowed_printer(printer: Dict[str, Any]) -> Tuple[str, int]:
+    """
+    Look up the network printer a job names in ALLOWED_PRINTERS.
+
+    Args:
+        printer: { printer_id } naming an allowlist entry, or { host, port }
+                 matching one exactly
+
+    Returns:
+        Tuple of (host, port) from the allowlist
+
+    Raises:
+        ValueError: If the printer is not in the allowlist
+    """
+    printer_id = printer.get("printer_id")
+    if printer_id:
+        if printer_id not in ALLOWED_PRINTERS:
+            raise ValueError(f"Unknown printer: {printer_id}")
+        return ALLOWED_PRINTERS[printer_id]
+    host = printer.get("host")
+    if not host:
+        raise ValueError("Printer host or printer_id required for tcp target")
+    try:
+        port = int(printer.get("port", DEFAULT_PRINTER_PORT))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid printer port")
+    if (host, port) not in ALLOWED_PRINTERS.values():
+        raise ValueError(f"Printer {host}:{port} is not in the allowed printers (AOPS_PRINTERS)")
+    return host, port
+
+
+# Global printer service instance
+printer_service: Optional[PrinterService] = None
+
+
+def init_printer_service(output_dir: str = "./print") -> PrinterService:
+    """Initialize global printer service instance"""
+    global printer_service
+    printer_service = PrinterService(output_dir)
+    return printer_service
+
+
+def get_printer_service() -> PrinterService:
+    """Get the global printer service instance"""
+    if printer_service is None:
+        return init_printer_service()
+    return printer_service
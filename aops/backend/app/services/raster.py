@@ -0,0 +1,346 @@
+"""
+Raster output service module.
+Renders shelf-talker templates to 1-bit or three-color bitmaps for
+electronic (e-paper) shelf labels and packs them into binary frames.
+"""
+
+import io
+import json
+import math
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+import numpy as np
+
+from app.services.pdfgen import get_pdf_service
+from app.services.executor import get_executor_service
+
+
+# Known e-paper panel profiles (pixel resolution and ink palette)
+RASTER_PROFILES = {
+    "epd-2.13-bw": {"width": 250, "height": 122, "palette": "bw"},
+    "epd-2.13-bwr": {"width": 250, "height": 122, "palette": "bwr"},
+    "epd-2.9-bw": {"width": 296, "height": 128, "palette": "bw"},
+    "epd-2.9-bwr": {"width": 296, "height": 128, "palette": "bwr"},
+    "epd-4.2-bw": {"width": 400, "height": 300, "palette": "bw"},
+    "epd-4.2-bwr": {"width": 400, "height": 300, "palette": "bwr"},
+}
+
+# Palette entries in index order: 0 = white, 1 = black, 2 = red
+PALETTES = {
+    "bw": np.array([[255, 255, 255], [0, 0, 0]], dtype=np.float32),
+    "bwr": np.array([[255, 255, 255], [0, 0, 0], [255, 0, 0]], dtype=np.float32),
+}
+
+# Chromium refuses screenshots taller than this, so labels are rendered in chunks
+MAX_SCREENSHOT_HEIGHT = 16000
+
+# Elements the preset templates render once per offer
+LABEL_SELECTOR = ".shelf-wrapper, .shelf-talker"
+
+# Label size used when the layout does not specify one (matches the presets)
+DEFAULT_LABEL_MM = ("95mm", "40mm")
+
+CSS_PX_PER_MM = 96.0 / 25.4
+
+
+def _bayer_matrix(size: int = 8) -> np.ndarray:
+    """Return a normalized (0..1) ordered-dither threshold matrix"""
+    m = np.array([[0, 2], [3, 1]])
+    while m.shape[0] < size:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / m.size
+
+
+BAYER_8 = _bayer_matrix(8).astype(np.float32)
+
+
+def resolve_raster_options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Normalize raster options into width, height, palette and dither.
+
+    Args:
+        options: { profile } or { width, height, palette }, plus optional dither
+
+    Returns:
+        Dict with width, height, palette ('bw' | 'bwr') and dither ('ordered' | 'threshold')
+    """
+    options = dict(options or {})
+    profile = options.get("profile")
+    if profile:
+        if profile not in RASTER_PROFILES:
+            raise ValueError(f"Unknown raster profile: {profile}")
+        resolved = dict(RASTER_PROFILES[profile])
+    else:
+        resolved = dict(RASTER_PROFILES["epd-2.9-bw"])
+    for key in ("width", "height", "palette"):
+        if options.get(key):
+            resolved[key] = options[key]
+    resolved["width"] = int(resolved["width"])
+    resolved["height"] = int(resolved["height"])
+    if resolved["palette"] not in PALETTES:
+        raise ValueError(f"Unsupported palette: {resolved['palette']}")
+    resolved["dither"] = options.get("dither", "ordered")
+    if resolved["dither"] not in ("ordered", "threshold"):
+        raise ValueError(f"Unsupported dither mode: {resolved['dither']}")
+    resolved["profile"] = profile
+    return resolved
+
+
+def quantize_frames(frames: np.ndarray, palette: str = "bw", dither: str = "ordered") -> np.ndarray:
+    """
+    Quantize a batch of RGB frames to palette indices.
+
+    Black/white is decided on luminance with an ordered (Bayer) dither, which
+    is fully vectorized across the batch. For 'bwr', pixels whose nearest
+    palette color is red are mapped to red before dithering the rest.
+    Callers pass one screenshot chunk at a time, so the float copies stay small.
+
+    Args:
+        frames: uint8 array of shape (N, H, W, 3)
+        palette: 'bw' or 'bwr'
+        dither: 'ordered' or 'threshold'
+
+    Returns:
+        uint8 array of shape (N, H, W) with 0 = white, 1 = black, 2 = red
+    """
+    rgb = frames.astype(np.float32)
+    luminance = (rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)) / 255.0
+
+    height, width = luminance.shape[1:3]
+    if dither == "ordered":
+        reps = (math.ceil(height / 8), math.ceil(width / 8))
+        threshold = np.tile(BAYER_8, reps)[:height, :width]
+    else:
+        threshold = np.float32(0.5)
+
+    indices = (luminance < threshold).astype(np.uint8)
+
+    if palette == "bwr":
+        # Nearest color is red when strictly closer than white and black
+        # (one (N, H, W) distance at a time rather than an (N, H, W, 3, 3) tensor)
+        white, black, red = (((rgb - color) ** 2).sum(axis=-1) for color in PALETTES["bwr"])
+        indices[(red < white) & (red < black)] = 2
+
+    return indices
+
+
+def pack_frames(indices: np.ndarray, palette: str = "bw") -> bytes:
+    """
+    Pack palette indices into e-paper frame buffers.
+
+    Each frame is one bit plane per ink, rows padded to whole bytes, MSB
+    first, with a set bit meaning the pixel is inked. 'bw' frames contain the
+    black plane only; 'bwr' frames contain the black plane followed by the red
+    plane. All frames in a batch have the same size.
+
+    Args:
+        indices: uint8 array of shape (N, H, W) from quantize_frames()
+        palette: 'bw' or 'bwr'
+
+    Returns:
+        Concatenated frame bytes
+    """
+    planes = [np.packbits(indices == 1, axis=-1)]
+    if palette == "bwr":
+        planes.append(np.packbits(indices == 2, axis=-1))
+    return np.concatenate(planes, axis=1).tobytes()
+
+
+def _quantize_and_pack(frames: np.ndarray, palette: str, dither: str) -> bytes:
+    """Quantize and pack one chunk of frames (blocking)"""
+    return pack_frames(quantize_frames(frames, palette, dither), palette)
+
+
+def frame_size(width: int, height: int, palette: str = "bw") -> int:
+    """Size in bytes of one packed frame"""
+    return math.ceil(width / 8) * height * (2 if palette == "bwr" else 1)
+
+
+class RasterService:
+    """Service for rendering offers to packed e-paper label bitmaps"""
+
+    def __init__(self, output_dir: str = "./esl"):
+        """
+        Initialize raster service.
+
+        Args:
+            output_dir: Directory to save frame files and manifests
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    async def render_label_frames(
+        self,
+        offers: list,
+        template_html: str,
+        options: Dict[str, Any],
+        layout_options: dict = None,
+        branding: dict = None
+    ) -> AsyncIterator[np.ndarray]:
+        """
+        Render one RGB bitmap per offer at the target resolution.
+
+        Labels are rendered in chunks, each chunk as one page and one
+        screenshot, then sliced by the label element bounding boxes. Chunks
+        are yielded as they are captured, so a large selection is never held
+        in memory at once.
+
+        Args:
+            offers: List of offer dictionaries
+            template_html: HTML template with Jinja2 syntax
+            options: Resolved raster options (width, height, ...)
+            layout_options: Template layout options
+            branding: Brand configuration
+
+        Yields:
+            uint8 arrays of shape (chunk, height, width, 3), in offer order
+        """
+        from PIL import Image
+
+        pdf_service = get_pdf_service()
+        width, height = options["width"], options["height"]
+
+        # Lay labels out at their physical size, one per page row
+        layout = dict(layout_options or {})
+        page_size = layout.get("pageSize")
+        if not isinstance(page_size, dict):
+            page_size = {"width": layout.get("tagWidth", DEFAULT_LABEL_MM[0]),
+                         "height": layout.get("tagHeight", DEFAULT_LABEL_MM[1])}
+        layout["pageSize"] = page_size
+        css_width = float(str(page_size["width"]).replace("mm", "")) * CSS_PX_PER_MM
+        css_height = float(str(page_size["height"]).replace("mm", "")) * CSS_PX_PER_MM
+        scale = width / css_width
+
+        chunk_size = max(1, int(MAX_SCREENSHOT_HEIGHT // max(1, height)))
+
+        for start in range(0, len(offers), chunk_size):
+            chunk = offers[start:start + chunk_size]
+            context = pdf_service.build_context(chunk, layout, branding)
+            html = await pdf_service.render_template_async(template_html, context)
+            png, boxes = await pdf_service.capture_label_screenshot(
+                html,
+                viewport_width=math.ceil(css_width),
+                viewport_height=math.ceil(css_height),
+                scale=scale,
+                selector=LABEL_SELECTOR
+            )
+            if len(boxes) < len(chunk):
+                raise ValueError(
+                    f"Template rendered {len(boxes)} label elements for {len(chunk)} offers"
+                )
+
+            page = Image.open(io.BytesIO(png)).convert("RGB")
+            page_scale = page.width / math.ceil(css_width)
+            frames = np.empty((len(chunk), height, width, 3), dtype=np.uint8)
+            for i, box in enumerate(boxes[:len(chunk)]):
+                crop = page.crop((
+                    round(box["x"] * page_scale),
+                    round(box["y"] * page_scale),
+                    round((box["x"] + box["width"]) * page_scale),
+                    round((box["y"] + box["height"]) * page_scale),
+                ))
+                if crop.size != (width, height):
+                    crop = crop.resize((width, height), Image.BILINEAR)
+                frames[i] = np.asarray(crop)
+            yield frames
+
+    async def generate_frames(
+        self,
+        offers: list,
+        template_html: str,
+        raster_options: Optional[Dict[str, Any]] = None,
+        layout_options: dict = None,
+        branding: dict = None,
+        output_basename: str = "labels"
+    ) -> Dict[str, Any]:
+        """
+        Render, quantize and pack a batch of labels into a frame file.
+
+        Writes `<output_basename>.bin` (frames back to back, in offer order)
+        and `<output_basename>.json` (manifest mapping offers to frames).
+        Each screenshot chunk is quantized, packed and appended to the .bin
+        file as soon as it is rendered.
+
+        Args:
+            offers: List of offer dictionaries
+            template_html: HTML template with Jinja2 syntax
+            raster_options: { profile } or { width, height, palette }, plus dither
+            layout_options: Template layout options
+            branding: Brand configuration
+            output_basename: Filename stem for the frame file and manifest
+
+        Returns:
+            Manifest dict (also written to disk)
+        """
+        try:
+            options = resolve_raster_options(raster_options)
+            bin_name = f"{output_basename}.bin"
+            executor = get_executor_service()
+            bin_path = self.output_dir / bin_name
+            try:
+                with open(bin_path, "wb") as f:
+                    async for frames in self.render_label_frames(
+                        offers, template_html, options, layout_options, branding
+                    ):
+                        data = await executor.run_in_thread(
+                            _quantize_and_pack, frames, options["palette"], options["dither"]
+                        )
+                        f.write(data)
+            except BaseException:
+                bin_path.unlink(missing_ok=True)
+                raise
+
+            manifest_name = f"{output_basename}.json"
+            size = frame_size(options["width"], options["height"], options["palette"])
+            manifest = {
+                "format": "aops-esl-frames/1",
+                "profile": options["profile"],
+                "width": options["width"],
+                "height": options["height"],
+                "palette": options["palette"],
+                "dither": options["dither"],
+                "planes": ["black", "red"] if options["palette"] == "bwr" else ["black"],
+                "frame_size": size,
+                "frame_count": len(offers),
+                "frames_file": bin_name,
+                "created_at": datetime.utcnow().isoformat(),
+                "frames": [
+                    {
+                        "index": i,
+                        "offset": i * size,
+                        "offer_id": str(offer.get("_id", "")),
+                        "product_id": offer.get("product_id")
+                    }
+                    for i, offer in enumerate(offers)
+                ]
+            }
+
+            with open(self.output_dir / manifest_name, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+            print(f"✓ ESL frames generated: {self.output_dir / bin_name} ({len(offers)} labels)")
+            return manifest
+
+        except Exception as e:
+            print(f"✗ Error generating ESL frames: {e}")
+            raise
+
+
+# Global raster service instance
+raster_service: Optional[RasterService] = None
+
+
+def init_raster_service(output_dir: str = "./esl") -> RasterService:
+    """Initialize global raster service instance"""
+    global raster_service
+    raster_service = RasterService(output_dir)
+    return raster_service
+
+
+def get_raster_service() -> RasterService:
+    """Get the global raster service instance"""
+    if raster_service is None:
+        return init_raster_service()
+    return raster_service
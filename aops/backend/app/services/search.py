@@ -0,0 +1,333 @@
+"""
+Offer search service module.
+Keeps an in-process trigram index over product_id, product_name and brand
+for each offers collection and store, so the offer picker can find products
+by name or SKU without paging through the whole catalog.
+"""
+
+import os
+import re
+import time
+import heapq
+import asyncio
+from collections import Counter
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+
+# How often a search checks MongoDB for offers written since the last check
+SEARCH_REFRESH_SECONDS = float(os.getenv("AOPS_SEARCH_REFRESH_SECONDS", "2"))
+# Rebuild an index from scratch once this old (archived offers are removed
+# through their tombstones, a cleared catalog through its removal epoch)
+SEARCH_MAX_AGE_SECONDS = float(os.getenv("AOPS_SEARCH_MAX_AGE_SECONDS", "900"))
+# Share of a misspelt word's trigrams a catalog word must contain to be suggested
+SEARCH_FUZZY_THRESHOLD = 0.5
+
+# Offer fields loaded into the index
+SEARCH_FIELDS = ["product_id", "product_name", "brand"]
+
+_WORD = re.compile(r"[^\W_]+")
+_EMPTY: frozenset = frozenset()
+
+
+def _words(text: Any) -> List[str]:
+    """Lowercase alphanumeric words of a value"""
+    return _WORD.findall(str(text).lower()) if text is not None else []
+
+
+def _trigrams(word: str, where: str = "word") -> Set[str]:
+    """
+    Trigrams of a word padded with two spaces in front and one behind, so
+    one- and two-letter prefixes have trigrams of their own.
+
+    where="prefix" leaves out the end of the word (a query typed so far),
+    where="inside" keeps only trigrams without padding (matching mid-word).
+    """
+    if where == "inside":
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+    padded = f"  {word} " if where == "word" else f"  {word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _OfferIndex:
+    """
+    Search index over the offers of one collection and store.
+
+    Offers are indexed by the distinct words of their product_id, name and
+    brand; trigrams are kept per distinct word rather than per offer, so a
+    catalog that repeats the same brands and product words stays small and
+    a query only scans the vocabulary before expanding to offers.
+    """
+
+    def __init__(self):
+        # product_id -> (offer id, product_id, product_name, brand, words, lowercase product_id)
+        self.entries: Dict[str, Tuple[str, str, str, str, Tuple[str, ...], str]] = {}
+        self.offers_by_word: Dict[str, Set[str]] = {}
+        self.words_by_gram: Dict[str, Set[str]] = {}
+        # Sync watermark the index is complete up to (see DatabaseService.sync_watermark)
+        self.max_seq = 0
+        # Removal epoch of the collection when the build started
+        self.epoch = 0
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+
+    def add_many(self, offers: List[Dict[str, Any]]):
+        """Index offers, replacing earlier entries with the same product_id"""
+        for offer in offers:
+            self.add(offer)
+
+    def add(self, offer: Dict[str, Any]):
+        product_id = str(offer.get("product_id") or "")
+        if not product_id:
+            return
+        self.remove(product_id)
+        name = str(offer.get("product_name") or "")
+        brand = str(offer.get("brand") or "")
+        words = tuple(dict.fromkeys(_words(product_id) + _words(name) + _words(brand)))
+        self.entries[product_id] = (str(offer.get("_id", "")), product_id, name, brand, words, product_id.lower())
+        for word in words:
+            offers = self.offers_by_word.get(word)
+            if offers is None:
+                offers = self.offers_by_word[word] = set()
+                for gram in _trigrams(word):
+                    self.words_by_gram.setdefault(gram, set()).add(word)
+            offers.add(product_id)
+
+    def remove(self, product_id: str):
+        entry = self.entries.pop(product_id, None)
+        if entry is None:
+            return
+        for word in entry[4]:
+            offers = self.offers_by_word[word]
+            offers.discard(product_id)
+            if offers:
+                continue
+            # Last offer using the word: drop it from the vocabulary
+            del self.offers_by_word[word]
+            for gram in _trigrams(word):
+                words = self.words_by_gram[gram]
+                words.discard(word)
+                if not words:
+                    del self.words_by_gram[gram]
+
+    def _matching_words(self, term: str) -> Dict[str, float]:
+        """Vocabulary words starting with the term (2) or, for 3+ letters, containing it (1)"""
+        grams = _trigrams(term, "inside" if len(term) >= 3 else "prefix")
+        postings = sorted((self.words_by_gram.get(gram, _EMPTY) for gram in grams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+        return {word: 2.0 if word.startswith(term) else 1.0 for word in candidates if term in word}
+
+    def _similar_words(self, term: str) -> Dict[str, float]:
+        """Vocabulary words sharing at least SEARCH_FUZZY_THRESHOLD of the term's trigrams"""
+        grams = _trigrams(term)
+        counts: Counter = Counter()
+        for gram in grams:
+            counts.update(self.words_by_gram.get(gram, _EMPTY))
+        needed = len(grams) * SEARCH_FUZZY_THRESHOLD
+        return {word: shared / len(grams) for word, shared in counts.items() if shared >= needed}
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Rank offers matching every word of the query.
+
+        A query word matches the start of an offer word (scored 2) or, from
+        three letters on, the inside of one (scored 1). A word with no such
+        match falls back to similar words (scored by shared trigrams), so
+        small typos still find something. An exact or leading product_id
+        match ranks first; ties go to the shorter product name.
+        """
+        terms = list(dict.fromkeys(_words(query)))
+        if not terms:
+            return []
+
+        scores: Optional[Dict[str, float]] = None
+        for term in sorted(terms, key=len, reverse=True):
+            words = self._matching_words(term)
+            if not words and len(term) >= 3:
+                words = self._similar_words(term)
+            term_scores: Dict[str, float] = {}
+            for word, value in words.items():
+                for product_id in self.offers_by_word[word]:
+                    if term_scores.get(product_id, 0) < value:
+                        term_scores[product_id] = value
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+            if not scores:
+                return []
+
+        needle = query.strip().lower()
+        entries = self.entries
+
+        def rank(item):
+            entry = entries[item[0]]
+            score = item[1]
+            if entry[5] == needle:
+                score += 100
+            elif entry[5].startswith(needle):
+                score += 20
+            return (-score, len(entry[2]), entry[2])
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=rank)
+        return [
+            {"id": entry[0], "product_id": entry[1], "product_name": entry[2],
+             "brand": entry[3], "score": round(-key[0], 3)}
+            for key, entry in ((rank(item), entries[item[0]]) for item in ranked)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SearchService:
+    """Per-process offer search indexes, one per offers collection and store"""
+
+    def __init__(self):
+        self._indexes: Dict[Tuple[str, Optional[str]], _OfferIndex] = {}
+        self._locks: Dict[Tuple[str, Optional[str]], asyncio.Lock] = {}
+        # Background rebuilds of expired indexes, which keep serving meanwhile
+        self._rebuilds: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+
+    async def search(self, db, query: str, limit: int = 20) -> Dict[str, Any]:
+        """
+        Search the offers of a database view (its collection and store).
+
+        Args:
+            db: DatabaseService, or a view from for_store()
+            query: Words to find in product_id, product_name or brand
+            limit: Maximum offers to return
+
+        Returns:
+            { offers: [{ id, product_id, product_name, brand, score }], indexed, elapsed_ms }
+        """
+        index = await self._index_for(db)
+        started = time.perf_counter()
+        offers = index.search(query, limit)
+        return {
+            "offers": offers,
+            "indexed": len(index),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    async def prepare(self, db):
+        """Build the index for a database view ahead of the first search"""
+        try:
+            await self._index_for(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠ Offer search index warning: {e}")
+
+    async def _index_for(self, db) -> _OfferIndex:
+        """The view's index, built on first use and refreshed with recent writes"""
+        collection = await db.offers_collection()
+        key = (collection.name, db.store_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = await self._build(db, key)
+                self._indexes[key] = index
+                return index
+            now = time.monotonic()
+            expired = now - index.built_at > SEARCH_MAX_AGE_SECONDS
+            if now - index.checked_at > SEARCH_REFRESH_SECONDS:
+                expired = not await self._refresh(db, index) or expired
+            if expired and key not in self._rebuilds:
+                task = asyncio.create_task(self._rebuild(db, key))
+                self._rebuilds[key] = task
+                task.add_done_callback(lambda _, key=key: self._rebuilds.pop(key, None))
+            return index
+
+    async def _rebuild(self, db, key: Tuple[str, Optional[str]]):
+        """Replace an expired index with a fresh one once it is built"""
+        try:
+            index = await self._build(db, key)
+        except Exception as e:
+            print(f"⚠ Offer search index rebuild warning: {e}")
+            return
+        async with self._locks[key]:
+            # Writes made during the build are above its watermark and
+            # picked up by the next refresh
+            if key in self._indexes:
+                self._indexes[key] = index
+
+    async def _build(self, db, key: Tuple[str, Optional[str]]) -> _OfferIndex:
+        """Index every offer of the view, off the event loop"""
+        from app.services.executor import get_executor_service
+
+        started = time.perf_counter()
+        index = _OfferIndex()
+        # Read before loading, so deletes and writes made meanwhile are seen later
+        index.epoch = await db.offers_removed_epoch()
+        index.max_seq = await db.sync_watermark()
+        executor = get_executor_service()
+        async for batch in db.iter_offers({}, fields=SEARCH_FIELDS):
+            # The new index is not visible to searches yet, so a thread may fill it
+            await executor.run_in_thread(index.add_many, batch)
+        print(f"✓ Offer search index for {key[0]} (store {key[1] or 'default'}) built: "
+              f"{len(index)} offers in {time.perf_counter() - started:.2f}s")
+        return index
+
+    async def _refresh(self, db, index: _OfferIndex) -> bool:
+        """
+        Apply removals and writes since the index's watermark, up to the
+        current one (a write still in flight below a later sequence is not
+        skipped). Removals go first: an offer written again after being
+        archived has the higher sequence.
+
+        Returns:
+            False if the collection was cleared since the index was built
+            (or tombstones it needs were pruned), which only a rebuild can
+            reflect
+        """
+        index.checked_at = time.monotonic()
+        epoch = await db.offers_removed_epoch()
+        watermark = await db.sync_watermark()
+        if watermark > index.max_seq:
+            for entry in await db.get_offers_removed_since(index.max_seq, limit=0, until=watermark):
+                index.remove(str(entry.get("product_id") or ""))
+            if index.max_seq < await db.tombstones_pruned_seq():
+                return False
+            query = {"sync_seq": {"$gt": index.max_seq, "$lte": watermark}}
+            async for batch in db.iter_offers(query, fields=SEARCH_FIELDS):
+                index.add_many(batch)
+            index.max_seq = watermark
+        return epoch == index.epoch
+
+    def invalidate(self, collection_name: Optional[str] = None):
+        """Forget the indexes of a collection, every store (all if None); rebuilt on next search"""
+        for key in list(self._indexes):
+            if collection_name is None or key[0] == collection_name:
+                self._indexes.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Indexed offer counts per collection and store"""
+        return {
+            f"{name}:{store or 'default'}": len(index)
+            for (name, store), index in self._indexes.items()
+        }
+
+
+# Global search service instance
+search_service: Optional[SearchService] = None
+
+
+def init_search_service() -> SearchService:
+    """Initialize global search service instance"""
+    global search_service
+    search_service = SearchService()
+    return search_service
+
+
+def get_search_service() -> SearchService:
+    """Get the global search service instance"""
+    if search_service is None:
+        return init_search_service()
+    return search_service
+
+
+def invalidate_offer_search(collection_name: Optional[str] = None):
+    """Drop search indexes after offers were deleted (no-op before the service exists)"""
+    if search_service is not None:
+        search_service.invalidate(collection_name)
@@ -0,0 +1,221 @@
+"""
+Offer selection service module.
+Turns a selection (brand, offer type, discount, validity window, import
+batch, custom field values) into a MongoDB filter and resolves the offers a
+render job should print, either from the selection or an explicit id list.
+"""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+from bson.objectid import ObjectId
+
+from app.services.analysis import template_offer_fields
+
+
+# Largest number of offers one render may select; a render holds its whole
+# selection in memory (the template loops over every offer in one pass)
+MAX_SELECTED_OFFERS = int(os.getenv("AOPS_MAX_SELECTED_OFFERS", "10000"))
+
+SELECTION_KEYS = {
+    "brand",
+    "offer_type",
+    "min_discount",
+    "min_discount_pct",
+    "valid_on",
+    "expires_before",
+    "import_batch",
+    "custom_fields",
+}
+
+
+def _match_values(key: str, value: Any) -> Any:
+    """Exact match for a string, $in for a list of strings"""
+    if isinstance(value, list):
+        if not value or not all(isinstance(v, (str, int, float)) for v in value):
+            raise ValueError(f"{key} must be a value or a non-empty list of values")
+        return {"$in": value}
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f"{key} must be a value or a non-empty list of values")
+    return value
+
+
+def _parse_day(key: str, value: Any) -> datetime:
+    """Parse a YYYY-MM-DD date ('today' allowed) to midnight of that day"""
+    if value == "today":
+        return datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"{key} must be a date in YYYY-MM-DD format or 'today'")
+
+
+def _parse_number(key: str, value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number")
+
+
+def build_offer_filter(selection: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a MongoDB filter from a selection.
+
+    Args:
+        selection: Any of
+            brand, offer_type, import_batch: value or list of values
+            min_discount: minimum mrp - price
+            min_discount_pct: minimum discount as a percentage of mrp
+            valid_on: YYYY-MM-DD or 'today'; offers not expired on that day
+                      (offers without a parseable expiry date always match)
+            expires_before: YYYY-MM-DD; offers expiring before that day
+            custom_fields: { name: value or list of values }
+
+    Returns:
+        MongoDB filter query (all conditions must match)
+
+    Raises:
+        ValueError: If the selection has unknown keys or invalid values
+    """
+    if not isinstance(selection, dict) or not selection:
+        raise ValueError("Selection must be a non-empty object")
+    unknown = set(selection) - SELECTION_KEYS
+    if unknown:
+        raise ValueError(f"Unknown selection fields: {', '.join(sorted(unknown))}")
+
+    conditions: List[Dict[str, Any]] = []
+    for key in ("brand", "offer_type", "import_batch"):
+        if selection.get(key) is not None:
+            conditions.append({key: _match_values(key, selection[key])})
+
+    custom = selection.get("custom_fields")
+    if custom is not None:
+        if not isinstance(custom, dict) or not custom:
+            raise ValueError("custom_fields must be an object of field values")
+        for name, value in custom.items():
+            if not name or name.startswith("$") or "." in name:
+                raise ValueError(f"Invalid custom field name: {name}")
+            conditions.append({f"custom_fields.{name}": _match_values(name, value)})
+
+    # Typed fields computed at ingest, so these ranges can use the offer indexes
+    if selection.get("valid_on") is not None:
+        day = _parse_day("valid_on", selection["valid_on"])
+        conditions.append({"$or": [
+            {"valid_till_date": {"$gte": day}},
+            {"valid_till_date": None},
+        ]})
+    if selection.get("expires_before") is not None:
+        day = _parse_day("expires_before", selection["expires_before"])
+        conditions.append({"valid_till_date": {"$lt": day}})
+
+    if selection.get("min_discount") is not None:
+        amount = _parse_number("min_discount", selection["min_discount"])
+        conditions.append({"discount_amount": {"$gte": amount}})
+    if selection.get("min_discount_pct") is not None:
+        pct = _parse_number("min_discount_pct", selection["min_discount_pct"])
+        conditions.append({"discount_pct": {"$gte": pct}})
+
+    if not conditions:
+        raise ValueError("Selection has no conditions")
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+async def resolve_offers(
+    db,
+    offer_ids: Optional[List[str]] = None,
+    selection: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None,
+    limit: int = MAX_SELECTED_OFFERS
+) -> List[Dict[str, Any]]:
+    """
+    Load the offers a render should print.
+
+    Explicit offer_ids are fetched by id through the shared offer batcher;
+    a selection is resolved with one filtered query whose cursor is read in
+    batches and collected into one list, since templates render the whole
+    selection at once. The list is bounded by `limit`.
+
+    Args:
+        db: DatabaseService instance
+        offer_ids: Offer ObjectIds as strings
+        selection: Selection object (see build_offer_filter)
+        fields: Only load these fields (see offer_projection)
+        limit: Maximum offers a selection may match
+
+    Returns:
+        List of offer documents
+
+    Raises:
+        ValueError: If neither or both are given, the selection is invalid,
+                    or it matches more than `limit` offers
+    """
+    if offer_ids and selection:
+        raise ValueError("Send either offer_ids or selection, not both")
+    if offer_ids:
+        if not all(ObjectId.is_valid(oid) for oid in offer_ids):
+            raise ValueError("Invalid offer id")
+        return await db.load_offers_by_ids(offer_ids, fields=fields)
+    if not selection:
+        raise ValueError("No offers selected")
+
+    query = build_offer_filter(selection)
+    offers: List[Dict[str, Any]] = []
+    # Read one past the limit to tell "exactly limit" from "too many"
+    async for batch in db.iter_offers(query, fields=fields, limit=limit + 1):
+        offers.extend(batch)
+    if len(offers) > limit:
+        raise ValueError(f"Selection matches more than {limit} offers; narrow it down")
+    return offers
+
+
+async def load_template_offers(
+    db,
+    template: Dict[str, Any],
+    offer_ids: Optional[List[str]] = None,
+    selection: Optional[Dict[str, Any]] = None
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Load a template's HTML and the offers to render with it.
+
+    The offer query needs the fields the template reads. When those are
+    known from the template document (stored offer_fields or inline HTML),
+    reading an uploaded template's HTML file and the offer query run
+    concurrently; only older file templates read the HTML first.
+
+    Args:
+        db: DatabaseService instance
+        template: Template document
+        offer_ids: Offer ObjectIds as strings
+        selection: Selection object (see build_offer_filter)
+
+    Returns:
+        (template HTML or None if it has none, offer documents)
+
+    Raises:
+        ValueError: From resolve_offers
+    """
+    template_html = template.get("html_content")
+    file_path = template.get("file_path")
+
+    async def read_html() -> Optional[str]:
+        if template_html or not file_path:
+            return template_html
+        from app.services.storage import get_storage_service
+        try:
+            return await get_storage_service().read_template_file(f"{file_path}/index.html")
+        except Exception as e:
+            print(f"⚠ Could not read template file {file_path}: {e}")
+            return None
+
+    if "offer_fields" in template or template_html or not file_path:
+        html, offers = await asyncio.gather(
+            read_html(),
+            resolve_offers(db, offer_ids, selection, fields=template_offer_fields(template))
+        )
+        return html, offers
+
+    html = await read_html()
+    offers = await resolve_offers(db, offer_ids, selection, fields=template_offer_fields(template, html))
+    return html, offers
@@ -3,13 +3,18 @@ Storage service module.
 Handles file uploads, storage, and management.
 """
 
-import os
 import shutil
 import zipfile
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Tuple, BinaryIO
 from datetime import datetime
 
+from app.services.executor import get_executor_service
+
+
+# Chunk size used when copying uploads to disk
+COPY_CHUNK_SIZE = 1024 * 1024
+
 
 class StorageService:
     """Service for managing file storage and uploads"""
@@ -62,6 +67,32 @@ class StorageService:
             print(f"✗ Error saving CSV file: {e}")
             raise
 
+    async def save_csv_stream(self, fileobj: BinaryIO, filename: str) -> str:
+        """
+        Save an uploaded offer file (CSV, Parquet or Arrow) by copying from
+        a file object in chunks.
+        
+        Args:
+            fileobj: Binary file object positioned at the start of the upload
+            filename: Original filename
+            
+        Returns:
+            Saved file path
+        """
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_filename = f"{timestamp}_{filename}"
+            file_path = self.csv_dir / safe_filename
+            
+            await get_executor_service().run_in_thread(self._copy_to_file, fileobj, file_path)
+            
+            print(f"✓ Offer file saved: {file_path}")
+            return str(file_path)
+            
+        except Exception as e:
+            print(f"✗ Error saving offer file: {e}")
+            raise
+
     async def save_template_zip(self, file_content: bytes, template_name: str) -> Tuple[str, str]:
         """
         Save and extract template ZIP file.
@@ -79,20 +110,10 @@ class StorageService:
             template_dir = self.templates_dir / f"{template_name}_{timestamp}"
             template_dir.mkdir(parents=True, exist_ok=True)
             
-            # Save ZIP and extract
-            zip_path = template_dir / "template.zip"
-            with open(zip_path, "wb") as f:
-                f.write(file_content)
-            
-            # Extract ZIP
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(template_dir)
-            
-            # Find HTML file
-            html_file = None
-            for file in template_dir.glob("*.html"):
-                html_file = str(file)
-                break
+            # Save, extract and scan the ZIP in a worker thread
+            html_file = await get_executor_service().run_in_thread(
+                self._extract_template_zip, file_content, template_dir
+            )
             
             print(f"✓ Template extracted: {template_dir}")
             return str(template_dir), html_file
@@ -101,6 +122,26 @@ class StorageService:
             print(f"✗ Error saving template ZIP: {e}")
             raise
 
+    @staticmethod
+    def _copy_to_file(fileobj: BinaryIO, file_path: Path):
+        """Copy a file object to disk in chunks (blocking)"""
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, COPY_CHUNK_SIZE)
+
+    @staticmethod
+    def _extract_template_zip(file_content: bytes, template_dir: Path) -> Optional[str]:
+        """Write and extract a template ZIP, returning the first HTML file (blocking)"""
+        zip_path = template_dir / "template.zip"
+        with open(zip_path, "wb") as f:
+            f.write(file_content)
+        
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            zip_ref.extractall(template_dir)
+        
+        for file in template_dir.glob("*.html"):
+            return str(file)
+        return None
+
     async def read_template_file(self, file_path: str) -> str:
         """
         Read template file content.
@@ -172,8 +172,8 @@ PRESET_SHELF_TALKER_BRANDED_HTML = """
                 <div class="product-name">{{ offer.product_name }}</div>
                 <div class="product-details">{% if not (branding.logo_url or branding.logo_data) %}{{ offer.brand }} • {% endif %}{{ offer.offer_details }}</div>
                 <div class="price-row">
-                    <div class="price-main"><span class="rupee">₹</span>{{ (offer.mrp - offer.price)|int }}<sup style="font-size:9pt">OFF</sup></div>
-                    <div class="price-label">ON MRP ₹{{ offer.mrp|int }}</div>
+                    <div class="price-main"><span class="rupee">₹</span>{{ offer.savings_display if offer.savings_display is defined else (offer.mrp - offer.price) | int }}<sup style="font-size:9pt">OFF</sup></div>
+                    <div class="price-label">ON MRP ₹{{ offer.mrp_display if offer.mrp_display is defined else offer.mrp | int }}</div>
                 </div>
             </div>
             <div class="brand-section">
@@ -185,7 +185,7 @@ PRESET_SHELF_TALKER_BRANDED_HTML = """
                     <div class="brand-logo">{{ (offer.brand|upper) if offer.brand else 'LOYAL' }}</div>
                 {% endif %}
                 {% if offer.mrp and offer.price %}
-                <div class="discount-badge">{{ (((offer.mrp - offer.price) / offer.mrp) * 100)|int }}%</div>
+                <div class="discount-badge">{{ offer.discount_pct_display if offer.discount_pct_display is defined else (((offer.mrp - offer.price) / offer.mrp) * 100) | int }}%</div>
                 <div class="discount-label">savings</div>
                 {% endif %}
             </div>
@@ -201,6 +201,7 @@ PRESET_SHELF_TALKER_BRANDED = {
     "description": "Modern shelf talker with brand accent bar (4 per A4 page)",
     "html_content": PRESET_SHELF_TALKER_BRANDED_HTML,
     "is_preset": True,
+    "print_layout": "branded",
     "layout_options": {
         "pageSize": "A4",
         "perPage": 4,
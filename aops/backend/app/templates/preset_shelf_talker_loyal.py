@@ -46,7 +46,7 @@ PRESET_SHELF_TALKER_LOYAL_HTML = """
     <div class="shelf-wrapper">
         <div class="product-name">{{ offer.product_name | default('') }}</div>
         <div class="rupee-symbol">₹</div>
-        <div class="price-major">{{ offer.price | int }}</div>
+        <div class="price-major">{{ offer.price_display if offer.price_display is defined else offer.price | int }}</div>
         <div class="blue-band"></div>
         {% set logo_src = (branding.logo_data if branding.logo_data else (branding.logo_url if branding.logo_url else '')) %}
         {% if logo_src %}
@@ -57,7 +57,7 @@ PRESET_SHELF_TALKER_LOYAL_HTML = """
         {% endif %}
         {% if offer.mrp and offer.price %}
         <div class="percent">
-            <div class="value">{{ (((offer.mrp - offer.price) / offer.mrp) * 100) | int }}%</div>
+            <div class="value">{{ offer.discount_pct_display if offer.discount_pct_display is defined else (((offer.mrp - offer.price) / offer.mrp) * 100) | int }}%</div>
             <div class="label">Savings</div>
         </div>
         {% endif %}
@@ -72,6 +72,7 @@ PRESET_SHELF_TALKER_LOYAL = {
     "description": "Compact, branded shelf talker with large price and blue accent bar (4 per A4 page)",
     "html_content": PRESET_SHELF_TALKER_LOYAL_HTML,
     "is_preset": True,
+    "print_layout": "loyal",
     "layout_options": {
         "pageSize": "A4",
         "perPage": 4,
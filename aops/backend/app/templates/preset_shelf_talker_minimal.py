@@ -123,9 +123,9 @@ PRESET_SHELF_TALKER_MINIMAL_HTML = """
         <div class="shelf-talker">
             <div class="product-name">{{ offer.product_name | upper }}</div>
             <div class="product-details">{% if not (branding.logo_url or branding.logo_data) %}{{ offer.brand | upper }} • {% endif %}{{ offer.offer_details | upper }}</div>
-            <div class="savings-line">ON MRP ₹{{ offer.mrp | int }}</div>
+            <div class="savings-line">ON MRP ₹{{ offer.mrp_display if offer.mrp_display is defined else offer.mrp | int }}</div>
             <div class="save-amount">
-                SAVE <span class="rupee">₹</span> {{ (offer.mrp - offer.price) | int }}/-
+                SAVE <span class="rupee">₹</span> {{ offer.savings_display if offer.savings_display is defined else (offer.mrp - offer.price) | int }}/-
             </div>
         </div>
     {% endfor %}
@@ -139,6 +139,7 @@ PRESET_SHELF_TALKER_MINIMAL = {
     "description": "Clean shelf talker design (4 per A4 page)",
     "html_content": PRESET_SHELF_TALKER_MINIMAL_HTML,
     "is_preset": True,
+    "print_layout": "minimal",
     "layout_options": {
         "pageSize": "A4",
         "perPage": 4,
@@ -0,0 +1,249 @@
+"""
+Render worker entry point.
+Claims PDF render jobs from the MongoDB jobs collection and stores the
+results in GridFS, where the API serves them from, so rendering can scale
+separately from the API service.
+
+Run with: python -m app.worker   (or run_worker.py from the repo root)
+"""
+
+import os
+import socket
+import signal
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from app.services.db import init_db, get_db, JOB_LEASE_SECONDS
+from app.services.pdfgen import init_pdf_service, get_pdf_service
+from app.services.storage import init_storage_service
+from app.services.executor import init_executor_service
+from app.services.selection import load_template_offers
+
+
+POLL_INTERVAL = float(os.getenv("AOPS_WORKER_POLL_INTERVAL", "1.0"))
+CONCURRENCY = int(os.getenv("AOPS_WORKER_CONCURRENCY", "1"))
+
+
+class RenderWorker:
+    """Polls the jobs collection and renders claimed jobs"""
+
+    def __init__(self, concurrency: int = CONCURRENCY, poll_interval: float = POLL_INTERVAL):
+        """
+        Initialize render worker.
+
+        Args:
+            concurrency: Number of jobs processed in parallel by this process
+            poll_interval: Seconds to wait when the queue is empty
+        """
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        """Run claim loops until stop() is called"""
+        print(f"→ Render worker {self.worker_id} started (concurrency={self.concurrency})")
+        reaper = asyncio.create_task(self._reap())
+        try:
+            await asyncio.gather(*(self._loop() for _ in range(self.concurrency)))
+        finally:
+            reaper.cancel()
+        print(f"✓ Render worker {self.worker_id} stopped")
+
+    def stop(self):
+        """Ask the claim loops to exit after their current job"""
+        self.stopping.set()
+
+    async def _loop(self):
+        db = await get_db()
+        while not self.stopping.is_set():
+            try:
+                job = await db.claim_job(self.worker_id)
+            except Exception as e:
+                print(f"⚠ Job claim warning: {e}")
+                job = None
+            if not job:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+
+    async def _reap(self):
+        """Fail jobs whose worker died on their last attempt, once per lease interval"""
+        db = await get_db()
+        while not self.stopping.is_set():
+            try:
+                failed = await db.fail_expired_jobs()
+                if failed:
+                    print(f"⚠ Marked {failed} abandoned job(s) as failed")
+            except Exception as e:
+                print(f"⚠ Job reaper warning: {e}")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=JOB_LEASE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, job_id: Any):
+        """Renew the job lease until cancelled"""
+        db = await get_db()
+        interval = max(1.0, JOB_LEASE_SECONDS / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not await db.renew_job_lease(job_id, self.worker_id):
+                print(f"⚠ Lost lease on job {job_id}")
+                return
+
+    async def _run_job(self, job: Dict[str, Any]):
+        db = await get_db()
+        job_id = job["_id"]
+        print(f"→ Claimed job {job_id} (attempt {job.get('attempts')})")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            if job.get("kind") != "pdf":
+                raise ValueError(f"Unsupported job kind: {job.get('kind')}")
+            result, pdf_path = await render_pdf_job(job.get("payload") or {}, str(job_id))
+            if await self._finish_job(job_id, result, pdf_path):
+                print(f"✓ Job {job_id} done: {result.get('filename')}")
+        except Exception as e:
+            print(f"✗ Job {job_id} failed: {e}")
+            await db.fail_job(job_id, self.worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def _finish_job(self, job_id: Any, result: Dict[str, Any], pdf_path: str) -> bool:
+        """
+        Hand a rendered PDF over through GridFS and complete the job.
+
+        The lease is renewed before the upload, so a worker whose job was
+        reclaimed does not store a duplicate, and the upload is deleted again
+        if complete_job() finds the job owned by another worker.
+
+        Returns:
+            True if the job was completed by this worker
+        """
+        db = await get_db()
+        try:
+            if not await db.renew_job_lease(job_id, self.worker_id):
+                print(f"⚠ Lost lease on job {job_id}, discarding rendered PDF")
+                return False
+            file_id = await db.save_job_result_file(result["filename"], pdf_path)
+        finally:
+            try:
+                os.remove(pdf_path)
+            except OSError as e:
+                print(f"⚠ Could not remove local PDF {pdf_path}: {e}")
+
+        if not await db.complete_job(job_id, self.worker_id, result):
+            print(f"⚠ Lost lease on job {job_id}, discarding stored PDF")
+            await db.delete_job_result_file(file_id)
+            return False
+        return True
+
+
+async def render_pdf_job(payload: Dict[str, Any], job_id: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Render a PDF job payload to a local file.
+
+    Args:
+        payload: { offer_ids or selection, template_id, layout_options, branding, store_id }
+        job_id: Job ID used to build a unique output filename
+
+    Returns:
+        Tuple of (result dict with filename, pdf_url, file_size and
+        offer_count, local PDF path to hand over through GridFS)
+    """
+    db = (await get_db()).for_store(payload.get("store_id"))
+    template_id = payload.get("template_id")
+    template = await db.find_template(template_id)
+    if not template:
+        raise ValueError("Template not found")
+
+    layout_options = payload.get("layout_options") or template.get("layout_options", {
+        "pageSize": "A4",
+        "perPage": 24,
+        "orientation": "portrait"
+    })
+
+    template_html, offers = await load_template_offers(
+        db, template, payload.get("offer_ids"), payload.get("selection")
+    )
+    if not template_html:
+        raise ValueError("Template has no HTML content")
+    if not offers:
+        raise ValueError("No offers found")
+
+    pdf_service = get_pdf_service()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"offers_{timestamp}_{job_id}.pdf"
+    pdf_path = await pdf_service.generate_batch_pdf(
+        offers=offers,
+        template_html=template_html,
+        layout_options=layout_options,
+        branding=payload.get("branding"),
+        output_filename=output_filename
+    )
+
+    # Workers share no disk with the API: RenderWorker hands the PDF over through GridFS
+    file_size = os.path.getsize(pdf_path)
+
+    result = {
+        "filename": output_filename,
+        "pdf_url": pdf_service.get_pdf_download_url(output_filename),
+        "file_size": file_size,
+        "storage": "gridfs",
+        "offer_count": len(offers),
+        "timestamp": timestamp
+    }
+    return result, pdf_path
+
+
+async def main():
+    """Initialize services and run the render worker until SIGTERM/SIGINT"""
+    print("\n" + "="*50)
+    print("🚀 Starting AOPS Render Worker...")
+    print("="*50)
+
+    mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+    db = await init_db(mongo_uri)
+
+    # Scratch space for rendering; finished PDFs are moved to GridFS
+    if os.getenv("UPLOADS_PATH"):
+        uploads_base = os.getenv("UPLOADS_PATH")
+    else:
+        app_dir = os.path.dirname(os.path.abspath(__file__))  # .../aops/backend/app
+        backend_dir = os.path.dirname(app_dir)  # .../aops/backend
+        uploads_base = os.path.join(backend_dir, "uploads")
+    print(f"→ Uploads base directory: {uploads_base}")
+
+    pdf_service = init_pdf_service(output_dir=os.path.join(uploads_base, "pdfs"))
+    init_storage_service(base_dir=uploads_base)
+    executor = init_executor_service()
+    executor.start_lag_monitor()
+    try:
+        await pdf_service.start_browser_pool()
+    except Exception as e:
+        print(f"⚠ Browser pool warning: {e}")
+
+    worker = RenderWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            # Signal handlers are not available on Windows event loops
+            pass
+
+    try:
+        await worker.run()
+    finally:
+        await pdf_service.close_browser_pool()
+        await executor.shutdown()
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
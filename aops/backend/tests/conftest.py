@@ -0,0 +1,58 @@
+"""
+Shared fixtures: an in-memory MongoDB (mongomock_motor) behind a real
+DatabaseService, and a thread-only executor so tests need no process pool.
+"""
+
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services import db as db_module
+from app.services.db import DatabaseService
+from app.services.executor import init_executor_service
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    service = DatabaseService("mongodb://mock")
+    service.client = AsyncMongoMockClient()
+    service.db = service.client.aops_db
+    await service._create_indexes()
+    return service
+
+
+@pytest.fixture
+def api_db(db, monkeypatch):
+    """The db fixture installed as the global service API routes use"""
+    monkeypatch.setattr(db_module, "db_service", db)
+    return db
+
+
+@pytest.fixture(autouse=True)
+def executor():
+    service = init_executor_service(process_workers=0)
+    yield service
+    asyncio.run(service.shutdown())
+
+
+def make_offer(product_id: str, **fields) -> dict:
+    """A valid offer document with overridable fields"""
+    offer = {
+        "product_id": product_id,
+        "product_name": f"Product {product_id}",
+        "brand": "Acme",
+        "offer_type": "discount",
+        "offer_details": "Save more",
+        "price": 80.0,
+        "mrp": 100.0,
+        "valid_till": "2030-12-31",
+        "custom_fields": {},
+    }
+    offer.update(fields)
+    return offer
@@ -0,0 +1,39 @@
+import pytest
+
+from app.services.analysis import analyze_offer_fields, template_offer_fields
+
+
+@pytest.mark.parametrize("html, expected", [
+    ("{% for offer in offers %}{{ offer.product_name }} {{ offer['price'] }}{% endfor %}",
+     ["price", "product_id", "product_name"]),
+    # Rows of offers from batch(), with a loop filter
+    ("{% for row in offers|batch(4) %}{% for o in row if o.brand %}{{ o.mrp }}{% endfor %}{% endfor %}"
+     "{{ offers|length }}",
+     ["brand", "mrp", "product_id"]),
+    # The loop variable shadows nothing outside the loop
+    ("{% for offer in offers %}{{ offer.brand }}{% endfor %}{{ offer }}",
+     ["brand", "product_id"]),
+    ("<p>No offers used</p>", ["product_id"]),
+])
+def test_fields_read_by_template(html, expected):
+    assert analyze_offer_fields(html) == expected
+
+
+@pytest.mark.parametrize("html", [
+    None,
+    "{% for offer in offers %}{{ offer }}{% endfor %}",
+    "{% for offer in offers %}{{ offer[key] }}{% endfor %}",
+    "{% for offer in offers %}{{ show(offer) }}{% endfor %}",
+    "{% set first = offers[0] %}{{ first.brand }}",
+    "{% include 'card.html' %}",
+    "{% for offer in offers %}{{ offer.brand }",
+])
+def test_unknown_usage_needs_whole_offers(html):
+    assert analyze_offer_fields(html) is None
+
+
+def test_stored_offer_fields_win():
+    template = {"offer_fields": ["brand"], "html_content": "{% for o in offers %}{{ o.mrp }}{% endfor %}"}
+    assert template_offer_fields(template) == ["brand"]
+    del template["offer_fields"]
+    assert template_offer_fields(template) == ["mrp", "product_id"]
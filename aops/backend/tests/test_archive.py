@@ -0,0 +1,89 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.offers import get_changed_offers
+from app.services import search
+from app.services.db import OFFER_ARCHIVE_COLLECTION, OFFER_TOMBSTONES_COLLECTION
+from app.services.search import SearchService
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+LAPSED = datetime(2020, 1, 31)
+CURRENT = datetime(2030, 12, 31)
+
+
+@pytest.fixture
+async def catalog(api_db):
+    await api_db.upsert_offers_bulk([
+        make_offer("OLD-1", valid_till_date=LAPSED),
+        make_offer("OLD-2", valid_till_date=LAPSED),
+        make_offer("NEW", valid_till_date=CURRENT),
+        make_offer("UNDATED", valid_till="someday", valid_till_date=None),
+    ])
+    return api_db
+
+
+async def changes(db, since=None):
+    template_id = await db.save_template({"name": "Shelf", "html_content": "{{ offer.brand }}"})
+    response = await get_changed_offers(
+        template_id=template_id, since=since, branding=None, limit=500, store_id=None
+    )
+    return json.loads(response.body)
+
+
+async def test_lapsed_offers_move_to_the_archive(catalog):
+    result = await catalog.archive_expired_offers(cutoff=datetime(2025, 1, 1))
+    assert result["archived_count"] == 2
+
+    collection = await catalog.offers_collection()
+    assert sorted(await collection.distinct("product_id")) == ["NEW", "UNDATED"]
+    archived = await catalog.db[OFFER_ARCHIVE_COLLECTION].find({}).to_list(length=None)
+    assert sorted(doc["product_id"] for doc in archived) == ["OLD-1", "OLD-2"]
+    assert all(doc["archived_from"] == collection.name for doc in archived)
+
+    # Nothing left to move
+    assert (await catalog.archive_expired_offers(cutoff=datetime(2025, 1, 1)))["archived_count"] == 0
+
+
+async def test_archived_offers_are_reported_as_removed(catalog):
+    token = (await changes(catalog))["next_token"]
+    await catalog.archive_expired_offers(cutoff=datetime(2025, 1, 1))
+
+    page = await changes(catalog, token)
+    assert not page["full_resync"]
+    assert page["offers"] == []
+    assert sorted(entry["product_id"] for entry in page["removed"]) == ["OLD-1", "OLD-2"]
+
+    # An archived offer uploaded again is a change, not a removal
+    await catalog.upsert_offers_bulk([make_offer("OLD-1", valid_till_date=CURRENT)])
+    page = await changes(catalog, token)
+    assert [offer["product_id"] for offer in page["offers"]] == ["OLD-1"]
+    assert [entry["product_id"] for entry in page["removed"]] == ["OLD-2"]
+
+
+async def test_pruned_tombstones_force_full_resync(catalog):
+    token = (await changes(catalog))["next_token"]
+    await catalog.archive_expired_offers(cutoff=datetime(2025, 1, 1))
+    await catalog.db[OFFER_TOMBSTONES_COLLECTION].update_many(
+        {}, {"$set": {"removed_at": datetime.utcnow() - timedelta(days=40)}}
+    )
+    assert await catalog.prune_offer_tombstones(ttl_days=30) == 2
+
+    page = await changes(catalog, token)
+    assert page["full_resync"]
+    assert sorted(offer["product_id"] for offer in page["offers"]) == ["NEW", "UNDATED"]
+    assert page["removed"] == []
+
+
+async def test_search_drops_archived_offers_without_rebuild(catalog, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_REFRESH_SECONDS", 0)
+    service = SearchService()
+    assert (await service.search(catalog, "product"))["indexed"] == 4
+
+    await catalog.archive_expired_offers(cutoff=datetime(2025, 1, 1))
+    result = await service.search(catalog, "product")
+    assert sorted(offer["product_id"] for offer in result["offers"]) == ["NEW", "UNDATED"]
+    assert not service._rebuilds
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+
+from app.services.batching import OfferBatcher
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def offer_ids(db):
+    await db.save_offers_bulk([make_offer(f"P{i}") for i in range(6)])
+    collection = await db.offers_collection()
+    docs = await collection.find({}).sort("product_id", 1).to_list(length=None)
+    return [str(doc["_id"]) for doc in docs]
+
+
+async def test_concurrent_lookups_share_one_query(db, offer_ids):
+    batcher = OfferBatcher(window=0.01)
+    first, second, third = await asyncio.gather(
+        batcher.load(db, offer_ids[:3]),
+        batcher.load(db, [offer_ids[4], offer_ids[1]]),
+        batcher.load(db, [offer_ids[5], offer_ids[5], str(ObjectId())]),
+    )
+    assert batcher.stats == {"lookups": 3, "queries": 1}
+    assert [o["product_id"] for o in first] == ["P0", "P1", "P2"]
+    assert [o["product_id"] for o in second] == ["P4", "P1"]
+    # Repeated and unknown ids are skipped
+    assert [o["product_id"] for o in third] == ["P5"]
+
+
+async def test_full_batch_is_sent_without_waiting(db, offer_ids):
+    batcher = OfferBatcher(window=60, max_ids=2)
+    offers = await asyncio.wait_for(batcher.load(db, offer_ids[:2]), timeout=5)
+    assert len(offers) == 2
+    assert batcher.stats["queries"] == 1
+
+
+async def test_callers_get_their_own_copies(db, offer_ids):
+    batcher = OfferBatcher(window=0.01)
+    first, second = await asyncio.gather(
+        batcher.load(db, offer_ids[:1]), batcher.load(db, offer_ids[:1])
+    )
+    first[0]["brand"] = "Edited"
+    assert second[0]["brand"] == "Acme"
+
+
+async def test_fields_are_merged_across_callers(db, offer_ids):
+    batcher = OfferBatcher(window=0.01)
+    names, prices = await asyncio.gather(
+        batcher.load(db, offer_ids[:1], fields=["product_name"]),
+        batcher.load(db, offer_ids[1:2], fields=["price"]),
+    )
+    assert {"product_name", "price"} <= set(names[0])
+    assert "brand" not in names[0]
+    assert prices[0]["price"] == 80.0
+
+
+async def test_invalid_id_fails_only_its_caller(db, offer_ids):
+    batcher = OfferBatcher(window=0.01)
+    results = await asyncio.gather(
+        batcher.load(db, ["not-an-id"]), batcher.load(db, offer_ids[:1]), return_exceptions=True
+    )
+    assert isinstance(results[0], ValueError)
+    assert [o["product_id"] for o in results[1]] == ["P0"]
+
+
+async def test_query_error_reaches_every_caller(db, offer_ids):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("database down")
+
+    db.get_offers_by_ids = broken
+    batcher = OfferBatcher(window=0.01)
+    results = await asyncio.gather(
+        batcher.load(db, offer_ids[:1]), batcher.load(db, offer_ids[1:2]), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,149 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from app.services.db import DatabaseService, OFFER_FIELDS_BACKFILL_ID
+from app.services.ingest import (
+    ingest_csv_stream, ingest_csv_columnar, pricing_fields, to_float, PRICING_FIELDS
+)
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    "Product ID,Item Name,Brand,Offer Type,Offer Details,Rapsap Price,MRP,Valid Till,Size\n"
+    "001,Basmati Rice 5kg,Acme,discount,\"Save 20, today\",\"1,299.50\",1500,31/12/2030,5kg\n"
+    "002,Olive Oil,Oliva,bogo,Buy 1 Get 1,450,450,2030-06-30,\n"
+    ",Mystery Box,,combo,Combo,.5,1e3,,L\n"
+    ",,,combo,No name,junk,,2030-01-01T10:00:00,\n"
+)
+
+# Set per write rather than derived from the file
+VOLATILE_FIELDS = ("_id", "created_at", "updated_at", "sync_seq")
+
+
+async def stored_offers(db: DatabaseService):
+    docs = await db.db.offers.find({}).sort("product_id", 1).to_list(length=None)
+    return [{k: v for k, v in doc.items() if k not in VOLATILE_FIELDS} for doc in docs]
+
+
+async def test_row_and_columnar_engines_store_identical_offers(db):
+    other = DatabaseService("mongodb://mock")
+    other.client, other.db = db.client, db.client.other_db
+    await other._create_indexes()
+
+    stream = await ingest_csv_stream(io.BytesIO(CSV.encode()), db, batch_size=2)
+    columnar = await ingest_csv_columnar(io.BytesIO(CSV.encode()), other, batch_size=2)
+
+    assert stream.inserted_count == columnar.inserted_count == 4
+    row_docs = await stored_offers(db)
+    assert row_docs == await stored_offers(other)
+
+    rice = row_docs[0]
+    assert rice["product_id"] == "001"
+    assert rice["price"] == 1299.5
+    assert rice["custom_fields"] == {"Size": "5kg"}
+    assert [doc["product_id"] for doc in row_docs if doc["product_id"].startswith("auto-")] == ["auto-1"]
+
+
+async def test_upsert_counts_new_changed_and_unchanged_rows(db):
+    first = await db.upsert_offers_bulk([make_offer("A"), make_offer("B")])
+    assert (first["inserted_count"], first["updated_count"], first["unchanged_count"]) == (2, 0, 0)
+
+    second = await db.upsert_offers_bulk([
+        make_offer("A"),
+        make_offer("B", price=70.0),
+        make_offer("C"),
+        make_offer("C", brand="Other"),
+    ])
+    assert second["inserted_count"] == 1
+    assert second["updated_count"] == 1
+    assert second["unchanged_count"] == 1
+    assert second["duplicates"] == ["C"]
+    assert second["failed_count"] == 0
+
+    assert await db.db.offers.count_documents({}) == 3
+    assert (await db.db.offers.find_one({"product_id": "C"}))["brand"] == "Other"
+
+
+async def test_upload_batch_is_stamped_on_unchanged_rows(db):
+    await db.for_import_batch("batch-1").upsert_offers_bulk([make_offer("A"), make_offer("B")])
+    seq = (await db.db.offers.find_one({"product_id": "A"}))["sync_seq"]
+
+    result = await db.for_import_batch("batch-2").upsert_offers_bulk([make_offer("A"), make_offer("B", price=70.0)])
+    assert result["unchanged_count"] == 1
+
+    stamped = await db.db.offers.find({"import_batch": "batch-2"}).to_list(length=None)
+    assert sorted(offer["product_id"] for offer in stamped) == ["A", "B"]
+    # An unchanged row is not handed out by the changes feed again
+    assert (await db.db.offers.find_one({"product_id": "A"}))["sync_seq"] == seq
+
+
+async def test_insert_mode_reports_duplicate_product_ids(db):
+    await db.save_offers_bulk([make_offer("A")])
+    result = await db.save_offers_bulk([make_offer("A"), make_offer("B")])
+    assert result["inserted_count"] == 1
+    assert result["duplicates"] == ["A"]
+
+
+async def test_backfill_derives_fields_once_per_collection(db):
+    collection = await db.offers_collection()
+    await collection.insert_many([
+        make_offer("A", valid_till="31/12/2030", price=80.0, mrp=100.0),
+        make_offer("B", valid_till="", price=50.0, mrp=0.0),
+    ])
+    assert await db.backfill_offer_fields(batch_size=1) == 2
+
+    docs = {doc["product_id"]: doc async for doc in collection.find({})}
+    assert docs["A"]["valid_till_date"] == datetime(2030, 12, 31)
+    assert docs["A"]["discount_pct"] == 20.0
+    assert docs["A"]["price_display"] == "80"
+    assert docs["B"]["valid_till_date"] is None
+    assert docs["B"]["discount_pct_display"] == ""
+    assert "sync_seq" not in docs["A"]
+
+    marker = await db.db.meta.find_one({"_id": OFFER_FIELDS_BACKFILL_ID})
+    assert marker["collections"] == [collection.name]
+    assert marker["fields"] == ["valid_till_date", *PRICING_FIELDS]
+
+    # A finished collection is not scanned again on the next start
+    await collection.insert_one(make_offer("C"))
+    assert await db.backfill_offer_fields() == 0
+    # ...until the derived fields change
+    await db.db.meta.update_one({"_id": OFFER_FIELDS_BACKFILL_ID}, {"$set": {"fields": ["valid_till_date"]}})
+    assert await db.backfill_offer_fields() == 1
+
+
+def test_pricing_fields_match_template_rounding():
+    fields = pricing_fields(79.99, 100.0)
+    assert set(fields) == set(PRICING_FIELDS)
+    assert fields["discount_amount"] == 20.01
+    assert fields["discount_pct"] == 20.01
+    assert fields["price_display"] == "79"
+    assert fields["mrp_display"] == "100"
+    assert fields["savings_display"] == "20"
+    assert fields["discount_pct_display"] == "20"
+
+
+def test_pricing_fields_without_discount():
+    assert pricing_fields(120.0, 100.0)["discount_amount"] == 0.0
+    no_mrp = pricing_fields(50.0, 0.0)
+    assert no_mrp["discount_pct"] == 0.0
+    assert no_mrp["discount_pct_display"] == ""
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,299.50", 1299.5),
+    ("1_000", 1000.0),
+    (" -2.5 ", -2.5),
+    (".5", 0.5),
+    ("1e3", 1000.0),
+    ("", 0.0),
+    ("abc", 0.0),
+    ("inf", 0.0),
+    ("nan", 0.0),
+    (None, 0.0),
+])
+def test_to_float(text, expected):
+    assert to_float(text) == expected
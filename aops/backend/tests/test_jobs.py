@@ -0,0 +1,151 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.worker import RenderWorker
+
+pytestmark = pytest.mark.anyio
+
+
+async def expire_lease(db, job_id):
+    await db.db.jobs.update_one(
+        {"_id": job_id}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+
+async def test_claim_takes_oldest_queued_job_once(db):
+    first = await db.enqueue_job("pdf", {"n": 1})
+    await db.enqueue_job("pdf", {"n": 2})
+
+    job = await db.claim_job("worker-a")
+    assert str(job["_id"]) == first
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["lease_owner"] == "worker-a"
+
+    other = await db.claim_job("worker-b")
+    assert other["payload"] == {"n": 2}
+    assert await db.claim_job("worker-c") is None
+
+
+async def test_expired_lease_is_reclaimed_by_another_worker(db):
+    await db.enqueue_job("pdf", {})
+    job = await db.claim_job("worker-a")
+    assert await db.claim_job("worker-b") is None
+
+    await expire_lease(db, job["_id"])
+    reclaimed = await db.claim_job("worker-b")
+    assert reclaimed["_id"] == job["_id"]
+    assert reclaimed["attempts"] == 2
+
+    # The first worker lost the job: its heartbeat and result are refused
+    assert not await db.renew_job_lease(job["_id"], "worker-a")
+    assert not await db.complete_job(job["_id"], "worker-a", {"filename": "a.pdf"})
+    assert await db.complete_job(job["_id"], "worker-b", {"filename": "b.pdf"})
+    done = await db.db.jobs.find_one({"_id": job["_id"]})
+    assert done["status"] == "done"
+    assert done["result"] == {"filename": "b.pdf"}
+
+
+async def test_failed_job_is_requeued_until_attempts_run_out(db):
+    await db.enqueue_job("pdf", {}, max_attempts=2)
+
+    job = await db.claim_job("worker-a")
+    assert await db.fail_job(job["_id"], "worker-a", "boom")
+    assert (await db.db.jobs.find_one({"_id": job["_id"]}))["status"] == "queued"
+
+    job = await db.claim_job("worker-a")
+    assert await db.fail_job(job["_id"], "worker-a", "boom again")
+    failed = await db.db.jobs.find_one({"_id": job["_id"]})
+    assert failed["status"] == "failed"
+    assert failed["error"] == "boom again"
+    assert await db.claim_job("worker-a") is None
+
+
+async def test_expired_last_attempt_is_failed_by_reaper(db):
+    await db.enqueue_job("pdf", {}, max_attempts=1)
+    job = await db.claim_job("worker-a")
+    assert await db.fail_expired_jobs() == 0
+
+    await expire_lease(db, job["_id"])
+    assert await db.claim_job("worker-b") is None
+    assert await db.fail_expired_jobs() == 1
+    assert (await db.db.jobs.find_one({"_id": job["_id"]}))["status"] == "failed"
+
+
+async def test_finished_at_is_set_on_terminal_states_only(db):
+    await db.enqueue_job("pdf", {}, max_attempts=2)
+    job = await db.claim_job("worker-a")
+    await db.fail_job(job["_id"], "worker-a", "boom")
+    assert (await db.db.jobs.find_one({"_id": job["_id"]}))["finished_at"] is None
+
+    job = await db.claim_job("worker-a")
+    await db.fail_job(job["_id"], "worker-a", "boom")
+    assert (await db.db.jobs.find_one({"_id": job["_id"]}))["finished_at"] is not None
+
+    await db.enqueue_job("pdf", {})
+    job = await db.claim_job("worker-a")
+    await db.complete_job(job["_id"], "worker-a", {"filename": "a.pdf"})
+    assert (await db.db.jobs.find_one({"_id": job["_id"]}))["finished_at"] is not None
+
+
+@pytest.fixture
+def rendered_pdf(tmp_path):
+    path = tmp_path / "job.pdf"
+    path.write_bytes(b"%PDF-1.4 test")
+    return str(path)
+
+
+@pytest.fixture
+def result_files(api_db, monkeypatch):
+    """Job result files by name (mongomock has no GridFS)"""
+    files = {}
+
+    async def save(filename, file_path):
+        with open(file_path, "rb") as f:
+            files[filename] = f.read()
+        return filename
+
+    async def delete(file_id):
+        return files.pop(file_id, None) is not None
+
+    monkeypatch.setattr(api_db, "save_job_result_file", save)
+    monkeypatch.setattr(api_db, "delete_job_result_file", delete)
+    return files
+
+
+async def test_worker_stores_result_while_holding_the_lease(api_db, result_files, rendered_pdf):
+    worker = RenderWorker()
+    await api_db.enqueue_job("pdf", {})
+    job = await api_db.claim_job(worker.worker_id)
+
+    assert await worker._finish_job(job["_id"], {"filename": "a.pdf"}, rendered_pdf)
+    assert result_files == {"a.pdf": b"%PDF-1.4 test"}
+    assert not os.path.exists(rendered_pdf)
+    assert (await api_db.db.jobs.find_one({"_id": job["_id"]}))["status"] == "done"
+
+
+async def test_worker_that_lost_its_lease_stores_nothing(api_db, result_files, rendered_pdf):
+    worker = RenderWorker()
+    await api_db.enqueue_job("pdf", {})
+    job = await api_db.claim_job(worker.worker_id)
+    await expire_lease(api_db, job["_id"])
+    await api_db.claim_job("worker-b")
+
+    assert not await worker._finish_job(job["_id"], {"filename": "a.pdf"}, rendered_pdf)
+    assert result_files == {}
+    assert not os.path.exists(rendered_pdf)
+
+
+async def test_result_is_deleted_when_completion_is_refused(api_db, result_files, rendered_pdf, monkeypatch):
+    worker = RenderWorker()
+    await api_db.enqueue_job("pdf", {})
+    job = await api_db.claim_job(worker.worker_id)
+
+    async def lease_lost_meanwhile(*args):
+        return False
+
+    monkeypatch.setattr(api_db, "complete_job", lease_lost_meanwhile)
+    assert not await worker._finish_job(job["_id"], {"filename": "a.pdf"}, rendered_pdf)
+    assert result_files == {}
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+async def build_set(db, *product_ids, activate=True):
+    set_id = await db.create_offer_set(source="catalog.csv")
+    await db.for_offer_set(set_id).upsert_offers_bulk([make_offer(pid) for pid in product_ids])
+    await db.complete_offer_set(set_id, {"inserted_count": len(product_ids)}, activate=activate)
+    return set_id
+
+
+async def active_product_ids(db):
+    collection = await db.offers_collection()
+    return sorted(await collection.distinct("product_id"))
+
+
+async def test_activating_a_set_swaps_the_pointer(db):
+    await db.upsert_offers_bulk([make_offer("LEGACY")])
+
+    building = await db.create_offer_set()
+    await db.for_offer_set(building).upsert_offers_bulk([make_offer("A")])
+    # A set being built is invisible until it is activated
+    assert await active_product_ids(db) == ["LEGACY"]
+    with pytest.raises(ValueError):
+        await db.activate_offer_set(building)
+
+    await db.complete_offer_set(building, {"inserted_count": 1})
+    assert await db.get_active_offer_set_id() == building
+    assert await active_product_ids(db) == ["A"]
+    assert (await db.get_offer_set(building))["status"] == "active"
+    assert (await db.get_offer_set("offers"))["status"] == "retired"
+
+    # Rolling back is another pointer swap
+    await db.activate_offer_set("offers")
+    assert await active_product_ids(db) == ["LEGACY"]
+
+
+async def test_old_retired_sets_are_dropped(db):
+    first = await build_set(db, "A")
+    second = await build_set(db, "B")
+    await build_set(db, "C")
+
+    # OFFER_SETS_KEPT = 1: only the most recently retired set is kept for rollback
+    assert (await db.get_offer_set(first))["status"] == "dropped"
+    assert (await db.get_offer_set(second))["status"] == "retired"
+    assert first not in await db.db.list_collection_names()
+    with pytest.raises(ValueError):
+        await db.drop_offer_set(await db.get_active_offer_set_id())
+
+
+async def test_stale_builds_are_marked_failed(db):
+    set_id = await db.create_offer_set()
+    await db.db.offer_sets.update_one({"_id": set_id}, {"$set": {"heartbeat_at": datetime(2000, 1, 1)}})
+
+    assert await db.fail_stale_offer_sets() == [set_id]
+    assert (await db.get_offer_set(set_id))["status"] == "failed"
+    assert not await db.renew_offer_set_build(set_id)
+
+
+async def test_reset_offers_drops_and_reindexes_the_collection(db):
+    await db.upsert_offers_bulk([make_offer("A"), make_offer("B")])
+    epoch = await db.offers_removed_epoch()
+
+    result = await db.reset_offers()
+    assert result["deleted_count"] == 2
+    assert await active_product_ids(db) == []
+    assert await db.offers_removed_epoch() == epoch + 1
+
+    collection = await db.offers_collection()
+    assert any(key[0] == "product_id" for index in (await collection.index_information()).values()
+               for key in index["key"])
+    await db.upsert_offers_bulk([make_offer("A")])
+    assert await active_product_ids(db) == ["A"]
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.offers import get_offers
+from app.services.db import offer_projection
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+async def list_offers(cursor=None, limit=2, fields=None, skip=0):
+    response = await get_offers(skip=skip, limit=limit, cursor=cursor, fields=fields, store_id=None)
+    return json.loads(response.body)
+
+
+async def test_cursor_pages_walk_every_offer_once(api_db):
+    await api_db.upsert_offers_bulk([make_offer(pid) for pid in "ABCDE"])
+
+    seen, cursor = [], None
+    while True:
+        page = await list_offers(cursor)
+        assert page["total"] == 5
+        seen += [offer["product_id"] for offer in page["offers"]]
+        if not page["has_more"]:
+            assert page["next_cursor"] is None
+            break
+        cursor = page["next_cursor"]
+        assert cursor == page["offers"][-1]["id"]
+    assert sorted(seen) == list("ABCDE")
+    assert len(seen) == 5
+
+    # skip still works for older clients
+    assert [o["product_id"] for o in (await list_offers(skip=4))["offers"]] == seen[4:]
+    with pytest.raises(HTTPException):
+        await list_offers("not-an-id")
+
+
+async def test_cached_total_follows_writes(api_db):
+    await api_db.upsert_offers_bulk([make_offer("A")])
+    assert (await list_offers())["total"] == 1
+    await api_db.upsert_offers_bulk([make_offer("B")])
+    assert (await list_offers())["total"] == 2
+    await api_db.delete_all_offers()
+    assert (await list_offers())["total"] == 0
+
+
+async def test_fields_limit_the_returned_offer(api_db):
+    await api_db.upsert_offers_bulk([make_offer("A", custom_fields={"size": "5kg", "origin": "IN"})])
+
+    offer = (await list_offers(fields="product_name,custom_fields.size"))["offers"][0]
+    assert offer == {"id": offer["id"], "product_name": "Product A", "custom_fields": {"size": "5kg"}}
+    with pytest.raises(HTTPException):
+        await list_offers(fields="$where")
+
+
+def test_projection_drops_paths_under_selected_fields():
+    assert offer_projection(None) is None
+    assert offer_projection(["id"]) == {"_id": 1}
+    assert offer_projection(["custom_fields", "custom_fields.size", "price"]) == {"custom_fields": 1, "price": 1}
+    assert offer_projection(["custom_fields.size", "custom_fields.origin"]) == {
+        "custom_fields.origin": 1, "custom_fields.size": 1,
+    }
+    # A shared prefix is not a parent path
+    assert offer_projection(["custom", "custom_fields.size"]) == {"custom": 1, "custom_fields.size": 1}
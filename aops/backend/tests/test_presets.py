@@ -0,0 +1,32 @@
+import pytest
+
+from app.main import initialize_preset_templates
+
+pytestmark = pytest.mark.anyio
+
+
+async def preset_ids(db):
+    return {t["name"]: t["_id"] for t in await db.get_preset_templates()}
+
+
+async def test_preset_ids_survive_restarts(db):
+    await initialize_preset_templates(db)
+    first = await preset_ids(db)
+    assert len(first) == 3
+
+    # Queued jobs hold these ids; a restart refreshes the presets in place
+    await db.db.templates.update_many({"is_preset": True}, {"$set": {"html_content": "old"}})
+    await initialize_preset_templates(db)
+    assert await preset_ids(db) == first
+    assert all(t["html_content"] != "old" for t in await db.get_preset_templates())
+    for template_id in first.values():
+        assert await db.get_template_by_id(str(template_id))
+
+
+async def test_retired_presets_are_removed(db):
+    await db.save_template({"name": "Retired preset", "is_preset": True, "html_content": "x"})
+    custom = await db.save_template({"name": "Custom", "is_preset": False, "html_content": "x"})
+    await initialize_preset_templates(db)
+
+    assert "Retired preset" not in await preset_ids(db)
+    assert await db.get_template_by_id(custom)
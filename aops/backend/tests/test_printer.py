@@ -0,0 +1,71 @@
+import pytest
+
+from app.services import printer
+from app.services.printer import PrinterService, label_values, resolve_allowed_printer
+from tests.conftest import make_offer
+
+
+@pytest.fixture
+def service(tmp_path):
+    return PrinterService(output_dir=str(tmp_path))
+
+
+def test_label_values_match_preset_templates():
+    values = label_values(make_offer("A", product_name="Basmati Rice", price=79.9, mrp=100.0))
+    assert values["name_upper"] == "BASMATI RICE"
+    assert values["details_line"] == "ACME - SAVE MORE"
+    assert values["mrp_line"] == "ON MRP Rs 100"
+    assert values["price"] == "79"
+    assert values["save_line"] == "SAVE Rs 20/-"
+    assert values["percent"] == "20%"
+
+    # A logo replaces the brand name
+    assert label_values(make_offer("A"), {"logo_url": "/logos/acme.png"})["details_line"] == "SAVE MORE"
+
+
+def test_label_values_use_display_fields_stored_at_ingest():
+    offer = make_offer("A", price=80.0, mrp=100.0, price_display="79", mrp_display="99",
+                       savings_display="21", discount_pct_display="")
+    values = label_values(offer)
+    assert values["price"] == "79"
+    assert values["mrp_line"] == "ON MRP Rs 99"
+    assert values["save_line"] == "SAVE Rs 21/-"
+    assert values["percent"] == values["percent_savings"] == ""
+
+
+def test_zpl_job_has_one_block_per_label(service):
+    data = service.compile([make_offer("A"), make_offer("B_^~")], "zpl", dpi=203).decode()
+    assert data.count("^XA") == data.count("^XZ") == 2
+    assert f"^PW{printer._dots(95, 203)}" in data and f"^LL{printer._dots(40, 203)}" in data
+    # Field data control characters are hex escaped
+    assert "B_5F_5E_7E" in data
+
+
+def test_escpos_job_cuts_after_each_label(service):
+    data = service.compile([make_offer("A"), make_offer("B")], "escpos", dpi=300)
+    assert data.startswith(b"\x1b@")
+    assert data.count(b"\x1dV\x42\x00") == 2
+    assert b"ON MRP Rs 100" in data
+
+
+def test_compile_rejects_unknown_language_and_dpi(service):
+    with pytest.raises(ValueError):
+        service.compile([make_offer("A")], "pcl")
+    with pytest.raises(ValueError):
+        service.compile([make_offer("A")], "zpl", dpi=600)
+
+
+def test_printer_allowlist(monkeypatch):
+    allowed = printer._parse_printer_allowlist("front=10.0.0.5:9100, 10.0.0.6 ,back=10.0.0.7:6101")
+    assert allowed == {
+        "front": ("10.0.0.5", 9100),
+        "10.0.0.6:9100": ("10.0.0.6", 9100),
+        "back": ("10.0.0.7", 6101),
+    }
+    monkeypatch.setattr(printer, "ALLOWED_PRINTERS", allowed)
+
+    assert resolve_allowed_printer({"printer_id": "back"}) == ("10.0.0.7", 6101)
+    assert resolve_allowed_printer({"host": "10.0.0.6"}) == ("10.0.0.6", 9100)
+    for target in ({"printer_id": "side"}, {"host": "10.0.0.5", "port": 22}, {"host": "169.254.169.254"}, {}):
+        with pytest.raises(ValueError):
+            resolve_allowed_printer(target)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.services.raster import (
+    quantize_frames, pack_frames, frame_size, resolve_raster_options, _quantize_and_pack
+)
+
+
+def unpack_frames(data: bytes, count: int, width: int, height: int, palette: str) -> np.ndarray:
+    """Inverse of pack_frames: palette indices from packed bit planes"""
+    row_bytes = (width + 7) // 8
+    planes = 2 if palette == "bwr" else 1
+    buffer = np.frombuffer(data, dtype=np.uint8).reshape(count, planes * height, row_bytes)
+    bits = np.unpackbits(buffer, axis=-1)[:, :, :width]
+    indices = bits[:, :height].astype(np.uint8)
+    if palette == "bwr":
+        indices[bits[:, height:] == 1] = 2
+    return indices
+
+
+@pytest.mark.parametrize("palette", ["bw", "bwr"])
+@pytest.mark.parametrize("width, height", [(16, 4), (13, 5)])
+def test_pack_round_trip(palette, width, height):
+    rng = np.random.default_rng(7)
+    indices = rng.integers(0, 3 if palette == "bwr" else 2, size=(3, height, width), dtype=np.uint8)
+
+    data = pack_frames(indices, palette)
+    assert len(data) == 3 * frame_size(width, height, palette)
+    assert np.array_equal(unpack_frames(data, 3, width, height, palette), indices)
+
+
+def test_quantize_solid_colors():
+    frames = np.zeros((1, 2, 3, 3), dtype=np.uint8)
+    frames[0, 0] = [255, 255, 255]
+    frames[0, 1, 0] = [0, 0, 0]
+    frames[0, 1, 1] = [255, 0, 0]
+    frames[0, 1, 2] = [200, 30, 30]
+
+    assert quantize_frames(frames, "bwr", "threshold").tolist() == [[[0, 0, 0], [1, 2, 2]]]
+    # Without a red ink red pixels are dithered on luminance (dark enough for black)
+    assert quantize_frames(frames, "bw", "threshold").tolist() == [[[0, 0, 0], [1, 1, 1]]]
+
+
+def test_ordered_dither_mixes_mid_grey():
+    frames = np.full((1, 8, 8, 3), 128, dtype=np.uint8)
+    inked = quantize_frames(frames, "bw", "ordered").mean()
+    assert 0.4 < inked < 0.6
+
+
+def test_quantize_and_pack_matches_separate_steps():
+    rng = np.random.default_rng(3)
+    frames = rng.integers(0, 256, size=(2, 6, 10, 3), dtype=np.uint8)
+    expected = pack_frames(quantize_frames(frames, "bwr", "ordered"), "bwr")
+    assert _quantize_and_pack(frames, "bwr", "ordered") == expected
+
+
+def test_resolve_raster_options():
+    assert resolve_raster_options({"profile": "epd-2.13-bwr"})["palette"] == "bwr"
+    custom = resolve_raster_options({"width": "200", "height": 100, "dither": "threshold"})
+    assert (custom["width"], custom["height"], custom["palette"]) == (200, 100, "bw")
+    with pytest.raises(ValueError):
+        resolve_raster_options({"profile": "nope"})
+    with pytest.raises(ValueError):
+        resolve_raster_options({"palette": "rgb"})
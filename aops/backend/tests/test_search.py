@@ -0,0 +1,80 @@
+import pytest
+
+from app.services import search
+from app.services.search import SearchService, _OfferIndex
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+def build_index(*offers):
+    index = _OfferIndex()
+    index.add_many([dict(offer, _id=offer["product_id"].lower()) for offer in offers])
+    return index
+
+
+CATALOG = [
+    make_offer("RICE-5", product_name="Basmati Rice 5kg", brand="Acme"),
+    make_offer("RICE-1", product_name="Brown Rice", brand="Acme"),
+    make_offer("OIL-1", product_name="Olive Oil", brand="Oliva"),
+    make_offer("SOAP", product_name="Sandal Soap", brand="Mysore"),
+]
+
+
+def found(index, query):
+    return [offer["product_id"] for offer in index.search(query, 10)]
+
+
+def test_every_query_word_must_match():
+    index = build_index(*CATALOG)
+    assert sorted(found(index, "rice")) == ["RICE-1", "RICE-5"]
+    assert found(index, "acme basmati") == ["RICE-5"]
+    assert found(index, "rice oliva") == []
+
+
+def test_prefix_and_inside_matches():
+    index = build_index(*CATALOG)
+    assert found(index, "bas") == ["RICE-5"]
+    assert found(index, "liv") == ["OIL-1"]
+    # Two letters only match word starts
+    assert found(index, "li") == []
+
+
+def test_product_id_match_ranks_first():
+    index = build_index(*CATALOG)
+    assert found(index, "rice-1")[0] == "RICE-1"
+
+
+def test_typo_falls_back_to_similar_words():
+    index = build_index(*CATALOG)
+    assert found(index, "basmatti") == ["RICE-5"]
+
+
+def test_replacing_and_removing_offers_updates_vocabulary():
+    index = build_index(*CATALOG)
+    index.add(dict(make_offer("SOAP", product_name="Neem Soap", brand="Mysore"), _id="soap"))
+    assert found(index, "sandal") == []
+    assert found(index, "neem") == ["SOAP"]
+
+    index.remove("SOAP")
+    assert found(index, "soap") == []
+    assert "neem" not in index.offers_by_word
+    assert len(index) == 3
+
+
+async def test_service_picks_up_writes_and_deletes(db, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_REFRESH_SECONDS", 0)
+    service = SearchService()
+    await db.upsert_offers_bulk([dict(o) for o in CATALOG])
+    assert sorted(o["product_id"] for o in (await service.search(db, "rice"))["offers"]) == ["RICE-1", "RICE-5"]
+
+    await db.upsert_offers_bulk([make_offer("RICE-9", product_name="Jasmine Rice")])
+    assert (await service.search(db, "jasmine"))["offers"][0]["product_id"] == "RICE-9"
+
+    # A delete made by another process is seen through the removal epoch
+    collection = await db.offers_collection()
+    await collection.delete_one({"product_id": "RICE-1"})
+    await db.next_sequence(f"offers_removed:{collection.name}")
+    await service.search(db, "rice")
+    await service._rebuilds[(collection.name, None)]
+    assert "RICE-1" not in {o["product_id"] for o in (await service.search(db, "rice"))["offers"]}
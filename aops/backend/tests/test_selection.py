@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.ingest import derive_offer_fields
+from app.services.selection import build_offer_filter, resolve_offers
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def catalog(db):
+    offers = [
+        make_offer("A", brand="Acme", price=50.0, mrp=100.0, valid_till="2030-01-31",
+                   custom_fields={"size": "L"}),
+        make_offer("B", brand="Acme", price=95.0, mrp=100.0, valid_till="2029-12-31"),
+        make_offer("C", brand="Zeta", offer_type="bogo", price=30.0, mrp=40.0, valid_till=""),
+        make_offer("D", brand="Zeta", price=10.0, mrp=10.0, valid_till="2030-03-01",
+                   custom_fields={"size": "S"}),
+    ]
+    await db.save_offers_bulk([derive_offer_fields(offer) for offer in offers])
+    return db
+
+
+async def selected(db, selection):
+    return sorted(offer["product_id"] for offer in await resolve_offers(db, selection=selection))
+
+
+@pytest.mark.parametrize("selection, expected", [
+    ({"brand": "Acme"}, ["A", "B"]),
+    ({"brand": ["Acme", "Zeta"], "offer_type": "bogo"}, ["C"]),
+    ({"min_discount": 10}, ["A", "C"]),
+    ({"min_discount_pct": 50}, ["A"]),
+    ({"valid_on": "2030-01-15"}, ["A", "C", "D"]),
+    ({"expires_before": "2030-02-01"}, ["A", "B"]),
+    ({"custom_fields": {"size": ["L", "S"]}, "brand": "Zeta"}, ["D"]),
+])
+async def test_selection_filters(catalog, selection, expected):
+    assert await selected(catalog, selection) == expected
+
+
+async def test_selection_over_limit_is_rejected(catalog):
+    with pytest.raises(ValueError, match="more than 1 offers"):
+        await resolve_offers(catalog, selection={"brand": "Acme"}, limit=1)
+
+
+async def test_import_batch_selects_one_upload(db):
+    await db.for_import_batch("batch-1").save_offers_bulk([make_offer("A"), make_offer("B")])
+    await db.for_import_batch("batch-2").save_offers_bulk([make_offer("C")])
+    assert await selected(db, {"import_batch": "batch-1"}) == ["A", "B"]
+    assert await selected(db, {"import_batch": ["batch-1", "batch-2"]}) == ["A", "B", "C"]
+
+
+def test_valid_on_keeps_offers_without_expiry_date():
+    query = build_offer_filter({"valid_on": "2030-01-15"})
+    assert query == {"$or": [
+        {"valid_till_date": {"$gte": datetime(2030, 1, 15)}},
+        {"valid_till_date": None},
+    ]}
+
+
+@pytest.mark.parametrize("selection", [
+    {},
+    {"colour": "red"},
+    {"brand": []},
+    {"brand": {"$ne": "x"}},
+    {"min_discount": "lots"},
+    {"valid_on": "15/01/2030"},
+    {"custom_fields": {"a.b": "x"}},
+])
+def test_invalid_selections(selection):
+    with pytest.raises(ValueError):
+        build_offer_filter(selection)
@@ -0,0 +1,59 @@
+import pytest
+
+from app.services import db as db_module
+from app.services.db import ACTIVE_OFFER_SET_ID
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+async def product_prices(view):
+    return {offer["product_id"]: offer["price"] for offer in await view.get_offers(limit=100)}
+
+
+async def test_stores_price_the_same_sku_independently(db):
+    north, south = db.for_store("north"), db.for_store("south")
+    await db.upsert_offers_bulk([make_offer("A", price=80.0)])
+    await north.upsert_offers_bulk([make_offer("A", price=70.0), make_offer("B")])
+    await south.upsert_offers_bulk([make_offer("A", price=90.0)])
+
+    assert await product_prices(db) == {"A": 80.0}
+    assert await product_prices(north) == {"A": 70.0, "B": 80.0}
+    assert await product_prices(south) == {"A": 90.0}
+    assert await north.count_offers_cached() == 2
+
+    # Clearing one store leaves the others alone
+    await north.reset_offers()
+    assert await product_prices(north) == {}
+    assert await product_prices(south) == {"A": 90.0}
+    assert await product_prices(db) == {"A": 80.0}
+
+    with pytest.raises(ValueError):
+        db.for_store("no spaces")
+
+
+async def test_dedicated_store_collection(db, monkeypatch):
+    monkeypatch.setattr(db_module, "STORE_COLLECTIONS", {"big"})
+    big = db.for_store("big")
+    await big.upsert_offers_bulk([make_offer("A")])
+    await db.upsert_offers_bulk([make_offer("A"), make_offer("B")])
+
+    assert (await big.offers_collection()).name == "offers__store_big"
+    assert await product_prices(big) == {"A": 80.0}
+    assert await db.db.offers.count_documents({}) == 2
+
+
+async def test_views_share_the_active_set_pointer_cache(db):
+    north = db.for_store("north")
+    assert (await north.offers_collection()).name == "offers"
+
+    # Switching sets through the service is seen by views made earlier
+    set_id = await db.create_offer_set()
+    await db.complete_offer_set(set_id, {})
+    assert (await north.offers_collection()).name == set_id
+    assert (await north.for_import_batch("x").offers_collection()).name == set_id
+
+    # A pointer read by a view refreshes the cache of the service too
+    await db.db.meta.update_one({"_id": ACTIVE_OFFER_SET_ID}, {"$set": {"collection": "offers"}})
+    assert await north.get_active_offer_set_id() == "offers"
+    assert (await db.offers_collection()).name == "offers"
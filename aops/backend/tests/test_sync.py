@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from app.api.offers import get_changed_offers
+from app.services.hashing import encode_sync_token, decode_sync_token
+from tests.conftest import make_offer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def template_id(api_db):
+    return await api_db.save_template({"name": "Shelf", "html_content": "{{ offer.product_name }}"})
+
+
+async def changes(template_id, since=None, limit=500):
+    response = await get_changed_offers(
+        template_id=template_id, since=since, branding=None, limit=limit, store_id=None
+    )
+    return json.loads(response.body)
+
+
+def product_ids(page):
+    return sorted(offer["product_id"] for offer in page["offers"])
+
+
+def test_sync_token_round_trip():
+    token = encode_sync_token(42, "tmpl", "brand", "offers", 3)
+    assert decode_sync_token(token) == {
+        "seq": 42, "template_hash": "tmpl", "branding_hash": "brand", "collection": "offers", "epoch": 3,
+    }
+    with pytest.raises(ValueError):
+        decode_sync_token("not a token")
+
+
+async def test_changes_report_only_offers_written_since_token(api_db, template_id):
+    await api_db.save_offers_bulk([make_offer("A"), make_offer("B")])
+    first = await changes(template_id)
+    assert first["full_resync"]
+    assert product_ids(first) == ["A", "B"]
+    assert not first["has_more"]
+
+    quiet = await changes(template_id, first["next_token"])
+    assert not quiet["full_resync"]
+    assert quiet["offers"] == []
+
+    await api_db.save_offers_bulk([make_offer("C")])
+    update = await changes(template_id, quiet["next_token"])
+    assert not update["full_resync"]
+    assert product_ids(update) == ["C"]
+
+
+async def test_changes_are_paged_by_limit(api_db, template_id):
+    await api_db.save_offers_bulk([make_offer(pid) for pid in "ABC"])
+    first = await changes(template_id, limit=2)
+    assert first["has_more"]
+    rest = await changes(template_id, first["next_token"], limit=2)
+    assert not rest["has_more"]
+    assert product_ids(first) + product_ids(rest) == ["A", "B", "C"]
+
+
+async def test_changes_stop_below_a_write_in_flight(api_db, template_id):
+    await api_db.save_offers_bulk([make_offer("A")])
+    async with api_db._sync_write(1):
+        page = await changes(template_id)
+    assert product_ids(page) == ["A"]
+    # The reserved seq 2 is not committed yet, so the token stays at 1
+    assert decode_sync_token(page["next_token"])["seq"] == 1
+
+
+async def test_clearing_offers_forces_full_resync(api_db, template_id):
+    await api_db.save_offers_bulk([make_offer("A"), make_offer("B")])
+    token = (await changes(template_id))["next_token"]
+
+    await api_db.delete_all_offers()
+    await api_db.save_offers_bulk([make_offer("C")])
+    page = await changes(template_id, token)
+    assert page["full_resync"]
+    assert product_ids(page) == ["C"]
+
+
+async def test_activating_another_offer_set_forces_full_resync(api_db, template_id):
+    await api_db.save_offers_bulk([make_offer("A")])
+    token = (await changes(template_id))["next_token"]
+
+    set_id = await api_db.create_offer_set()
+    await api_db.for_offer_set(set_id).save_offers_bulk([make_offer("B")])
+    await api_db.complete_offer_set(set_id, {"inserted_count": 1})
+    page = await changes(template_id, token)
+    assert page["full_resync"]
+    assert product_ids(page) == ["B"]
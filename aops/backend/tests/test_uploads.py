@@ -0,0 +1,69 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import UploadFile
+
+from app.api.offers import upload_csv
+from app.services.storage import init_storage_service
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    "product_id,product_name,brand,offer_type,offer_details,price,mrp,valid_till\n"
+    "A,Basmati Rice,Acme,discount,Save 20,80,100,2030-12-31\n"
+    "B,Olive Oil,Oliva,bogo,Buy 1 Get 1,450,450,2030-06-30\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path):
+    return init_storage_service(base_dir=str(tmp_path))
+
+
+async def upload(data: str, mode: str = "upsert"):
+    file = UploadFile(file=io.BytesIO(data.encode()), filename="offers.csv")
+    response = await upload_csv(file=file, mode=mode, engine="stream", store_id=None)
+    return json.loads(response.body)
+
+
+async def test_identical_upload_is_replayed(api_db):
+    first = await upload(CSV)
+    assert first["inserted_count"] == 2
+    assert "replayed" not in first
+
+    collection = await api_db.offers_collection()
+    await collection.update_one({"product_id": "A"}, {"$set": {"price": 1.0}})
+    second = await upload(CSV)
+    assert second["replayed"]
+    assert second["file_hash"] == first["file_hash"]
+    assert second["import_batch"] == first["import_batch"]
+    # Not parsed or written again
+    assert (await collection.find_one({"product_id": "A"}))["price"] == 1.0
+
+    # The same file in another mode is a different upload
+    inserted = await upload(CSV, mode="insert")
+    assert "replayed" not in inserted
+    assert inserted["duplicates"] == ["A", "B"]
+
+
+async def test_clearing_offers_allows_the_file_again(api_db):
+    await upload(CSV)
+    await api_db.delete_all_offers()
+    again = await upload(CSV)
+    assert "replayed" not in again
+    assert again["inserted_count"] == 2
+
+
+async def test_stale_ingest_claim_is_taken_over(api_db):
+    key = await api_db.ingest_key("abc", "upsert")
+    assert await api_db.claim_ingest(key, {"filename": "a.csv"}, "owner-a") is None
+    assert (await api_db.claim_ingest(key, {"filename": "a.csv"}, "owner-b"))["owner"] == "owner-a"
+
+    await api_db.db.ingests.update_one(
+        {"_id": key}, {"$set": {"heartbeat_at": datetime.utcnow() - timedelta(minutes=10)}}
+    )
+    assert await api_db.claim_ingest(key, {"filename": "a.csv"}, "owner-b") is None
+    assert not await api_db.renew_ingest_claim(key, "owner-a")
+    assert await api_db.renew_ingest_claim(key, "owner-b")
@@ -46,6 +46,16 @@ export const fetchOffers = async (skip = 0, limit = 50) => {
   return api.get('/offers', { params: { skip, limit } });
 };
 
+/**
+ * Search offers by product ID, name or brand
+ * @param {string} query - Search words
+ * @param {number} limit - Maximum offers to return
+ * @returns {Promise} Response with ranked offers
+ */
+export const searchOffers = async (query, limit = 20) => {
+  return api.get('/offers/search', { params: { q: query, limit } });
+};
+
 /**
  * Fetch a single offer by ID
  * @param {string} offerId - MongoDB ObjectId
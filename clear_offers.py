@@ -2,11 +2,19 @@
 """
 Script to clear all offers from MongoDB database.
 Run this before re-uploading CSV to avoid duplicates.
+
+Uses the same drop-and-rebuild path as /offers/clear-all: the active offers
+collection is dropped and recreated with its indexes.
 """
 
 import asyncio
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import sys
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aops', 'backend'))
+
+from app.services.db import DatabaseService
 
 
 async def clear_offers():
@@ -14,26 +22,18 @@ async def clear_offers():
     mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
     
     try:
-        client = AsyncIOMotorClient(mongo_uri)
-        db = client.aops_db
-        
-        # Count offers before deletion
-        count_before = await db.offers.count_documents({})
-        print(f"📊 Offers before deletion: {count_before}")
-        
-        if count_before == 0:
-            print("✓ Database is already empty. Nothing to delete.")
-            return
+        db = DatabaseService(mongo_uri)
+        await db.connect()
         
-        # Delete all offers
-        result = await db.offers.delete_many({})
-        print(f"✓ Deleted {result.deleted_count} offers from database")
+        # Drop and recreate the offers collection
+        result = await db.reset_offers()
+        print(f"✓ Deleted {result['deleted_count']} offers in {result['elapsed_seconds']:.2f}s")
         
         # Verify deletion
-        count_after = await db.offers.count_documents({})
+        count_after = await db.count_offers()
         print(f"✓ Offers after deletion: {count_after}")
         
-        client.close()
+        await db.disconnect()
         print("✓ Database connection closed")
         
     except Exception as e:
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+"""
+Bulk import offers from a CSV or Parquet file straight into MongoDB.
+
+Bypasses the HTTP upload endpoint: the file is split across worker
+processes (CSV by byte ranges that end on record boundaries, Parquet by row
+groups) and each worker maps, validates and writes its part with the same
+header mapping, validation and batched writes as /offers/upload-csv.
+
+Usage:
+    python import_offers.py offers.csv
+    python import_offers.py offers.parquet --mode upsert --workers 8
+
+Rows that fail validation are skipped and reported by file line (CSV) or
+row number (Parquet). With several workers, product_ids generated for rows
+without an id or name are prefixed per part (auto-1, auto-p1-1, ...).
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Optional
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aops', 'backend'))
+
+from app.services.db import DatabaseService, new_import_batch_id, validate_store_id
+from app.services.ingest import (
+    BatchWriter, OfferRowMapper, ColumnarOfferMapper,
+    INGEST_BATCH_SIZE, INGEST_MODES, PARQUET_BATCH_ROWS
+)
+
+
+# Bytes read per chunk while scanning a CSV for split points
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+# Seconds between progress updates
+PROGRESS_INTERVAL = 0.5
+# Row errors printed in the final summary
+MAX_PRINTED_ERRORS = 10
+
+
+class RangeReader(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, path: str, start: int, end: int):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self.remaining = end - start
+        self.consumed = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.remaining <= 0:
+            return 0
+        n = self._file.readinto(memoryview(buffer)[:min(len(buffer), self.remaining)])
+        self.remaining -= n
+        self.consumed += n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_csv_header(path: str):
+    """Return (fieldnames, byte offset of the first data row)"""
+    with open(path, "rb") as f:
+        header_line = f.readline()
+        data_start = f.tell()
+    fieldnames = next(csv.reader([header_line.decode("utf-8-sig")]), [])
+    return fieldnames, data_start
+
+
+def split_csv(path: str, data_start: int, parts: int):
+    """
+    Split a CSV's data rows into byte ranges that end on record boundaries.
+
+    A newline is a record boundary when the quotes before it are balanced,
+    so quoted values containing newlines are never cut. Counting quotes and
+    newlines is done on raw bytes, which is fast enough to scan the file
+    once up front.
+
+    Returns:
+        List of (start, end, first_line) where first_line is the file line
+        number of the first row in the range (the header is line 1)
+    """
+    size = os.path.getsize(path)
+    targets = [data_start + (size - data_start) * k // parts for k in range(1, parts)]
+    boundaries = [(data_start, 2)]
+
+    with open(path, "rb") as f:
+        f.seek(data_start)
+        offset = data_start
+        quotes = 0
+        lines = 1  # Newlines before offset (the header's)
+        while targets:
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                break
+            while targets and targets[0] < offset + len(chunk):
+                pos = chunk.find(b"\n", max(0, targets[0] - offset))
+                while pos != -1 and (quotes + chunk.count(b'"', 0, pos)) % 2:
+                    pos = chunk.find(b"\n", pos + 1)
+                if pos == -1:
+                    # No boundary left in this chunk; continue in the next one
+                    targets[0] = offset + len(chunk)
+                    break
+                boundary = offset + pos + 1
+                if boundary > boundaries[-1][0]:
+                    boundaries.append((boundary, lines + chunk.count(b"\n", 0, pos + 1) + 1))
+                targets.pop(0)
+            quotes += chunk.count(b'"')
+            lines += chunk.count(b"\n")
+            offset += len(chunk)
+
+    ranges = []
+    for i, (start, first_line) in enumerate(boundaries):
+        end = boundaries[i + 1][0] if i + 1 < len(boundaries) else size
+        if end > start:
+            ranges.append((start, end, first_line))
+    return ranges
+
+
+def split_parquet(path: str, parts: int):
+    """
+    Split a Parquet file's row groups into contiguous parts of similar size.
+
+    Returns:
+        List of (row_group_indices, first_row) with rows numbered from 1
+    """
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(path).metadata
+    sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    per_part = max(1, sum(sizes) // max(1, parts))
+
+    groups = []
+    current, current_rows, first_row, next_row = [], 0, 1, 1
+    for index, rows in enumerate(sizes):
+        current.append(index)
+        current_rows += rows
+        next_row += rows
+        if current_rows >= per_part and len(groups) < parts - 1:
+            groups.append((current, first_row))
+            current, current_rows, first_row = [], 0, next_row
+    if current:
+        groups.append((current, first_row))
+    return groups
+
+
+def import_part(task: dict) -> dict:
+    """Import one part of the file (runs in a worker process)"""
+    if not task["verbose"]:
+        sys.stdout = open(os.devnull, "w")
+    return asyncio.run(_import_part(task))
+
+
+async def _import_part(task: dict) -> dict:
+    db = DatabaseService(task["uri"])
+    await db.connect(create_indexes=False)
+    view = db.for_store(task["store_id"]).for_import_batch(task["import_batch"])
+    writer = BatchWriter(view, task["mode"], task["batch_size"])
+    try:
+        if task["format"] == "csv":
+            await _feed_csv(task, writer)
+        else:
+            await _feed_parquet(task, writer)
+        result = await writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        await db.disconnect()
+
+    summary = result.to_dict()
+    summary.pop("preview", None)
+    return summary
+
+
+async def _feed_csv(task: dict, writer: BatchWriter):
+    progress = task["progress"]
+    raw = RangeReader(task["path"], task["start"], task["end"])
+    text = io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8", newline="")
+    try:
+        fieldnames = task["fieldnames"]
+        reader = csv.DictReader(text, fieldnames=fieldnames)
+        mapper = OfferRowMapper(fieldnames, auto_prefix=task["auto_prefix"])
+        offers, lines = [], []
+        record_start = 0
+        for row in reader:
+            line = task["first_line"] + record_start
+            record_start = reader.line_num
+            try:
+                offers.append(mapper.map_row(row))
+                lines.append(line)
+            except Exception as e:
+                writer.result.add_errors([{"row": line, "field": "", "message": str(e)}])
+            if len(offers) >= task["batch_size"]:
+                await writer.add(offers, lines)
+                offers, lines = [], []
+                progress.put((task["part"], raw.consumed, writer.result.total_rows))
+        await writer.add(offers, lines)
+        progress.put((task["part"], raw.consumed, writer.result.total_rows))
+    finally:
+        text.close()
+
+
+async def _feed_parquet(task: dict, writer: BatchWriter):
+    import pyarrow.parquet as pq
+
+    progress = task["progress"]
+    parquet_file = pq.ParquetFile(task["path"])
+    mapper = ColumnarOfferMapper(parquet_file.schema_arrow.names, auto_prefix=task["auto_prefix"])
+    next_row = task["first_row"]
+    done = 0
+    for record_batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=task["row_groups"]):
+        offers = mapper.map_batch(record_batch)
+        await writer.add(offers, list(range(next_row, next_row + len(offers))))
+        next_row += len(offers)
+        done += record_batch.num_rows
+        progress.put((task["part"], done, writer.result.total_rows))
+
+
+async def ensure_indexes(uri: str, store_id: Optional[str] = None):
+    """Create collection indexes (and the store's own collection, if it has one) before the workers start"""
+    db = DatabaseService(uri)
+    await db.connect()
+    await db.for_store(store_id).offers_collection()
+    await db.disconnect()
+
+
+def print_progress(done_units: int, total_units: int, rows: int, started: float, unit: str):
+    elapsed = max(time.time() - started, 1e-6)
+    pct = 100.0 * done_units / total_units if total_units else 100.0
+    sys.stdout.write(
+        f"\r→ {pct:5.1f}%  {rows:,} rows  {rows / elapsed:,.0f} rows/s  "
+        f"({done_units:,}/{total_units:,} {unit})   "
+    )
+    sys.stdout.flush()
+
+
+def run_import(args) -> int:
+    path = args.path
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+    asyncio.run(ensure_indexes(args.uri, args.store))
+
+    base_task = {
+        "path": path,
+        "format": fmt,
+        "mode": args.mode,
+        "batch_size": args.batch_size,
+        "uri": args.uri,
+        "verbose": args.verbose,
+        "import_batch": new_import_batch_id(),
+        "store_id": args.store,
+    }
+    tasks = []
+    if fmt == "csv":
+        fieldnames, data_start = read_csv_header(path)
+        if not any(name.strip() for name in fieldnames):
+            print("✗ Invalid CSV format: no header row")
+            return 1
+        for start, end, first_line in split_csv(path, data_start, args.workers):
+            tasks.append({**base_task, "start": start, "end": end, "first_line": first_line,
+                          "fieldnames": fieldnames})
+        total_units, unit = os.path.getsize(path) - data_start, "bytes"
+    else:
+        for row_groups, first_row in split_parquet(path, args.workers):
+            tasks.append({**base_task, "row_groups": row_groups, "first_row": first_row})
+        import pyarrow.parquet as pq
+        total_units, unit = pq.ParquetFile(path).metadata.num_rows, "rows"
+
+    if not tasks:
+        print("✗ No data rows found")
+        return 1
+
+    print(f"→ Importing {path} ({fmt}, {len(tasks)} parts, mode={args.mode})")
+    ctx = multiprocessing.get_context("spawn")
+    manager = ctx.Manager()
+    progress = manager.Queue()
+    for part, task in enumerate(tasks):
+        task.update(part=part, progress=progress, auto_prefix="auto-" if part == 0 else f"auto-p{part}-")
+
+    started = time.time()
+    done = {}
+    rows = {}
+    with ProcessPoolExecutor(max_workers=len(tasks), mp_context=ctx) as pool:
+        futures = [pool.submit(import_part, task) for task in tasks]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+            while not progress.empty():
+                part, units, part_rows = progress.get()
+                done[part], rows[part] = units, part_rows
+            print_progress(sum(done.values()), total_units, sum(rows.values()), started, unit)
+            if any(f.done() and f.exception() for f in futures):
+                break
+    print()
+    elapsed = time.time() - started
+    manager.shutdown()
+
+    failed = [f.exception() for f in futures if f.done() and f.exception()]
+    if failed:
+        print(f"✗ Import failed: {failed[0]}")
+        return 1
+
+    results = [f.result() for f in futures]
+    total = {key: sum(r[key] for r in results) for key in
+             ("inserted_count", "updated_count", "unchanged_count", "total_rows", "skipped_rows", "failed_count", "batches")}
+    duplicates = [d for r in results for d in r["duplicates"]]
+    errors = sorted((e for r in results for e in r["errors"]), key=lambda e: e["row"])
+    write_errors = [e for r in results for e in r["write_errors"]]
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+
+    print("=" * 50)
+    print(f"✓ Imported {total['total_rows']:,} rows in {elapsed:.1f}s "
+          f"({total['total_rows'] / max(elapsed, 1e-6):,.0f} rows/s, {size_mb / max(elapsed, 1e-6):.1f} MB/s)")
+    print(f"  batch id:   {base_task['import_batch']}")
+    print(f"  store:      {args.store or '(default)'}")
+    print(f"  inserted:   {total['inserted_count']:,}")
+    print(f"  updated:    {total['updated_count']:,}")
+    print(f"  unchanged:  {total['unchanged_count']:,}")
+    print(f"  duplicates: {len(duplicates):,}")
+    print(f"  skipped:    {total['skipped_rows']:,}")
+    print(f"  failed:     {total['failed_count']:,}")
+    print(f"  batches:    {total['batches']:,} across {len(tasks)} workers")
+    label = "line" if fmt == "csv" else "row"
+    for error in errors[:MAX_PRINTED_ERRORS]:
+        field = f" [{error['field']}]" if error["field"] else ""
+        print(f"  ⚠ {label} {error['row']}{field}: {error['message']}")
+    if len(errors) > MAX_PRINTED_ERRORS:
+        print(f"  ... and {total['skipped_rows'] - MAX_PRINTED_ERRORS:,} more invalid rows")
+    for error in write_errors[:MAX_PRINTED_ERRORS]:
+        print(f"  ✗ product {error['product_id']}: write failed ({error['code']}): {error['message']}")
+    if total["failed_count"] > MAX_PRINTED_ERRORS:
+        print(f"  ... and {total['failed_count'] - MAX_PRINTED_ERRORS:,} more failed writes")
+    print("=" * 50)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import offers from CSV or Parquet into MongoDB")
+    parser.add_argument("path", help="CSV or Parquet file")
+    parser.add_argument("--format", choices=("auto", "csv", "parquet"), default="auto",
+                        help="File format (default: by extension)")
+    parser.add_argument("--mode", choices=INGEST_MODES, default="insert",
+                        help="insert rejects existing product_ids; upsert updates changed offers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE,
+                        help=f"Offers per bulk write (default: {INGEST_BATCH_SIZE})")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"),
+                        help="MongoDB URI (default: $MONGODB_URI or localhost)")
+    parser.add_argument("--store", default=None,
+                        help="Store the offers belong to (default: the default store)")
+    parser.add_argument("--verbose", action="store_true", help="Show worker log output")
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    try:
+        args.store = validate_store_id(args.store)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("AOPS - Bulk Import Offers")
+    print("=" * 50)
+    print()
+
+    args = parse_args()
+    if not os.path.isfile(args.path):
+        print(f"✗ File not found: {args.path}")
+        sys.exit(1)
+    sys.exit(run_import(args))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Quick start script for the AOPS render worker
+Claims PDF render jobs from MongoDB and stores the results in GridFS
+"""
+
+import os
+import sys
+import asyncio
+
+# Change to backend directory
+os.chdir(os.path.join(os.path.dirname(__file__), 'aops', 'backend'))
+sys.path.insert(0, os.getcwd())
+
+from app.worker import main
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("AOPS Render Worker")
+    print("=" * 50)
+    print(f"Working directory: {os.getcwd()}")
+    print(f"MongoDB: {os.environ.get('MONGODB_URI', 'mongodb://localhost:27017')}")
+    print("=" * 50)
+    print()
+
+    # Ensure the uploads directory exists for rendering scratch files
+    try:
+        os.makedirs(os.path.join(os.getcwd(), 'uploads'), exist_ok=True)
+    except Exception:
+        pass
+
+    asyncio.run(main())